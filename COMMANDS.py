@@ -2,10 +2,12 @@ import telegram
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackContext
 from GLOSSARY import SK_START, logger, CallbackData
+from bot_commands.connection_wizard import discard_wizard
 from bot_functions.helpers.helpers import append_footer, send_reply
-from database.db_manager import execute_query, execute_non_query
-from database.db_setup import SQL_CHECK_USER_EXISTS
+from bot_functions.main.routing import refresh_route
+from database.db_manager import execute_non_query_async
 from database.db_user_queries import save_user, update_user, add_group_to_user
+from database.user_state_store import user_exists
 
 # --- [COMMANDS] --- #
 
@@ -27,19 +29,19 @@ async def start_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Chat ID: {chat_id},\n"
             f"User ID: {user_id}")
 
+    # Going back to the main menu abandons any connection the user was still building
+    discard_wizard(user_id)
+
     try:
         # STEP 1: Check if user_id already exists in the database
-        query = SQL_CHECK_USER_EXISTS
-        user_exists = execute_query(query, params=(user_id,), fetch=True)
-
-        if not user_exists:
+        if not await user_exists(user_id):
             # STEP 2: Save user to database if not already present
             logger.info(f"[START] Saving new user:\n"
                         f"chat_id={chat_id},\n"
                         f"user_id={user_id},\n"
                         f"current_step={current_step}")
 
-            save_user(chat_id, user_id, current_step)
+            await save_user(chat_id, user_id, current_step)
 
             logger.info(f"[START] User state saved for new user {user_id}.\n"
                         f"Current Step: {current_step}\n"
@@ -47,7 +49,7 @@ async def start_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             # Only Reset the user's current step
 
-            update_user(user_id, current_step)
+            await update_user(user_id, current_step)
 
             logger.info(f"[START] User {user_id} already exists in the database. Updating Current_step.")
 
@@ -99,7 +101,7 @@ async def init_group(update: Update, context: CallbackContext):
     if effective_chat.type in ["group", "supergroup"]:
         try:
             # Add the group to the user in the database
-            add_group_to_user(effective_user.id, effective_chat.id, effective_chat.title)
+            await add_group_to_user(effective_user.id, effective_chat.id, effective_chat.title)
 
             # Notify the user
             await context.bot.send_message(
@@ -149,7 +151,7 @@ async def init_topic(update: Update, context: CallbackContext):
         """
         placeholder_name = f"Unnamed Topic {message_thread_id}"  # Placeholder name for the topic
         params = (chat_id, message_thread_id, placeholder_name)
-        execute_non_query(query, params)
+        await execute_non_query_async(query, params)
 
         # Prompt the user to name the topic
         await update.message.reply_text(
@@ -189,7 +191,7 @@ async def set_topic_name(update: Update, context: CallbackContext):
             WHERE topic_id = ?;
         """
         params = (topic_name, topic_id)
-        execute_non_query(query, params)
+        await execute_non_query_async(query, params)
 
         # Notify the user of the successful update
         await update.message.reply_text(
@@ -203,6 +205,51 @@ async def set_topic_name(update: Update, context: CallbackContext):
             "⚠️ An error occurred while setting the topic name. Please try again later."
         )
 
+async def set_digest(update: Update, context: CallbackContext):
+    """
+    Handles the /set_digest command.
+    Batches a connection's forwards into one digest message per window; a window of 0 turns digests off.
+    """
+    try:
+        # Ensure the command has sufficient, numeric arguments
+        if len(context.args) != 2 or not all(arg.isdigit() for arg in context.args):
+            await update.message.reply_text(
+                "❌ Invalid command format. Please use:\n`/set_digest <connection_id> <seconds>`\n"
+                "Use 0 seconds to forward every message individually again.",
+                parse_mode=telegram.constants.ParseMode.MARKDOWN,
+            )
+            return
+
+        connection_id, window_seconds = (int(arg) for arg in context.args)
+
+        # Only the owner of the connection may change it
+        query = """
+            UPDATE user_connections
+            SET digest_window_seconds = ?
+            WHERE connection_id = ? AND user_id = ?;
+        """
+        params = (window_seconds, connection_id, update.effective_user.id)
+        if not await execute_non_query_async(query, params):
+            # Nothing written: no such connection, or it belongs to someone else (or the write failed)
+            await update.message.reply_text(
+                f"❌ Connection `{connection_id}` not found among your connections.",
+                parse_mode=telegram.constants.ParseMode.MARKDOWN,
+            )
+            return
+        await refresh_route(connection_id)
+
+        if window_seconds:
+            reply = f"✅ Connection `{connection_id}` will now send one digest every {window_seconds} seconds."
+        else:
+            reply = f"✅ Connection `{connection_id}` will now forward every message individually."
+        await update.message.reply_text(reply, parse_mode=telegram.constants.ParseMode.MARKDOWN)
+
+    except Exception as error:
+        logger.error(f"[Set Digest] Failed to set digest window: {error}", exc_info=True)
+        await update.message.reply_text(
+            "⚠️ An error occurred while updating the connection. Please try again later."
+        )
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the /help command."""
     await send_reply(
@@ -211,5 +258,6 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Use /start to Start the bot\n"
         "Use /init_group in a group to Initialise it for your account\n"
         "Use /init_topic in a topic-enabled group to Initialise it for your account\n"
+        "Use /set_digest <connection_id> <seconds> to batch a connection's forwards into one message\n"
         "If you need more help setting up, please contact support"
     )
@@ -2,8 +2,8 @@ from collections import defaultdict
 from asyncio import Lock
 import typing
 import logging
-import sys
 from telegram import Update
+from bot_functions.helpers.log_setup import configure_logging, ROOT_LOGGER_NAME
 
 #### ------- [ CUSTOM FOOTER ] ------- $$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$
 CUSTOM_FOOTER = (
@@ -13,22 +13,29 @@ CUSTOM_FOOTER = (
     "\nMevX Bot | (https://t.me/Mevx?start=kxngkxnquest)"
 )
 
+#### ------- [ REFERRAL LINKS ] ------- ####
+REFERRAL_LINK_TEMPLATE = "https://t.me/TradeonNovaBot?start=r-CE0V7EW-{address}"  # Link behind every forwarded CA
+
+#### ------- [ MESSAGE TEMPLATES ] ------- ####
+LINK_CACHE_SIZE = 16384  # Rendered CA links kept for reuse (least recently used are dropped)
+FORWARD_TEMPLATE_CACHE_SIZE = 4096  # Compiled per-connection forward templates kept
+
 #### ------- [ LOGGING CONFIGURATION ] ------- ####
-class UTF8Encoder(logging.StreamHandler):
-    def __init__(self, stream=None):
-        if stream is None:
-            # Ensure the default stream is stdout
-            stream = sys.stdout
-        # No need to manually re-wrap the stream with open()
-        super().__init__(stream)
-logging.basicConfig(
-    level=logging.INFO,
-    handlers=[
-        UTF8Encoder(),  # Use the UTF-8 compatible handler
-    ],
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
-logger = logging.getLogger(__name__)
+LOG_LEVEL = "INFO"
+LOG_LEVELS = {  # Per-subsystem overrides of LOG_LEVEL (DEBUG shows every query / send)
+    "database": "WARNING",
+    "forwarding": "INFO",
+    "send_scheduler": "INFO",
+}
+LOG_JSON = False  # One JSON object per line instead of plain text
+LOG_FILE = None  # e.g. "fwedbot.log" to also write a rotating log file
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024  # Rotate the log file at this size
+LOG_FILE_BACKUP_COUNT = 5  # Rotated log files to keep
+LOG_NO_ADDRESS_SAMPLE_EVERY = 100  # Report "no CA detected" once per this many messages
+
+configure_logging(LOG_LEVEL, LOG_LEVELS, json_output=LOG_JSON, log_file=LOG_FILE,
+                  max_bytes=LOG_FILE_MAX_BYTES, backup_count=LOG_FILE_BACKUP_COUNT)
+logger = logging.getLogger(ROOT_LOGGER_NAME)
 logger.info("Bot starting, logging is now active!")
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
@@ -39,6 +46,10 @@ if not BOT_TOKEN:
 
 #### ------- [ DATABASE SETUP ] ------- ####
 DB_FILE = "database/database.db"
+DB_CACHE_SIZE_KB = 20000  # sqlite page cache per connection
+DB_MMAP_SIZE_BYTES = 256 * 1024 * 1024  # Memory-map up to this much of the database file
+DB_BUSY_TIMEOUT_MS = 5000  # How long a connection waits on another process's write lock
+DB_STATEMENT_CACHE_SIZE = 256  # Prepared statements kept per connection
 Correct_Input_Format = ("Correct Input Format:\n\n"
                         "Group + Topic -> Group + Topic = <source_chat_id>, <source_topic_id>, <target_chat_id>, <target_topic_id>\n"
                         "OR\n"
@@ -51,6 +62,78 @@ Correct_Input_Format = ("Correct Input Format:\n\n"
                         )
 
 
+#### ------- [ ADDRESS DETECTION ] ------- ####
+ADDRESS_VALIDATION_CACHE_SIZE = 65536  # Distinct candidates whose base58 validation result is memoized
+
+#### ------- [ CROSS-PROCESS CHANGE FEED ] ------- ####
+CHANGE_FEED_POLL_INTERVAL_SECONDS = 0.25  # How often to check for writes by other processes (0 disables)
+CHANGE_FEED_FULL_RELOAD_THRESHOLD = 200  # Reload the routing table whole when more connections changed at once
+CHANGE_LOG_MAX_ROWS = 100000  # change_log rows kept (trimmed at startup)
+
+#### ------- [ BULK IMPORT ] ------- ####
+BULK_MAX_REPORTED_ERRORS = 20  # Invalid rows listed when an import is rejected
+
+#### ------- [ FORWARD DE-DUPLICATION ] ------- ####
+FORWARD_DEDUP_WINDOW_SECONDS = 60  # A CA is forwarded to the same target at most once per window (0 disables)
+
+#### ------- [ FORWARD FAN-OUT ] ------- ####
+FORWARD_MAX_CONCURRENT_SENDS = 8  # Send workers, i.e. sends in flight at once
+
+#### ------- [ OUTBOUND RATE LIMITS ] ------- ####
+SEND_GLOBAL_RATE_PER_SECOND = 30  # Telegram's bot-wide limit
+SEND_PER_CHAT_RATE_PER_MINUTE = 20  # Telegram's limit for messages into a single group
+SEND_PER_CHAT_BURST = 3  # Messages a quiet chat may receive back-to-back before the per-chat rate applies
+SEND_MAX_RETRIES = 3  # Retries for transient network errors (RetryAfter is always honored)
+
+#### ------- [ OUTBOX ] ------- ####
+# Forwards are recorded in the outbox table before they are sent and resent after a restart or failure
+OUTBOX_FLUSH_INTERVAL_SECONDS = 0.05  # Forwards queued within this long are written in one transaction
+OUTBOX_POLL_INTERVAL_SECONDS = 1.0  # How often rows due for a retry (or left by a crashed process) are picked up
+OUTBOX_CLAIM_BATCH = 100  # Rows picked up at once, and the most this process keeps in flight from polling
+OUTBOX_LEASE_SECONDS = 300  # A row being sent is picked up again if its process has not reported back by then
+OUTBOX_MAX_ATTEMPTS = 5  # Failed sends (each after the send scheduler's own retries) before a row is dead-lettered
+OUTBOX_RETRY_BACKOFF_SECONDS = 30  # Wait before retrying a failed row, doubling per attempt
+OUTBOX_SENT_RETENTION_SECONDS = 24 * 60 * 60  # Sent rows, and so their idempotency keys, are kept this long
+OUTBOX_DEAD_LETTER_RETENTION_SECONDS = 7 * 24 * 60 * 60  # Dead-lettered rows are kept this long for inspection
+
+#### ------- [ DIGEST MODE ] ------- ####
+# Connections with a digest window buffer their CAs per target and send one combined message per window
+DIGEST_MAX_ADDRESSES = 25  # A digest is sent early once it holds this many CAs
+TELEGRAM_MESSAGE_LIMIT = 4096  # Maximum length of a single Telegram message
+
+#### ------- [ UPDATE INGESTION ] ------- ####
+UPDATE_MODE = "polling"  # "polling", or "webhook" to have Telegram push updates (falls back to polling if unavailable)
+WEBHOOK_URL = None  # Public HTTPS URL Telegram posts to, e.g. "https://bot.example.com/telegram"
+WEBHOOK_LISTEN = "127.0.0.1"  # Address of the local listener ("0.0.0.0" when not behind a reverse proxy)
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "telegram"  # Path of the local listener, matching the end of WEBHOOK_URL
+WEBHOOK_SECRET_TOKEN = None  # Required in every request's X-Telegram-Bot-Api-Secret-Token (random per run if None)
+WEBHOOK_MAX_CONNECTIONS = 40  # Parallel connections Telegram may open to deliver updates (1-100)
+WEBHOOK_CERT_FILE = None  # Certificate and key to serve HTTPS directly, without a reverse proxy
+WEBHOOK_KEY_FILE = None
+
+#### ------- [ UPDATE RESUMPTION ] ------- ####
+# The last handled update and the messages handled are recorded, so a restart resumes where the last run stopped
+HANDLED_UPDATES_FLUSH_INTERVAL_SECONDS = 1.0  # How often the handled update offset and messages are written
+HANDLED_MESSAGE_RETENTION_SECONDS = 24 * 60 * 60  # How long handled messages are remembered and checked
+
+#### ------- [ UPDATE PROCESSING ] ------- ####
+UPDATE_CONCURRENCY = 32  # Updates from different chats handled in parallel (same-chat updates stay in order)
+UPDATE_MAX_IN_FLIGHT = 1024  # Updates accepted for processing (running or waiting on their chat) at once
+
+#### ------- [ WORKER PROCESSES ] ------- ####
+# With workers, this process only receives updates and hands each chat's updates to one worker process
+WORKER_PROCESSES = 0  # Worker processes running the handlers, sharded by chat (0 handles everything in this process)
+WORKER_SUPERVISE_INTERVAL_SECONDS = 1.0  # How often crashed workers are detected and respawned
+WORKER_STOP_TIMEOUT_SECONDS = 30  # How long shutdown waits for a worker to finish its queued updates
+
+#### ------- [ METRICS ] ------- ####
+METRICS_HOST = "127.0.0.1"  # Only reachable from this machine
+METRICS_PORT = 9464  # Prometheus-text endpoint at /metrics (None disables it)
+METRICS_FILE = None  # e.g. "metrics.prom" to also dump the metrics to a file periodically
+METRICS_DUMP_INTERVAL_SECONDS = 60
+
+
 #### ------- [ CALLBACK DATA ] ------- ####
 class CallbackData:
     ADD_CONNECTION = "add_connection"
@@ -66,6 +149,8 @@ class CallbackData:
 
 #### ------- [ USER STATES ] ------- ####
 DEFAULT_USER_STATE = { "current_step": "start"}
+USER_STATE_CACHE_SIZE = 10000  # Users whose user_states row is known in memory (least recently used are evicted)
+WIZARD_DRAFT_TTL_SECONDS = 15 * 60  # An unfinished add connection wizard is dropped after this long idle
 
 ### ------- [STEP KEY STAGES] ------- ###
 SK_START = "start"
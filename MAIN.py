@@ -1,59 +1,93 @@
 # --- Constants
+import asyncio
+import functools
+import importlib.util
+import secrets
+import typing
+
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler, filters)
-from GLOSSARY import logger
+from telegram.error import TelegramError
+from GLOSSARY import (logger, UPDATE_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+                      WEBHOOK_SECRET_TOKEN, WEBHOOK_MAX_CONNECTIONS, WEBHOOK_CERT_FILE, WEBHOOK_KEY_FILE,
+                      UPDATE_CONCURRENCY, WORKER_PROCESSES, METRICS_PORT, METRICS_FILE)
 from database.bot_token import BOT_TOKEN
-from bot_commands.add_connection import (handle_button, handle_title, handle_ids,
-                                         handle_target_group_selection, handle_target_topic_selection,
+from bot_commands.add_connection import (handle_button, handle_target_group_selection, handle_target_topic_selection,
                                          handle_source_group_selection,
                                          handle_source_topic_selection)
-from COMMANDS import start_main_menu, init_group, init_topic, set_topic_name, help_command
-from bot_functions.main.forwarding import handle_message
+from COMMANDS import start_main_menu, init_group, init_topic, set_topic_name, set_digest, help_command
+from bot_functions.main.dispatcher import dispatch_text_message
+from bot_functions.main.change_feed import prepare_change_feed, start_change_feed, stop_change_feed
+from bot_functions.main.digest import flush_all_digests
+from bot_functions.main.handled_updates import (ResumingUpdateProcessor, load_handled_updates, skip_handled_updates,
+                                                start_handled_updates, stop_handled_updates, update_finished)
+from bot_functions.main.metrics import start_metrics, stop_metrics
+from bot_functions.main.outbox import release_outbox_leases, set_outbox_write_only, start_outbox, stop_outbox
+from bot_functions.main.routing import load_routing_table
+from bot_functions.main.send_scheduler import send_scheduler
+from bot_functions.main.raw_updates import poll_raw_updates
+from bot_functions.main.sharding import (WorkerPool, LocalShardProcessor, WorkerShardProcessor, run_receiver,
+                                         run_shard_worker)
 # --- Command Handlers
 from bot_menu.main_menu import handle_menu_buttons
 from database.db_removal_tool import handle_remove_connection_command
+from database.db_manager import close_connections, run_in_db_thread
 from database.db_setup import init_db
-
-if __name__ == "__main__":
-    # --- Initialize the database
-    try:
-        init_db()
-        logger.info("[Database] Successfully initialized.")
-    except Exception as db_error:
-        logger.critical("[Database] Initialization failed. Exiting the bot.", exc_info=db_error)
-        exit(1)
-
-    # --- Build the bot application
-    try:
-        app = ApplicationBuilder().token(BOT_TOKEN).build()
-        logger.info("[Startup] Bot application initialized successfully.")
-    except ValueError as token_error:
-        logger.critical("[Startup] Invalid BOT_TOKEN! Please check the configuration.", exc_info=token_error)
-        exit(1)
-    except RuntimeError as runtime_error:
-        logger.critical("[Startup] Encountered a runtime error. Exiting.", exc_info=runtime_error)
-        exit(1)
-    except Exception as unknown_error:
-        logger.critical("[Startup] Unknown error during bot initialization.", exc_info=unknown_error)
-        raise
-
+from database.user_state_store import load_user_states
+
+worker_pool: typing.Optional[WorkerPool] = None  # Set in the receiving process when WORKER_PROCESSES > 0
+
+
+async def on_startup(application):
+    # Expose the pipeline metrics once the event loop is running
+    await start_metrics()
+    # Pick up connection and user state changes made by other processes
+    await start_change_feed()
+    # Send forwards left in the outbox by the previous run
+    await start_outbox(application.bot)
+    # Resume after the last update the previous run handled, without fetching the ones before it again
+    await skip_handled_updates(application.bot)
+    await start_handled_updates()
+    if worker_pool is not None:
+        await worker_pool.start_supervisor()
+
+
+async def on_worker_startup(index, application):
+    # Each worker serves its own metrics, next to the receiving process's
+    await start_metrics(METRICS_PORT and METRICS_PORT + 1 + index, METRICS_FILE and f"{METRICS_FILE}.worker{index}")
+    await start_change_feed()
+    await start_outbox(application.bot)
+
+
+async def on_shutdown(_application):
+    if worker_pool is not None:
+        # Workers finish the updates already handed to them first
+        await worker_pool.stop()
+    # Let pending digests and queued forwards go out before the bot exits
+    await flush_all_digests()
+    await stop_outbox()
+    # After the outbox, which records the last updates as handled once their forwards are written
+    await stop_handled_updates()
+    await send_scheduler.stop()
+    await stop_change_feed()
+    await stop_metrics()
+    # Close the pooled sqlite connections on the thread that uses them
+    await run_in_db_thread(close_connections)
+
+
+def register_handlers(app):
+    """Registers every handler; shared by polling and webhook mode so both behave the same."""
     # --- Register Command Handlers (e.g., /start, /help)
     app.add_handler(CommandHandler("start", start_main_menu))
     app.add_handler(CommandHandler("init_group", init_group))
     app.add_handler(CommandHandler("init_topic", init_topic))
     app.add_handler(CommandHandler("set_topic_name", set_topic_name))
+    app.add_handler(CommandHandler("set_digest", set_digest))
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("remove_connection", handle_remove_connection_command))
 
-    # Add MessageHandler for group messages
-    group_message_handler = MessageHandler(
-        filters.ChatType.GROUPS & filters.TEXT,  # Filters group text messages
-        handle_message)
-
-    # --- Register Message Handlers (State-Based Routing)
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_title))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_ids))
-    app.add_handler(group_message_handler)
+    # --- Register the Text Message Handler (groups -> forwarding, private chats -> wizard step)
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, dispatch_text_message))
 
     # --- Register CallbackQuery Handlers for Buttons
     app.add_handler(CallbackQueryHandler(handle_button, pattern="add_connection"))
@@ -72,35 +106,141 @@ if __name__ == "__main__":
     app.add_handler(CallbackQueryHandler(handle_menu_buttons, pattern="remove_connections"))
     app.add_handler(CallbackQueryHandler(handle_menu_buttons, pattern="back_to_main"))
 
-    # --- Run the bot
-    logger.info("[Bot] Bot is now running...")
-    app.run_polling()
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
 
+def webhook_unavailable_reason() -> typing.Optional[str]:
+    """Returns why webhook mode cannot be used, or None if it can."""
+    if not WEBHOOK_URL:
+        return "WEBHOOK_URL is not set"
+    if importlib.util.find_spec("tornado") is None:
+        return "python-telegram-bot[webhooks] is not installed"
+    return None
+
+
+def run_bot(app):
+    """Runs the bot in the UPDATE_MODE from the GLOSSARY, falling back to polling if the webhook cannot run."""
+    if UPDATE_MODE == "webhook":
+        unavailable_reason = webhook_unavailable_reason()
+        if unavailable_reason is None:
+            try:
+                logger.info("[Bot] Bot is now running (webhook on %s:%s/%s)...", WEBHOOK_LISTEN, WEBHOOK_PORT,
+                            WEBHOOK_PATH)
+                app.run_webhook(
+                    listen=WEBHOOK_LISTEN,
+                    port=WEBHOOK_PORT,
+                    url_path=WEBHOOK_PATH,
+                    webhook_url=WEBHOOK_URL,
+                    secret_token=WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32),
+                    max_connections=WEBHOOK_MAX_CONNECTIONS,
+                    cert=WEBHOOK_CERT_FILE,
+                    key=WEBHOOK_KEY_FILE,
+                    close_loop=False,  # Keep the loop usable for the polling fallback
+                )
+                return
+            except (RuntimeError, OSError, TelegramError) as webhook_error:
+                # OSError: the listener could not bind WEBHOOK_LISTEN:WEBHOOK_PORT (e.g. the port is in use)
+                unavailable_reason = str(webhook_error)
+        logger.warning("[Bot] Webhook mode unavailable (%s), falling back to polling.", unavailable_reason)
 
+    logger.info("[Bot] Bot is now running...")
+    app.run_polling()
 
 
+async def receive_raw_updates(bot, handle_payload):
+    """The receiving process's run_bot: fetches raw payloads in the UPDATE_MODE, falling back to polling."""
+    if UPDATE_MODE == "webhook":
+        unavailable_reason = webhook_unavailable_reason()
+        if unavailable_reason is None:
+            # Served with tornado, which only python-telegram-bot[webhooks] installs
+            from bot_functions.main.raw_webhook import serve_raw_webhook
+            try:
+                await serve_raw_webhook(bot, handle_payload)
+                return
+            except (OSError, TelegramError) as webhook_error:
+                unavailable_reason = str(webhook_error)
+        logger.warning("[Bot] Webhook mode unavailable (%s), falling back to polling.", unavailable_reason)
+    await poll_raw_updates(bot, handle_payload)
+
+
+def run_sharded_bot(app):
+    """Runs the receiving process: `app` only handles updates no worker can take."""
+    logger.info("[Bot] Bot is now running with %s worker process(es)...", WORKER_PROCESSES)
+    try:
+        asyncio.run(run_receiver(app, worker_pool, receive_raw_updates))
+    except KeyboardInterrupt:
+        pass
 
 
+def prepare_database():
+    """Initializes the database and loads the in-memory caches. Exits if that fails."""
+    try:
+        init_db()
+        logger.info("[Database] Successfully initialized.")
+        prepare_change_feed()
+        load_routing_table()
+        load_user_states()
+    except Exception as db_error:
+        logger.critical("[Database] Initialization failed. Exiting the bot.", exc_info=db_error)
+        exit(1)
 
 
+def build_application(update_processor, post_init, receives_updates: bool = True):
+    """Builds the bot application. Worker processes get their updates from the receiving process, not an Updater."""
+    try:
+        builder = (
+            ApplicationBuilder()
+            .token(BOT_TOKEN)
+            # Chats are handled in parallel; updates within one chat keep their order
+            .concurrent_updates(update_processor)
+            .post_init(post_init)
+            .post_shutdown(on_shutdown)
+        )
+        if not receives_updates:
+            builder.updater(None)
+        app = builder.build()
+        logger.info("[Startup] Bot application initialized successfully.")
+        return app
+    except ValueError as token_error:
+        logger.critical("[Startup] Invalid BOT_TOKEN! Please check the configuration.", exc_info=token_error)
+        exit(1)
+    except RuntimeError as runtime_error:
+        logger.critical("[Startup] Encountered a runtime error. Exiting.", exc_info=runtime_error)
+        exit(1)
+    except Exception as unknown_error:
+        logger.critical("[Startup] Unknown error during bot initialization.", exc_info=unknown_error)
+        raise
 
 
+def run_worker(index: int, worker_count: int, shard_queue, done_queue):
+    """Entry point of a worker process: runs every handler for the chats in its shard."""
+    prepare_database()
+    set_outbox_write_only()  # The receiving process sends every forward
+    app = build_application(WorkerShardProcessor(done_queue, UPDATE_CONCURRENCY),
+                            functools.partial(on_worker_startup, index), receives_updates=False)
+    register_handlers(app)
+    logger.info("[Worker %s] Handling shard %s of %s.", index, index + 1, worker_count)
+    run_shard_worker(app, shard_queue)
 
 
+if __name__ == "__main__":
+    # --- Initialize the database
+    prepare_database()
+    # Forwards the previous run was still sending are sent again (before any worker process starts)
+    release_outbox_leases()
+    # Where the previous run stopped handling updates
+    load_handled_updates()
+
+    # --- Start the worker processes, if any; this process then receives updates and hands them out
+    if WORKER_PROCESSES > 0:
+        worker_pool = WorkerPool(WORKER_PROCESSES, run_worker, on_update_finished=update_finished)
+        worker_pool.start()
+        app = build_application(LocalShardProcessor(worker_pool, UPDATE_CONCURRENCY), on_startup,
+                                receives_updates=False)
+        register_handlers(app)
+        run_sharded_bot(app)
+    else:
+        # --- Build the bot application
+        app = build_application(ResumingUpdateProcessor(UPDATE_CONCURRENCY), on_startup)
+        register_handlers(app)
+
+        # --- Run the bot
+        run_bot(app)
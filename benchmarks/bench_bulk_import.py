@@ -0,0 +1,85 @@
+"""
+Measures bulk connection import and export at 10k and 100k rows, against a throwaway database.
+
+The import side validates every row and writes groups, topics and connections with executemany
+in one transaction ("import s" includes that validation). For comparison, the 10k run also
+inserts the same connections one execute_non_query (one autocommit) at a time, the way the
+wizard used to write them.
+
+Run from the project root:
+    python -m benchmarks.bench_bulk_import
+"""
+import os
+import random
+import tempfile
+import time
+
+import database.db_manager as db_manager
+from database.db_bulk_tool import BULK_TABLES, import_tables, export_tables, validate_rows
+from database.db_manager import execute_non_query, execute_query, close_connections
+from database.db_migrations import run_migrations
+
+SIZES = (10_000, 100_000)
+PER_ROW_SIZE = 10_000  # The row-at-a-time comparison is only run at this size
+
+
+def build_import(connections: int, seed: int = 21) -> dict[str, list[dict]]:
+    """Groups, topics and connections shaped like a customer onboarding file (all CSV-style strings)."""
+    rng = random.Random(seed)
+    group_ids = [-1001000000000 - index for index in range(max(10, connections // 20))]
+    groups = [{"user_id": "1", "group_id": str(group_id), "group_name": f"Group {index}"}
+              for index, group_id in enumerate(group_ids)]
+    topics = [{"group_id": str(group_id), "topic_id": str(topic_id), "topic_name": f"{group_id}/{topic_id}"}
+              for group_id in group_ids for topic_id in (2, 3)]
+    rows = [{"user_id": "1", "connection_title": f"import_{index}",
+             "source_group_id": str(rng.choice(group_ids)), "source_topic_id": rng.choice(("", "2", "3")),
+             "target_group_id": str(rng.choice(group_ids)), "target_topic_id": "", "is_active": "1",
+             "digest_window_seconds": rng.choice(("0", "0", "60"))}
+            for index in range(connections)]
+    return {"user_groups": groups, "group_topics": topics, "user_connections": rows}
+
+
+def fresh_database():
+    close_connections()
+    db_manager.DB_FILE = os.path.join(tempfile.mkdtemp(prefix="fwedbot-bulk-"), "bench.db")
+    run_migrations()
+
+
+def per_row_insert(rows: list[dict]):
+    query = BULK_TABLES["user_connections"].upsert_query()
+    params, _ = validate_rows(BULK_TABLES["user_connections"], rows)
+    for values in params:
+        execute_non_query(query, values)
+
+
+def timed(function, *args) -> float:
+    started = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    print(f"{'rows':>9}{'validate s':>13}{'import s':>11}{'rows/s':>12}{'export s':>11}{'per-row s':>12}")
+    for size in SIZES:
+        tables = build_import(size)
+        total_rows = sum(len(rows) for rows in tables.values())
+
+        fresh_database()
+        validate = timed(import_tables, tables, True)
+        imported = timed(import_tables, tables)
+        stored = execute_query("SELECT COUNT(*) FROM user_connections;")[0][0]
+        assert stored == size, f"expected {size} connections, found {stored}"
+        exported = timed(export_tables)
+
+        per_row = "-"
+        if size == PER_ROW_SIZE:
+            fresh_database()
+            per_row = f"{timed(per_row_insert, tables['user_connections']):.2f}"
+
+        print(f"{total_rows:>9,}{validate:>13.2f}{imported:>11.2f}{total_rows / imported:>12,.0f}"
+              f"{exported:>11.2f}{per_row:>12}")
+    close_connections()
+
+
+if __name__ == "__main__":
+    main()
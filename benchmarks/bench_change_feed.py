@@ -0,0 +1,81 @@
+"""
+Measures the cross-process change feed against a throwaway database: the cost of an idle poll
+(nothing changed) and how long a connection written by another process takes to show up in
+this process's routing table, with the feed polling every CHANGE_FEED_POLL_INTERVAL_SECONDS.
+
+Run from the project root:
+    python -m benchmarks.bench_change_feed
+"""
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import database.db_manager as db_manager
+from bot_functions.main import change_feed
+from bot_functions.main.routing import load_routing_table, get_routes_for_source
+from database.db_manager import close_connections
+from database.db_migrations import run_migrations
+from GLOSSARY import CHANGE_FEED_POLL_INTERVAL_SECONDS
+
+IDLE_POLLS = 2000
+WRITES = 20
+
+# Runs in a separate process, like an admin tool writing the shared database
+WRITER = """
+import sqlite3, sys, time
+conn = sqlite3.connect(sys.argv[1], isolation_level=None)
+conn.execute("PRAGMA busy_timeout = 5000;")
+for index in range(int(sys.argv[2])):
+    time.sleep(0.3)
+    conn.execute("INSERT INTO user_connections (user_id, connection_title, source_group_id, target_group_id) "
+                 "VALUES (1, 'remote', ?, -2);", (-1000 - index,))
+    print(time.time(), flush=True)
+"""
+
+
+async def measure_idle_polls() -> float:
+    await change_feed.poll_changes()  # The first poll always reads change_log
+    started = time.perf_counter()
+    for _ in range(IDLE_POLLS):
+        await change_feed.poll_changes()
+    return (time.perf_counter() - started) / IDLE_POLLS
+
+
+async def measure_propagation() -> list[float]:
+    await change_feed.start_change_feed()
+    writer = subprocess.Popen([sys.executable, "-c", WRITER, db_manager.DB_FILE, str(WRITES)],
+                              stdout=subprocess.PIPE, text=True)
+    loop = asyncio.get_running_loop()
+    delays = []
+    for index in range(WRITES):
+        written_at = float(await loop.run_in_executor(None, writer.stdout.readline))
+        while not get_routes_for_source(-1000 - index):
+            await asyncio.sleep(0.001)
+        delays.append(time.time() - written_at)
+    writer.wait()
+    await change_feed.stop_change_feed()
+    return delays
+
+
+def main():
+    db_manager.DB_FILE = os.path.join(tempfile.mkdtemp(prefix="fwedbot-feed-"), "bench.db")
+    run_migrations()
+    change_feed.prepare_change_feed()
+    load_routing_table()
+
+    idle = asyncio.run(measure_idle_polls())
+    print(f"Idle poll (no changes): {idle * 1e6:.1f} us, i.e. {idle / CHANGE_FEED_POLL_INTERVAL_SECONDS:.4%} "
+          f"of one core at a {CHANGE_FEED_POLL_INTERVAL_SECONDS * 1000:.0f} ms poll interval")
+
+    delays = sorted(asyncio.run(measure_propagation()))
+    print(f"Propagation of {WRITES} writes from another process: p50 {statistics.median(delays) * 1000:.0f} ms, "
+          f"max {delays[-1] * 1000:.0f} ms")
+    close_connections()
+
+
+if __name__ == "__main__":
+    main()
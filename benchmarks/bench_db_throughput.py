@@ -0,0 +1,101 @@
+"""
+Measures queries per second through db_manager, comparing the previous connect-per-statement
+helpers (rollback journal, default pragmas) with the pooled WAL connections.
+
+Run from the project root:
+    python -m benchmarks.bench_db_throughput
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+import database.db_manager as db_manager
+from database.db_manager import execute_query, execute_non_query, execute_transaction, close_connections
+from GLOSSARY import logger
+
+ROWS = 5000
+READS = 5000
+WRITES = 1000
+READ_QUERY = "SELECT current_step FROM user_states WHERE user_id = ?;"
+WRITE_QUERY = "UPDATE user_states SET current_step = ? WHERE user_id = ?;"
+
+
+#### ------- [ PREVIOUS IMPLEMENTATION ] ------- ####
+
+def legacy_execute_non_query(query: str = '', params=()):
+    conn = sqlite3.connect(db_manager.DB_FILE)
+    cursor = conn.cursor()
+    try:
+        logger.info(f"[DATABASE] Executing non-query: {query} | Params: {params}")
+        cursor.execute(query, params)
+        conn.commit()
+        logger.info(f"[DATABASE] Data inserted / updated successfully.: {params}")
+    finally:
+        conn.close()
+
+
+def legacy_execute_query(query: str, params=(), fetch: bool = True):
+    conn = sqlite3.connect(db_manager.DB_FILE)
+    cursor = conn.cursor()
+    try:
+        logger.info(f"[DATABASE] Executing query:\n{query}\nParams: {params}")
+        cursor.execute(query, params)
+        logger.info(f"[DATABASE] Query Executed Successfully")
+        if fetch:
+            return cursor.fetchall()
+    finally:
+        conn.close()
+    return []
+
+
+#### ------- [ BENCHMARK ] ------- ####
+
+def build_database(path: str):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE user_states (chat_id INTEGER NOT NULL, user_id INTEGER NOT NULL, current_step TEXT);")
+    conn.execute("CREATE INDEX idx_user_states_user ON user_states (user_id);")
+    conn.executemany("INSERT INTO user_states VALUES (?, ?, 'start');", ((index, index) for index in range(ROWS)))
+    conn.commit()
+    conn.close()
+
+
+def rate(count: int, function) -> float:
+    started = time.perf_counter()
+    function()
+    return count / (time.perf_counter() - started)
+
+
+def run():
+    with tempfile.TemporaryDirectory() as directory:
+        db_manager.DB_FILE = os.path.join(directory, "legacy.db")
+        build_database(db_manager.DB_FILE)
+        legacy = {
+            "reads": rate(READS, lambda: [legacy_execute_query(READ_QUERY, (i % ROWS,)) for i in range(READS)]),
+            "writes": rate(WRITES, lambda: [legacy_execute_non_query(WRITE_QUERY, ("step", i % ROWS))
+                                            for i in range(WRITES)]),
+        }
+
+        db_manager.DB_FILE = os.path.join(directory, "pooled.db")
+        build_database(db_manager.DB_FILE)
+        pooled = {
+            "reads": rate(READS, lambda: [execute_query(READ_QUERY, (i % ROWS,)) for i in range(READS)]),
+            "writes": rate(WRITES, lambda: [execute_non_query(WRITE_QUERY, ("step", i % ROWS))
+                                            for i in range(WRITES)]),
+        }
+        # Wizard-style: two statements per step, committed once
+        pooled["2-stmt transactions"] = rate(WRITES, lambda: [execute_transaction([
+            (WRITE_QUERY, ("step", i % ROWS)), (WRITE_QUERY, ("next", (i + 1) % ROWS))]) for i in range(WRITES)])
+        close_connections()
+
+    print(f"{'operation':<22}{'per-call connect/s':>20}{'pooled WAL/s':>16}{'speedup':>10}")
+    for operation in ("reads", "writes"):
+        print(f"{operation:<22}{legacy[operation]:>20,.0f}{pooled[operation]:>16,.0f}"
+              f"{pooled[operation] / legacy[operation]:>9.1f}x")
+    print(f"{'2-stmt transactions':<22}{'':>20}{pooled['2-stmt transactions']:>16,.0f}")
+
+
+if __name__ == "__main__":
+    logger.setLevel(logging.WARNING)  # Query logging would dominate the timings
+    run()
@@ -0,0 +1,88 @@
+"""
+Measures event-loop lag while many handlers query sqlite concurrently, calling the blocking
+execute_query straight from the coroutine versus awaiting execute_query_async.
+
+Lag is how late a 5 ms heartbeat wakes up; it is the delay every other update (polling,
+forwards, wizard clicks) would see while the queries run.
+
+Run from the project root:
+    python -m benchmarks.bench_event_loop_lag
+"""
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import database.db_manager as db_manager
+from database.db_manager import execute_query, execute_query_async
+
+HANDLERS = 200
+ROWS = 50000
+HEARTBEAT = 0.005
+QUERY = "SELECT target_group_id, target_topic_id FROM user_connections WHERE source_group_id = ?;"
+
+
+def build_database(path: str):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE user_connections (connection_id INTEGER PRIMARY KEY, source_group_id INTEGER, "
+                 "target_group_id INTEGER, target_topic_id INTEGER);")
+    conn.executemany("INSERT INTO user_connections (source_group_id, target_group_id, target_topic_id) "
+                     "VALUES (?, ?, NULL);", ((index % 5000, index) for index in range(ROWS)))
+    conn.commit()
+    conn.close()
+
+
+async def heartbeat(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT)
+        lags.append(time.perf_counter() - started - HEARTBEAT)
+
+
+async def measure(use_async: bool) -> tuple[list, float]:
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.sleep(HEARTBEAT * 2)
+
+    async def handler(index: int):
+        if use_async:
+            await execute_query_async(QUERY, (index,))
+        else:
+            execute_query(QUERY, (index,))
+        await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(index) for index in range(HANDLERS)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await monitor
+    return lags, elapsed
+
+
+def report(name: str, lags: list, elapsed: float):
+    lags_ms = sorted(lag * 1000 for lag in lags)
+    p99 = lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))]
+    print(f"{name:<24}{len(lags_ms):>10}{statistics.mean(lags_ms):>12.2f}{p99:>12.2f}{lags_ms[-1]:>12.2f}"
+          f"{elapsed:>12.2f}")
+
+
+async def run():
+    with tempfile.TemporaryDirectory() as directory:
+        db_manager.DB_FILE = os.path.join(directory, "bench.db")
+        build_database(db_manager.DB_FILE)
+
+        print(f"{HANDLERS} concurrent handlers, each scanning {ROWS:,} rows\n")
+        print(f"{'mode':<24}{'heartbeats':>10}{'mean ms':>12}{'p99 ms':>12}{'max ms':>12}{'total s':>12}")
+        report("blocking execute_query", *await measure(use_async=False))
+        report("execute_query_async", *await measure(use_async=True))
+
+
+if __name__ == "__main__":
+    import logging
+    from bot_functions.helpers.log_setup import ROOT_LOGGER_NAME
+    logging.getLogger(ROOT_LOGGER_NAME).setLevel(logging.WARNING)  # Keep log output out of the timings
+    asyncio.run(run())
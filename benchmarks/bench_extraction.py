@@ -0,0 +1,124 @@
+"""
+Benchmarks extract_coin_address_with_types against the previous two-pass implementation.
+
+Run from the project root:
+    python -m benchmarks.bench_extraction
+"""
+import random
+import re
+import timeit
+
+from solders.pubkey import Pubkey
+
+from bot_functions.main.forwarding import (extract_coin_address_with_types, get_extraction_stats,
+                                           is_valid_public_key)
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+CHATTER = ("gm", "ser", "wen", "moon", "lfg", "this", "one", "is", "sending", "aped", "in", "early",
+           "chart", "looks", "clean", "dev", "based", "ngmi", "wagmi", "🚀", "🔥", "https://dexscreener.com")
+
+
+#### ------- [ PREVIOUS IMPLEMENTATION ] ------- ####
+
+def legacy_extract_coin_address_with_types(message: str) -> list:
+    """The two-pass extractor this benchmark measures against."""
+    if not message or not isinstance(message, str):
+        return []
+    pumpfun_matches = re.findall(r"\b[1-9A-HJ-NP-Za-km-z]{28,40}pump\b", message)
+    regular_matches = re.findall(r"\b[1-9A-HJ-NP-Za-km-z]{32,44}\b", message)
+    pumpfun_matches = [addr for addr in pumpfun_matches if 32 <= len(addr) <= 44]
+    regular_matches = [addr for addr in regular_matches if 32 <= len(addr) <= 44]
+    results = [{"address": address, "type": "PumpFun"} for address in pumpfun_matches]
+    results.extend(
+        {"address": address, "type": "Regular"}
+        for address in regular_matches
+        if address not in pumpfun_matches
+    )
+    return results
+
+
+def dedupe_and_validate(results: list) -> list:
+    """
+    Drops repeated addresses and addresses that are not 32-byte public keys from legacy output,
+    neither of which the new extractor reports.
+    """
+    seen = set()
+    unique = []
+    for result in results:
+        if result["address"] not in seen and is_valid_public_key(result["address"]):
+            seen.add(result["address"])
+            unique.append(result)
+    return unique
+
+
+#### ------- [ CORPUS ] ------- ####
+
+def random_address(rng: random.Random, pumpfun: bool = False) -> str:
+    """Returns a real 32-byte public key, vanity-patched to end in 'pump' for PumpFun addresses."""
+    while True:
+        address = str(Pubkey(rng.randbytes(32)))
+        if not pumpfun:
+            return address
+        address = address[:-4] + "pump"
+        if is_valid_public_key(address):
+            return address
+
+
+def random_junk(rng: random.Random) -> str:
+    """Returns a base58-looking word that does not decode to 32 bytes (e.g. a signature fragment)."""
+    while True:
+        junk = "".join(rng.choices(BASE58_ALPHABET, k=rng.randint(32, 44)))
+        if not is_valid_public_key(junk):
+            return junk
+
+
+def chatter(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(CHATTER, k=words))
+
+
+def build_corpus(seed: int = 58) -> dict[str, list[str]]:
+    rng = random.Random(seed)
+    hot_ca = random_address(rng, pumpfun=True)
+    return {
+        "short chatter": [chatter(rng, rng.randint(3, 15)) for _ in range(500)],
+        "long chatter": [chatter(rng, 600) for _ in range(100)],
+        "single CA": [f"{chatter(rng, 8)} {random_address(rng, rng.random() < 0.5)} {chatter(rng, 4)}"
+                      for _ in range(500)],
+        "repeated CA": [f"{hot_ca}\n{chatter(rng, 20)}\nCA: {hot_ca}\n{chatter(rng, 20)} {hot_ca}"
+                        for _ in range(200)],
+        "many CAs": [" ".join(random_address(rng, rng.random() < 0.5) for _ in range(30)) for _ in range(50)],
+        "base58 junk": [f"{chatter(rng, 5)} sig {random_junk(rng)} {chatter(rng, 5)}" for _ in range(500)],
+    }
+
+
+#### ------- [ BENCHMARK ] ------- ####
+
+def check_equivalence(corpus: dict[str, list[str]]):
+    for name, messages in corpus.items():
+        for message in messages:
+            expected = dedupe_and_validate(legacy_extract_coin_address_with_types(message))
+            actual = extract_coin_address_with_types(message)
+            assert actual == expected, f"Output differs from the legacy extractor on '{name}': {message!r}"
+
+
+def run(repeat: int = 5):
+    corpus = build_corpus()
+    check_equivalence(corpus)
+    print("Output matches the legacy extractor on every corpus message.\n")
+
+    print(f"{'corpus':<16}{'legacy msg/s':>16}{'current msg/s':>16}{'speedup':>10}")
+    for name, messages in corpus.items():
+        legacy = min(timeit.repeat(lambda: [legacy_extract_coin_address_with_types(m) for m in messages],
+                                   number=1, repeat=repeat))
+        current = min(timeit.repeat(lambda: [extract_coin_address_with_types(m) for m in messages],
+                                    number=1, repeat=repeat))
+        print(f"{name:<16}{len(messages) / legacy:>16,.0f}{len(messages) / current:>16,.0f}"
+              f"{legacy / current:>9.1f}x")
+
+    print("\nScanner stage counters:")
+    for stage, count in get_extraction_stats().items():
+        print(f"  {stage:<30}{count:>12,}")
+
+
+if __name__ == "__main__":
+    run()
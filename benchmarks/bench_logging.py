@@ -0,0 +1,77 @@
+"""
+Measures the cost a handler pays per log call: the previous setup (eager f-strings at INFO,
+written synchronously to the stream) against level-gated lazy calls and the queued handler.
+Output goes to a stream that takes ~50us per write, roughly a terminal or a busy pipe.
+
+Run from the project root:
+    python -m benchmarks.bench_logging
+"""
+import logging
+import logging.handlers
+import queue
+import time
+
+from bot_functions.helpers.log_setup import TEXT_FORMAT, DeferredFormatQueueHandler
+
+CALLS = 20000
+QUERY = "SELECT current_step FROM user_states WHERE user_id = ?;"
+WRITE_SECONDS = 0.00005
+
+
+class SlowStream:
+    """A write-only stream where every write takes WRITE_SECONDS."""
+
+    def write(self, text: str):
+        time.sleep(WRITE_SECONDS)
+
+    def flush(self):
+        pass
+
+
+def make_logger(name: str, handler: logging.Handler, level: int) -> logging.Logger:
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    bench_logger = logging.getLogger(f"bench.{name}")
+    bench_logger.handlers = [handler]
+    bench_logger.propagate = False
+    bench_logger.setLevel(level)
+    return bench_logger
+
+
+def time_calls(log_call) -> float:
+    started = time.perf_counter()
+    for index in range(CALLS):
+        log_call(index)
+    return (time.perf_counter() - started) / CALLS * 1e6
+
+
+def run():
+    log_stream = SlowStream()
+    sync_logger = make_logger("sync", logging.StreamHandler(log_stream), logging.INFO)
+    gated_logger = make_logger("gated", logging.StreamHandler(log_stream), logging.WARNING)
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(log_stream)
+    stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    queued_logger = make_logger("queued", DeferredFormatQueueHandler(log_queue), logging.INFO)
+
+    results = [
+        ("eager f-string, sync", time_calls(
+            lambda index: sync_logger.info(f"[DATABASE] Executing query:\n{QUERY}\nParams: {(index,)}"))),
+        ("lazy, below level", time_calls(
+            lambda index: gated_logger.debug("[DATABASE] Executing query:\n%s\nParams: %s", QUERY, (index,)))),
+    ]
+
+    listener.start()
+    results.append(("lazy, queued", time_calls(
+        lambda index: queued_logger.info("[DATABASE] Executing query:\n%s\nParams: %s", QUERY, (index,)))))
+    listener.stop()
+
+    print(f"{CALLS:,} log calls per mode, caller-side cost with {WRITE_SECONDS * 1e6:.0f}us writes\n")
+    print(f"{'mode':<24}{'us/call':>10}")
+    for mode, micros in results:
+        print(f"{mode:<24}{micros:>10.2f}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,165 @@
+"""
+Micro-benchmarks for the functions that run on every group message:
+extract_coin_address_with_types, format_forwarded_message_with_hyperlinks and the per-connection
+template render that produces the final forward text (attribution included).
+
+Each case reports ops/s (best of several timed passes, warm validation cache) and the peak
+memory allocated while processing its corpus once. Results can be saved as a baseline and
+later runs compared against it; a case that is slower than the baseline by more than
+--threshold fails the run, so a regression shows up before review.
+
+Run from the project root:
+    python -m benchmarks.bench_micro                  # compare with benchmarks/baselines/micro.json
+    python -m benchmarks.bench_micro --save           # record a new baseline
+    python -m benchmarks.bench_micro --only extract   # cases whose name contains "extract"
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import timeit
+import tracemalloc
+
+from benchmarks.bench_extraction import BASE58_ALPHABET, random_address, random_junk, chatter
+from bot_functions.main.forwarding import extract_coin_address_with_types, format_forwarded_message_with_hyperlinks
+from bot_functions.main.templates import compile_template
+from GLOSSARY import TELEGRAM_MESSAGE_LIMIT
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baselines", "micro.json")
+# Markdown markers in the title exercise the escaped attribution
+CONNECTION_TITLE = "alpha_calls *vip*"
+EMOJI = ("🚀", "🔥", "💎", "🙌", "🐸", "📈", "🌕", "⚡️", "🫡", "👀")
+
+
+#### ------- [ CORPORA ] ------- ####
+
+def wall_of_text(rng: random.Random) -> str:
+    """Chatter up to Telegram's message limit, with one CA somewhere in it."""
+    words = chatter(rng, TELEGRAM_MESSAGE_LIMIT // 4).split()
+    words.insert(rng.randrange(len(words)), random_address(rng))
+    return " ".join(words)[:TELEGRAM_MESSAGE_LIMIT]
+
+
+def long_base58_run(rng: random.Random) -> str:
+    """A single unbroken base58 run (e.g. a pasted transaction blob): the regex must reject it quickly."""
+    return "".join(rng.choices(BASE58_ALPHABET, k=rng.randint(1000, TELEGRAM_MESSAGE_LIMIT)))
+
+
+def emoji_heavy(rng: random.Random) -> str:
+    parts = [" ".join(rng.choices(EMOJI, k=rng.randint(5, 40))), chatter(rng, 6)]
+    if rng.random() < 0.5:
+        parts.append(random_address(rng, pumpfun=rng.random() < 0.5))
+    parts.append("".join(rng.choices(EMOJI, k=rng.randint(5, 40))))
+    return " ".join(parts)
+
+
+def build_extraction_cases(rng: random.Random) -> dict[str, list[str]]:
+    return {
+        "extract/short chatter": [chatter(rng, rng.randint(3, 15)) for _ in range(1000)],
+        "extract/4096-char wall": [wall_of_text(rng) for _ in range(50)],
+        "extract/40 CAs": [" ".join(random_address(rng, rng.random() < 0.5) for _ in range(40)) for _ in range(50)],
+        "extract/long base58 run": [long_base58_run(rng) for _ in range(50)],
+        "extract/base58 junk words": [f"{chatter(rng, 5)} {random_junk(rng)} {random_junk(rng)}" for _ in range(200)],
+        "extract/emoji-heavy": [emoji_heavy(rng) for _ in range(500)],
+    }
+
+
+def build_formatting_cases(rng: random.Random) -> dict[str, list[list]]:
+    def addresses(count: int) -> list:
+        return [{"address": random_address(rng), "type": "PumpFun" if rng.random() < 0.5 else "Regular"}
+                for _ in range(count)]
+    return {
+        "format/1 CA": [addresses(1) for _ in range(500)],
+        "format/5 CAs": [addresses(5) for _ in range(200)],
+        "format/40 CAs": [addresses(40) for _ in range(50)],
+    }
+
+
+def build_cases(seed: int = 14) -> dict[str, tuple]:
+    rng = random.Random(seed)
+    cases = {name: (extract_coin_address_with_types, corpus) for name, corpus in build_extraction_cases(rng).items()}
+    formatting_cases = build_formatting_cases(rng)
+    cases.update({name: (format_forwarded_message_with_hyperlinks, corpus) for name, corpus in formatting_cases.items()})
+    # The full per-target message, as forward_to_target builds it
+    render = compile_template(CONNECTION_TITLE).render
+    cases.update({name.replace("format/", "render/"): (render, corpus) for name, corpus in formatting_cases.items()})
+    return cases
+
+
+#### ------- [ MEASUREMENT ] ------- ####
+
+def measure(function, corpus: list, repeat: int) -> dict:
+    def one_pass():
+        for item in corpus:
+            function(item)
+
+    one_pass()  # Warm the validation cache and the regex
+    best = min(timeit.repeat(one_pass, number=1, repeat=repeat))
+
+    tracemalloc.start()
+    try:
+        baseline_bytes, _ = tracemalloc.get_traced_memory()
+        one_pass()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"ops_per_second": len(corpus) / best, "peak_kib": (peak_bytes - baseline_bytes) / 1024}
+
+
+def load_baseline() -> dict:
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE, encoding="utf-8") as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(results: dict):
+    os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+    with open(BASELINE_FILE, "w", encoding="utf-8") as baseline_file:
+        json.dump({"python": platform.python_version(), "machine": platform.machine(), "cases": results},
+                  baseline_file, indent=2, sort_keys=True)
+        baseline_file.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for address extraction and formatting.")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--only", help="run only cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=7, help="timed passes per case (the best one counts)")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="fail if a case is this much slower than the baseline (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    baseline = load_baseline().get("cases", {})
+    results = {}
+    regressions = []
+
+    print(f"{'case':<28}{'ops/s':>14}{'baseline':>14}{'change':>9}{'peak KiB':>10}")
+    for name, (function, corpus) in build_cases().items():
+        if args.only and args.only not in name:
+            continue
+        result = results[name] = measure(function, corpus, args.repeat)
+
+        previous = baseline.get(name)
+        if previous:
+            change = result["ops_per_second"] / previous["ops_per_second"] - 1
+            if change < -args.threshold:
+                regressions.append(name)
+            compared = f"{previous['ops_per_second']:>14,.0f}{change:>+9.1%}"
+        else:
+            compared = f"{'-':>14}{'':>9}"
+        print(f"{name:<28}{result['ops_per_second']:>14,.0f}{compared}{result['peak_kib']:>10.1f}")
+
+    if args.save:
+        save_baseline({**baseline, **results})
+        print(f"\nBaseline saved to {BASELINE_FILE}")
+    elif regressions:
+        print(f"\nSlower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
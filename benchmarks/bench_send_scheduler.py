@@ -0,0 +1,94 @@
+"""
+Measures sustained forwarding throughput under contention, sending straight to the bot
+versus going through the SendScheduler, against a FakeBot that enforces flood limits.
+
+Telegram's limits are scaled up (see SPEED_UP) so the run takes seconds instead of minutes.
+
+Run from the project root:
+    python -m benchmarks.bench_send_scheduler
+"""
+import asyncio
+import random
+import time
+
+from benchmarks.fake_bot import FakeBot
+from bot_functions.main.send_scheduler import SendScheduler, PRIORITY_NORMAL
+from GLOSSARY import SEND_GLOBAL_RATE_PER_SECOND, SEND_PER_CHAT_RATE_PER_MINUTE, SEND_PER_CHAT_BURST
+
+SPEED_UP = 60  # Multiplier applied to both the fake limits and the scheduler's rates
+TARGET_CHATS = 40
+HOT_CHATS = 8  # Targets that receive most of the burst
+MESSAGES = 3000
+LATENCY = 0.02
+
+
+def build_burst(seed: int = 7) -> list[int]:
+    rng = random.Random(seed)
+    hot = list(range(HOT_CHATS))
+    cold = list(range(HOT_CHATS, TARGET_CHATS))
+    return [rng.choice(hot) if rng.random() < 0.5 else rng.choice(cold) for _ in range(MESSAGES)]
+
+
+def best_possible_seconds(burst: list[int]) -> float:
+    """The shortest time any sender could deliver the burst in without tripping a limit."""
+    per_chat_rate = SEND_PER_CHAT_RATE_PER_MINUTE * SPEED_UP / 60
+    busiest_chat = max(burst.count(chat_id) for chat_id in set(burst))
+    return max((busiest_chat - SEND_PER_CHAT_BURST) / per_chat_rate, len(burst) / (SEND_GLOBAL_RATE_PER_SECOND * SPEED_UP))
+
+
+def fake_bot() -> FakeBot:
+    # The fake Bot API enforces the real limits, sped up
+    return FakeBot(latency=LATENCY, global_rate=SEND_GLOBAL_RATE_PER_SECOND * SPEED_UP,
+                   per_chat_rate=SEND_PER_CHAT_RATE_PER_MINUTE * SPEED_UP)
+
+
+async def direct_sends(burst: list[int]) -> tuple[FakeBot, int]:
+    """The previous behaviour: every forward awaited straight away, RetryAfter only logged."""
+    bot = fake_bot()
+    lost = 0
+
+    async def send(chat_id: int, index: int):
+        nonlocal lost
+        try:
+            await bot.send_message(chat_id=chat_id, text=f"forward {index}")
+        except Exception:
+            lost += 1
+
+    await asyncio.gather(*(send(chat_id, index) for index, chat_id in enumerate(burst)))
+    return bot, lost
+
+
+async def scheduled_sends(burst: list[int]) -> tuple[FakeBot, SendScheduler]:
+    bot = fake_bot()
+    scheduler = SendScheduler(
+        global_rate=SEND_GLOBAL_RATE_PER_SECOND * SPEED_UP,
+        per_chat_rate=SEND_PER_CHAT_RATE_PER_MINUTE * SPEED_UP / 60,
+        per_chat_burst=SEND_PER_CHAT_BURST,
+    )
+    for index, chat_id in enumerate(burst):
+        scheduler.submit(bot, chat_id=chat_id, text=f"forward {index}", priority=PRIORITY_NORMAL)
+    await scheduler.stop()
+    return bot, scheduler
+
+
+async def run():
+    burst = build_burst()
+    print(f"{MESSAGES} forwards to {TARGET_CHATS} chats ({HOT_CHATS} hot), limits sped up {SPEED_UP}x, "
+          f"best possible delivery time {best_possible_seconds(burst):.2f}s\n")
+
+    started = time.perf_counter()
+    bot, lost = await direct_sends(burst)
+    elapsed = time.perf_counter() - started
+    print(f"direct sends:    delivered {len(bot.sent):>5} / {MESSAGES}, lost {lost:>5}, "
+          f"RetryAfter {bot.rate_limited:>5}, {len(bot.sent) / elapsed:>8,.1f} sends/s over {elapsed:.2f}s")
+
+    started = time.perf_counter()
+    bot, scheduler = await scheduled_sends(burst)
+    elapsed = time.perf_counter() - started
+    print(f"send scheduler:  delivered {len(bot.sent):>5} / {MESSAGES}, lost {scheduler.stats['failed']:>5}, "
+          f"RetryAfter {bot.rate_limited:>5}, {len(bot.sent) / elapsed:>8,.1f} sends/s over {elapsed:.2f}s")
+    print(f"\nScheduler counters: {dict(scheduler.stats)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,182 @@
+"""
+Measures how update throughput scales with worker processes (WORKER_PROCESSES). The receiving
+side shards the raw payloads of a synthetic recording by chat to 1, 2, 4 and 8 workers through
+the WorkerPool; each worker parses its updates and runs dispatch_text_message behind its own
+WorkerShardProcessor, writes its forwards to the outbox and reports back which updates it has
+handled, and this process sends the forwards to a FakeBot. The "0" row is the single-process
+baseline, parsing, handling and sending the same payloads in this process.
+
+Sends take no time and the rate limits are scaled out of the way, so the run is CPU-bound:
+parsing, extraction, formatting and (for workers) moving each payload between processes. Every
+worker checks that each chat's updates were handled in arrival order. Expect a speedup only up
+to the number of cores.
+
+Run from the project root:
+    python -m benchmarks.bench_sharding
+"""
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import AsyncIterator
+
+from telegram import Update
+
+import database.db_manager as db_manager
+from benchmarks.fake_bot import FakeBot
+from benchmarks.replay import generate_recording, load_recording, build_routes
+from bot_functions.helpers.log_setup import configure_logging
+from bot_functions.main.dispatcher import dispatch_text_message
+from bot_functions.main.outbox import set_outbox_write_only, start_outbox, stop_outbox
+from bot_functions.main.routing import load_routing_table
+from bot_functions.main.send_scheduler import send_scheduler, TokenBucket
+from bot_functions.main.sharding import WorkerPool, WorkerShardProcessor, shard_key, receive_updates
+from bot_functions.main.update_processor import KeyedUpdateProcessor
+from database.db_manager import close_connections, execute_non_query
+from database.db_migrations import run_migrations
+from GLOSSARY import SEND_GLOBAL_RATE_PER_SECOND, SEND_PER_CHAT_RATE_PER_MINUTE, UPDATE_CONCURRENCY, LOG_LEVELS
+
+MESSAGES = 40_000
+SOURCES = 200
+TARGETS = 2
+WORKER_COUNTS = (1, 2, 4, 8)
+RATE_SCALE = 10_000  # Keeps the send limits from being what is measured
+
+
+#### ------- [ HANDLING ] ------- ####
+
+def raise_send_limits():
+    rate = SEND_GLOBAL_RATE_PER_SECOND * RATE_SCALE
+    send_scheduler.global_bucket = TokenBucket(rate, rate)
+    send_scheduler.per_chat_rate = SEND_PER_CHAT_RATE_PER_MINUTE * RATE_SCALE / 60
+
+
+async def handle_updates(batches: AsyncIterator[list[Update]], done_queue=None) -> dict:
+    """Handles every update like a worker's Application would: one task per update, in arrival order."""
+    raise_send_limits()
+    bot = FakeBot()
+    context = SimpleNamespace(bot=bot)
+    if done_queue is None:
+        processor = KeyedUpdateProcessor(UPDATE_CONCURRENCY)
+    else:
+        processor = WorkerShardProcessor(done_queue, UPDATE_CONCURRENCY)
+    await processor.initialize()
+    handled_order = defaultdict(list)
+    tasks = []
+
+    async def handle(update: Update):
+        await dispatch_text_message(update, context)
+        handled_order[update.effective_chat.id].append(update.update_id)
+
+    async for batch in batches:
+        for update in batch:
+            tasks.append(asyncio.create_task(processor.process_update(update, handle(update))))
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    await stop_outbox()
+    await send_scheduler.stop()
+    await processor.shutdown()
+    return {"updates": len(tasks), "forwards": len(bot.sent), "finished_at": time.time(),
+            "in_order": all(order == sorted(order) for order in handled_order.values())}
+
+
+async def parsed_batches(payload_batches: AsyncIterator[list[dict]]) -> AsyncIterator[list[Update]]:
+    async for batch in payload_batches:
+        yield [Update.de_json(payload, None) for payload in batch]
+
+
+def bench_worker(db_file: str, results, index: int, worker_count: int, shard_queue, done_queue):
+    """WorkerPool target: loads the routes, reports ready, then handles its shard until told to stop."""
+    configure_logging("WARNING", dict.fromkeys(LOG_LEVELS, "WARNING"))
+    db_manager.DB_FILE = db_file
+    load_routing_table()
+    set_outbox_write_only()
+    results.put(index)
+    results.put(asyncio.run(handle_updates(parsed_batches(receive_updates(shard_queue)), done_queue)))
+    close_connections()
+
+
+#### ------- [ RUNS ] ------- ####
+
+def run_in_process(payloads: list[dict]) -> tuple[float, dict]:
+    async def one_batch():
+        yield payloads
+
+    started = time.time()
+    result = asyncio.run(handle_updates(parsed_batches(one_batch())))
+    return result["finished_at"] - started, result
+
+
+def run_sharded(payloads: list[dict], worker_count: int) -> tuple[float, dict]:
+    results = multiprocessing.get_context("spawn").Queue()
+    handled = []
+    pool = WorkerPool(worker_count, functools.partial(bench_worker, db_manager.DB_FILE, results),
+                      on_update_finished=handled.append)
+    pool.start()
+    for _ in range(worker_count):
+        results.get()  # Wait for every worker to be ready, so startup is not measured
+
+    async def receive_and_send() -> int:
+        # Like the receiving process: hands out the updates, then sends what the workers wrote to the outbox
+        raise_send_limits()
+        bot = FakeBot()
+        await start_outbox(bot)
+        for payload in payloads:
+            shard = shard_key(payload) % worker_count
+            if not pool.submit(shard, payload):
+                raise RuntimeError(f"Worker {shard} is not running")
+        await pool.stop()
+        await stop_outbox()
+        await send_scheduler.stop()
+        return len(bot.sent)
+
+    started = time.time()
+    forwards = asyncio.run(receive_and_send())
+    finished_at = time.time()
+
+    worker_results = [results.get() for _ in range(worker_count)]
+    totals = {"updates": sum(result["updates"] for result in worker_results),
+              "forwards": forwards,
+              "in_order": all(result["in_order"] for result in worker_results),
+              "reported": len(handled)}
+    return finished_at - started, totals
+
+
+def main():
+    configure_logging("WARNING", dict.fromkeys(LOG_LEVELS, "WARNING"))
+    with tempfile.TemporaryDirectory() as directory:
+        recording = os.path.join(directory, "recording.jsonl")
+        generate_recording(recording, MESSAGES, sources=SOURCES)
+        with open(recording, encoding="utf-8") as recording_file:
+            payloads = [json.loads(line) for line in recording_file]
+        db_manager.DB_FILE = os.path.join(directory, "sharding.db")
+        run_migrations()
+        build_routes(load_recording(recording), TARGETS)
+        load_routing_table()
+
+        print(f"{MESSAGES:,} updates from {SOURCES} chats, {TARGETS} targets each, {os.cpu_count()} CPU(s)\n")
+        print(f"{'workers':>8}{'updates/s':>12}{'speedup':>10}{'forwards':>10}{'in order':>10}")
+        baseline = None
+        for worker_count in (0, *WORKER_COUNTS):
+            execute_non_query("DELETE FROM outbox;")  # Each run forwards the same messages again
+            execute_non_query("DELETE FROM recent_forwards;")
+            if worker_count:
+                elapsed, totals = run_sharded(payloads, worker_count)
+            else:
+                elapsed, totals = run_in_process(payloads)
+            assert totals["updates"] == MESSAGES, f"{totals['updates']} of {MESSAGES} updates were handled"
+            assert totals.get("reported", MESSAGES) == MESSAGES, f"{totals['reported']} updates were reported"
+            throughput = MESSAGES / elapsed
+            baseline = baseline or throughput
+            print(f"{worker_count:>8}{throughput:>12,.0f}{throughput / baseline:>9.2f}x{totals['forwards']:>10,}"
+                  f"{'yes' if totals['in_order'] else 'NO':>10}")
+        close_connections()
+
+
+if __name__ == "__main__":
+    main()
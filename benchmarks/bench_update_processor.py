@@ -0,0 +1,80 @@
+"""
+Measures update throughput and latency with PTB's default one-at-a-time processing versus
+the KeyedUpdateProcessor, at 1, 10 and 100 active source chats.
+
+Each update's handler awaits one FakeBot call (like a wizard reply or a direct send), so a
+slow Bot API call is what holds processing up. The keyed run also checks that every chat's
+updates were handled in arrival order.
+
+Run from the project root:
+    python -m benchmarks.bench_update_processor
+"""
+import asyncio
+import time
+from collections import defaultdict
+
+from telegram import Chat, Message, Update, User
+from telegram.ext import SimpleUpdateProcessor
+
+from benchmarks.fake_bot import FakeBot
+from bot_functions.main.update_processor import KeyedUpdateProcessor
+from GLOSSARY import UPDATE_CONCURRENCY
+
+UPDATES = 1000
+LATENCY = 0.02
+CHAT_COUNTS = (1, 10, 100)
+
+
+def build_updates(chats: int) -> list[Update]:
+    user = User(id=1, is_bot=False, first_name="caller")
+    return [
+        Update(update_id=index, message=Message(
+            message_id=index, date=None, chat=Chat(id=-1001000000000 - index % chats, type="supergroup"),
+            from_user=user, text=f"message {index}"))
+        for index in range(UPDATES)
+    ]
+
+
+async def measure(processor, updates: list[Update]) -> tuple[float, list[float], dict]:
+    bot = FakeBot(latency=LATENCY)
+    handled_order = defaultdict(list)
+    latencies = []
+
+    async def handler(update: Update, received: float):
+        await bot.send_message(chat_id=update.effective_chat.id, text=update.message.text)
+        handled_order[update.effective_chat.id].append(update.update_id)
+        latencies.append(time.perf_counter() - received)
+
+    # Mirrors Application: one task per update, created in arrival order
+    await processor.initialize()
+    started = time.perf_counter()
+    await asyncio.gather(*(processor.process_update(update, handler(update, time.perf_counter()))
+                           for update in updates))
+    elapsed = time.perf_counter() - started
+    await processor.shutdown()
+    return elapsed, sorted(latencies), handled_order
+
+
+def report(label: str, chats: int, elapsed: float, latencies: list[float]):
+    p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+    print(f"{label:<16}{chats:>7}{UPDATES / elapsed:>14,.0f}{latencies[len(latencies) // 2] * 1000:>12.1f}"
+          f"{p99 * 1000:>12.1f}")
+
+
+async def run():
+    print(f"{UPDATES:,} updates, {LATENCY * 1000:.0f} ms per Bot API call, "
+          f"{UPDATE_CONCURRENCY} concurrent handlers for the keyed processor\n")
+    print(f"{'processor':<16}{'chats':>7}{'updates/s':>14}{'p50 ms':>12}{'p99 ms':>12}")
+    for chats in CHAT_COUNTS:
+        updates = build_updates(chats)
+        elapsed, latencies, _ = await measure(SimpleUpdateProcessor(1), updates)
+        report("sequential", chats, elapsed, latencies)
+
+        elapsed, latencies, handled_order = await measure(KeyedUpdateProcessor(UPDATE_CONCURRENCY), updates)
+        for order in handled_order.values():
+            assert order == sorted(order), "A chat's updates were handled out of order"
+        report("keyed", chats, elapsed, latencies)
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
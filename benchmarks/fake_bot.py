@@ -0,0 +1,52 @@
+"""
+An offline stand-in for telegram.Bot that records sends and enforces Telegram-style flood limits.
+"""
+import asyncio
+import math
+import time
+from collections import defaultdict, deque
+from typing import Optional
+
+from telegram.error import RetryAfter
+
+
+class FakeBot:
+    """
+    Records send_message calls instead of talking to Telegram.
+
+    Args:
+        latency (float): Seconds each send_message call takes.
+        global_rate (Optional[float]): Sends per second allowed bot-wide before RetryAfter is raised.
+        per_chat_rate (Optional[float]): Sends per minute allowed into one chat before RetryAfter is raised.
+    """
+
+    def __init__(self, latency: float = 0.0, global_rate: Optional[float] = None,
+                 per_chat_rate: Optional[float] = None):
+        self.latency = latency
+        self.global_rate = global_rate
+        self.per_chat_rate = per_chat_rate
+        self.sent: list[dict] = []
+        self.rate_limited = 0
+        self._global_window: deque = deque()
+        self._chat_windows: dict[int, deque] = defaultdict(deque)
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        now = time.monotonic()
+        self._check_limit(self._global_window, now, 1.0, self.global_rate)
+        self._check_limit(self._chat_windows[chat_id], now, 60.0, self.per_chat_rate)
+
+        self._global_window.append(now)
+        self._chat_windows[chat_id].append(now)
+        self.sent.append({"chat_id": chat_id, "text": text, **kwargs})
+
+    def _check_limit(self, window: deque, now: float, period: float, limit: Optional[float]):
+        if limit is None:
+            return
+        while window and now - window[0] >= period:
+            window.popleft()
+        if len(window) >= limit:
+            self.rate_limited += 1
+            raise RetryAfter(max(1, math.ceil(period - (now - window[0]))))
@@ -0,0 +1,68 @@
+"""
+POSTs recorded updates to the bot's local webhook listener, the way Telegram delivers them,
+and reports how fast they were accepted. Use it with UPDATE_MODE = "webhook" and a fixed
+WEBHOOK_SECRET_TOKEN to test webhook ingestion end-to-end; recordings are the same JSONL
+files benchmarks.replay reads (one Update payload per line).
+
+Run from the project root while the bot is running:
+    python -m benchmarks.post_updates recording.jsonl
+    python -m benchmarks.post_updates recording.jsonl --concurrency 100 --url http://127.0.0.1:8443/telegram
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from GLOSSARY import WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN, WEBHOOK_MAX_CONNECTIONS
+
+
+async def post_updates(url: str, secret_token: str, payloads: list[str], concurrency: int):
+    statuses = Counter()
+    latencies = []
+    pending = iter(payloads)
+    headers = {"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret_token}
+
+    async with httpx.AsyncClient(timeout=10, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def deliver():
+            # Each worker is one of Telegram's parallel webhook connections
+            for payload in pending:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, content=payload, headers=headers)
+                    statuses[response.status_code] += 1
+                except httpx.HTTPError as post_error:
+                    statuses[type(post_error).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(deliver() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{len(payloads):,} updates posted in {elapsed:.2f}s ({len(payloads) / elapsed:,.0f} updates/s)")
+    print(f"Responses: {dict(statuses)}")
+    if latencies:
+        print("Latency ms: " + ", ".join(
+            f"p{int(q * 100)} {latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000:.2f}"
+            for q in (0.5, 0.9, 0.99)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POST recorded updates to the local webhook listener.")
+    parser.add_argument("recording", help="JSONL file with one Telegram Update payload per line")
+    parser.add_argument("--url", default=f"http://{WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=WEBHOOK_SECRET_TOKEN, help="defaults to WEBHOOK_SECRET_TOKEN")
+    parser.add_argument("--concurrency", type=int, default=WEBHOOK_MAX_CONNECTIONS)
+    args = parser.parse_args()
+
+    if not args.secret:
+        parser.error("set WEBHOOK_SECRET_TOKEN in the GLOSSARY (or pass --secret) so requests are accepted")
+    with open(args.recording, encoding="utf-8") as recording:
+        payloads = [line.strip() for line in recording if line.strip()]
+    asyncio.run(post_updates(args.url, args.secret, payloads, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Replays recorded Telegram updates through the real dispatch_text_message / detect_and_forward path,
+offline, against a FakeBot, and reports throughput and per-stage latency.
+
+The recording is a JSONL file with one Update payload per line, as returned by getUpdates.
+Without --db, a temporary database is built with --targets connections for every source
+chat in the recording. --generate writes a synthetic recording first.
+
+Run from the project root:
+    python -m benchmarks.replay recording.jsonl
+    python -m benchmarks.replay --generate 5000 recording.jsonl
+    python -m benchmarks.replay recording.jsonl --db database/database.db --latency 0.05 --bot-limit-factor 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from types import SimpleNamespace
+
+from telegram import Update
+
+import database.db_manager as db_manager
+from benchmarks.bench_extraction import random_address, chatter
+from benchmarks.fake_bot import FakeBot
+from bot_functions.helpers.log_setup import configure_logging
+from bot_functions.main import metrics
+from bot_functions.main.dispatcher import dispatch_text_message
+from bot_functions.main.forwarding import get_extraction_stats
+from bot_functions.main.dedup import get_dedup_stats
+from bot_functions.main.outbox import stop_outbox, outbox_stats
+from bot_functions.main.routing import load_routing_table
+from bot_functions.main.send_scheduler import send_scheduler, TokenBucket
+from database.db_manager import transaction, close_connections
+from database.db_migrations import run_migrations
+from GLOSSARY import SEND_GLOBAL_RATE_PER_SECOND, SEND_PER_CHAT_RATE_PER_MINUTE, LOG_LEVELS
+
+
+#### ------- [ RECORDINGS ] ------- ####
+
+def generate_recording(path: str, messages: int, sources: int = 20, ca_share: float = 0.1, seed: int = 13):
+    """Writes a synthetic recording: group chatter with a CA in roughly `ca_share` of the messages."""
+    rng = random.Random(seed)
+    hot_addresses = [random_address(rng, pumpfun=rng.random() < 0.5) for _ in range(50)]
+    started = int(time.time())
+    with open(path, "w", encoding="utf-8") as recording:
+        for update_id in range(1, messages + 1):
+            text = chatter(rng, rng.randint(2, 25))
+            if rng.random() < ca_share:
+                # Calls cluster on a few hot CAs, like a real pump
+                address = rng.choice(hot_addresses) if rng.random() < 0.7 else random_address(rng)
+                text = f"{text} {address} {chatter(rng, rng.randint(0, 6))}"
+            chat_id = -1001000000000 - rng.randrange(sources)
+            update = {
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id,
+                    "date": started + update_id // 20,
+                    "chat": {"id": chat_id, "type": "supergroup", "title": f"Source {chat_id}"},
+                    "from": {"id": 1000 + rng.randrange(500), "is_bot": False, "first_name": "caller"},
+                    "text": text,
+                },
+            }
+            recording.write(json.dumps(update) + "\n")
+
+
+def load_recording(path: str) -> list[Update]:
+    with open(path, encoding="utf-8") as recording:
+        # bot=None: the updates never call the Bot API themselves, sends go through context.bot
+        return [Update.de_json(json.loads(line), None) for line in recording if line.strip()]
+
+
+def build_routes(updates: list[Update], targets: int):
+    """Creates `targets` connections for every source chat seen in the recording."""
+    sources = sorted({update.message.chat_id for update in updates if update.message})
+    with transaction() as cursor:
+        for source_index, source_group_id in enumerate(sources):
+            for target_index in range(targets):
+                cursor.execute(
+                    "INSERT INTO user_connections (user_id, connection_title, source_group_id, target_group_id) "
+                    "VALUES (?, ?, ?, ?);",
+                    (1, f"Replay {source_index}-{target_index}", source_group_id,
+                     -1002000000000 - source_index * targets - target_index)
+                )
+
+
+#### ------- [ REPLAY ] ------- ####
+
+async def replay(updates: list[Update], bot: FakeBot, speed: float) -> tuple[list[float], float, float]:
+    """
+    Feeds every update to dispatch_text_message, honoring the recorded spacing divided by `speed`
+    (0 replays as fast as possible). Returns handler latencies, the time to handle every update,
+    and the time until the last forward was sent.
+    """
+    context = SimpleNamespace(bot=bot)
+    latencies = []
+    first_date = updates[0].message.date if updates and updates[0].message else None
+
+    started = time.perf_counter()
+    for update in updates:
+        if speed and first_date is not None and update.message:
+            due = (update.message.date - first_date).total_seconds() / speed
+            delay = due - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        handler_started = time.perf_counter()
+        await dispatch_text_message(update, context)
+        latencies.append(time.perf_counter() - handler_started)
+        await asyncio.sleep(0)  # Let the send workers run between updates, as polling would
+    handled = time.perf_counter() - started
+
+    await stop_outbox()
+    drained = time.perf_counter() - started
+    await send_scheduler.stop()
+    return latencies, handled, drained
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def report(updates: list[Update], bot: FakeBot, latencies: list[float], handled: float, drained: float):
+    print(f"\n{len(updates):,} updates handled in {handled:.2f}s ({len(updates) / handled:,.0f} messages/s)")
+    print(f"{len(bot.sent):,} forwards sent in {drained:.2f}s ({len(bot.sent) / drained:,.1f} forwards/s), "
+          f"{bot.rate_limited:,} RetryAfter from the fake Bot API\n")
+
+    print(f"{'stage':<26}{'count':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    latencies = sorted(latencies)
+    print(f"{'dispatch (exact)':<26}{len(latencies):>10,}" +
+          "".join(f"{percentile(latencies, q) * 1000:>10.3f}" for q in (0.5, 0.9, 0.99)))
+    for histogram in metrics.HISTOGRAMS:
+        print(f"{histogram.name:<26}{histogram.count:>10,}" +
+              "".join(f"{histogram.quantile(q) * 1000:>10.3f}" for q in (0.5, 0.9, 0.99)))
+
+    print("\nCounters:")
+    counters = {**{f"extraction {key}": value for key, value in get_extraction_stats().items()},
+                **{f"dedup {key}": value for key, value in get_dedup_stats().items()},
+                **{f"outbox {key}": value for key, value in outbox_stats.items()},
+                **{f"send {key}": value for key, value in send_scheduler.stats.items()}}
+    for name, value in counters.items():
+        print(f"  {name:<40}{value:>12,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded updates through the forwarding pipeline offline.")
+    parser.add_argument("recording", help="JSONL file with one Telegram Update payload per line")
+    parser.add_argument("--generate", type=int, metavar="N", help="first write a synthetic recording of N messages")
+    parser.add_argument("--db", help="database to route with (a copy of production); default: build routes")
+    parser.add_argument("--targets", type=int, default=2, help="targets per source when building routes")
+    parser.add_argument("--speed", type=float, default=0, help="replay at N times recorded speed (0 = flat out)")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds each fake send_message takes")
+    parser.add_argument("--rate-scale", type=float, default=60,
+                        help="multiply Telegram's rate limits by this, so long replays finish quickly")
+    parser.add_argument("--bot-limit-factor", type=float,
+                        help="make the fake Bot API enforce the (scaled) limits times this; below 1 forces RetryAfter")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    configure_logging(args.log_level, dict.fromkeys(LOG_LEVELS, args.log_level))
+    if args.generate:
+        generate_recording(args.recording, args.generate)
+    updates = load_recording(args.recording)
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.db:
+            db_manager.DB_FILE = args.db
+        else:
+            db_manager.DB_FILE = os.path.join(directory, "replay.db")
+            run_migrations()
+            build_routes(updates, args.targets)
+        load_routing_table()
+
+        global_rate = SEND_GLOBAL_RATE_PER_SECOND * args.rate_scale
+        per_chat_rate = SEND_PER_CHAT_RATE_PER_MINUTE * args.rate_scale
+        send_scheduler.global_bucket = TokenBucket(global_rate, global_rate)
+        send_scheduler.per_chat_rate = per_chat_rate / 60
+
+        limit_factor = args.bot_limit_factor
+        bot = FakeBot(latency=args.latency,
+                      global_rate=global_rate * limit_factor if limit_factor else None,
+                      per_chat_rate=per_chat_rate * limit_factor if limit_factor else None)
+
+        latencies, handled, drained = asyncio.run(replay(updates, bot, args.speed))
+        report(updates, bot, latencies, handled, drained)
+        close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,47 @@
+from typing import Optional
+
 from telegram import CallbackQuery
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
-from GLOSSARY import logger, SK_ADD1, SK_ADD2, Correct_Input_Format, SK_ADD3, SK_ADD4, SK_ADD5, SK_ADD6, SK_START
-from bot_functions.main.forwarding import handle_message
-from database.db_manager import execute_non_query, execute_query
-from database.db_setup import SQL_NEXT_STEP
+from GLOSSARY import logger, Correct_Input_Format, SK_ADD1, SK_ADD3, SK_ADD4, SK_ADD5, SK_ADD6
+from bot_commands.connection_wizard import (ConnectionWizard, start_wizard, get_wizard, discard_wizard,
+                                            wizard_stats)
+from bot_functions.main.routing import refresh_route
+from database.db_manager import execute_query_async, run_in_db_thread
 from database.db_user_queries import get_user_groups
 
 input_format = Correct_Input_Format
 
-async def step_checker(user_id: int, expected_step: str) -> bool:
-    query_current_step = "SELECT current_step FROM user_states WHERE user_id = ?;"
-    result = execute_query(query_current_step, params=(user_id,))
-
-    # Extract current step (log value for debugging)
-    current_step = result[0][0] if result else None
-    logger.info(f"[STEP CHECK] User {user_id} current step in DB: '{current_step}', Expected: '{expected_step}'")
+async def active_wizard(user_id: int, chat_id: int, expected_step: str,
+                        context: ContextTypes.DEFAULT_TYPE) -> Optional[ConnectionWizard]:
+    """
+    Returns the user's wizard if it is at `expected_step`; otherwise tells the user and returns None.
+    Steps are held in memory by the wizard, so this never touches the database.
+    """
+    wizard = get_wizard(user_id)
+    if wizard is None:
+        logger.warning(f"[STEP CHECK] User {user_id} has no active connection wizard (expected '{expected_step}').")
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text="⌛ This connection setup is no longer active. Please start again with ➕ Add Connection."
+        )
+        return None
 
-    # Compare actual result with the expected step
-    return current_step == expected_step
+    if wizard.step != expected_step:
+        logger.warning(f"[STEP CHECK] User {user_id} is at step '{wizard.step}', not '{expected_step}'.")
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text="❌ Unexpected input. It seems you're not in the correct stage. Please continue from the latest step."
+        )
+        return None
+    return wizard
 
 async def handle_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     chat_id = update.effective_chat.id
-    current_step = SK_ADD1
-    next_step = SQL_NEXT_STEP
 
-    # Update user's "Current Step" in user_states
-    try:
-        try:
-            logger.info(f"Executing query: {next_step}, with params: {(current_step, user_id)}")
-            execute_non_query(query=next_step, params=(current_step, user_id))
-        except Exception as e:
-            logger.error(
-                f"[SQL ERROR] Query failed: {next_step} - Params: {(current_step, user_id)} - Error: {e}")
-
-        logger.info(f"[CONNECTION] Updated user {user_id} current step to {current_step}.")
-
-        # Verify update
-        fetch_query = "SELECT current_step FROM user_states WHERE user_id = ?;"
-        updated_result = execute_query(fetch_query, params=(user_id,))
-
-        if not updated_result or updated_result[0][0] != current_step:
-            logger.error(
-                f"[VERIFICATION FAILED] User {user_id} current_step verification failed. Expected: {current_step}, Found: {updated_result}")
-            await context.bot.send_message(chat_id=chat_id, text="⚠️ Failed to update your progress. Please try again.")
-            return
-    except Exception as e:
-        logger.error(f"[DATABASE ERROR] Failed to update/verify current_step for user {user_id}: {e}")
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text="❌ An error occurred. Please try again later."
-        )
-        return
+    # The connection is built in memory and only written once it is complete
+    start_wizard(user_id)
 
     logger.info(f"[CONNECTION] User {user_id} requested to add a new connection.")
     await context.bot.send_message(
@@ -61,23 +50,16 @@ async def handle_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 async def handle_title(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Saves a private message as the title of the user's new connection.
+    Only reached through the text dispatcher, which has already checked the wizard is at SK_ADD1.
+    """
     user_id = update.effective_user.id  # ID of the user sending the message
     chat_id = update.effective_chat.id  # ID of the chat where the message is sent
-    expected_step = SK_ADD1  # Workflow step where the user is expected to add a title
-    current_step = SK_ADD2  # Workflow step to update after this one
-    next_step = SQL_NEXT_STEP  # SQL query to update the next step
-    chat_type = update.message.chat.type
 
     try:
-        # Ignore messages from groups and supergroups for this step
-        if chat_type in ["group", "supergroup"]:
-            logger.info(f"[WARNING] Ignored message from user {user_id} in chat type '{chat_type}'.")
-            await handle_message(update, context)
-            return
-
-        # Perform step check for private chats
-        if not await step_checker(user_id, expected_step):
-            logger.info(f"[STEP CHECK] Ignored message from user {user_id} not in step '{expected_step}'.")
+        wizard = await active_wizard(user_id, chat_id, SK_ADD1, context)
+        if wizard is None:
             return
 
         # Get user message as connection title
@@ -90,64 +72,11 @@ async def handle_title(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
 
-        # Insert placeholder connection into user_connections if it does not exist
-        insert_query = """
-            INSERT INTO user_connections (user_id, source_group_id, source_topic_id, target_group_id, target_topic_id, connection_title)
-            VALUES (?, NULL, NULL, NULL, NULL, ?)
-        """
-        execute_non_query(insert_query, (user_id, connection_title))
-        logger.info(f"[CONNECTION] Inserted new connection for user {user_id} with title '{connection_title}'.")
-
-        # Fetch the newly inserted connection_id
-        fetch_id_query = """
-            SELECT connection_id FROM user_connections
-            WHERE user_id = ? AND connection_title = ?
-            ORDER BY connection_id DESC LIMIT 1
-        """
-        result = execute_query(fetch_id_query, (user_id, connection_title))
-        if result and result[0]:
-            connection_id = result[0][0]
-            context.user_data['connection_id'] = connection_id  # Save for later stages
-            logger.info(f"[CONNECTION ID] Retrieved connection_id {connection_id} for user {user_id}.")
-        else:
-            logger.error("[CONNECTION ID] Failed to fetch connection_id after insert.")
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="❌ Failed to create a new connection. Please try again."
-            )
-            return
-
-        # Update the user's "Current Step" in user_states
-        try:
-            logger.info(f"Executing query: {next_step}, with params: {(current_step, user_id)}")
-            execute_non_query(query=next_step, params=(current_step, user_id))
-
-            logger.info(f"[CONNECTION] Updated user {user_id}'s current step to {current_step}.")
-
-            # Verify update
-            fetch_query = "SELECT current_step FROM user_states WHERE user_id = ?;"
-            updated_result = execute_query(fetch_query, params=(user_id,))
-
-            if not updated_result or updated_result[0][0] != current_step:
-                logger.error(
-                    f"[VERIFICATION FAILED] User {user_id} current_step verification failed. Expected: {current_step}, Found: {updated_result}")
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text="⚠️ Failed to update your progress. Please try again."
-                )
-                return
-        except Exception as e:
-            logger.error(f"[DATABASE ERROR] Failed to update/verify current_step for user {user_id}: {e}")
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="❌ An error occurred. Please try again later."
-            )
-            return
-
-        # Confirm success and print connection_id
+        wizard.set_title(connection_title)
+        logger.info(f"[CONNECTION] User {user_id} named their new connection '{connection_title}'.")
         await context.bot.send_message(
             chat_id=chat_id,
-            text=f"✅ Connection `{connection_title}` has been named successfully! Your connection ID is `{connection_id}`."
+            text=f"✅ Connection `{connection_title}` has been named successfully!"
         )
 
         # Trigger the next phase of the workflow
@@ -161,24 +90,19 @@ async def handle_title(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 async def handle_ids(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Shows the source group picker. Runs right after the title is saved, and again if the user
+    sends text instead of picking a group.
+    """
     user_id = update.effective_user.id
     chat_id = update.effective_chat.id
-    expected_step = SK_ADD2
-    current_step = SK_ADD3
-    next_step = SQL_NEXT_STEP
 
     try:
-        # Step-checker to ensure the user is in the correct stage
-        if not await step_checker(user_id, expected_step):
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="❌ Unexpected input. It seems you're not in the phase to add connection IDs. Restarting workflow...",
-            )
-            logger.warning(f"[STEP CHECK] User {user_id} is not in step '{SK_ADD2}' while trying to add IDs.")
-            return  # Exit early
+        if await active_wizard(user_id, chat_id, SK_ADD3, context) is None:
+            return
 
         # Fetch the list of groups the user has added to the bot
-        user_groups = get_user_groups(user_id)
+        user_groups = await get_user_groups(user_id)
         if not user_groups:
             await context.bot.send_message(
                 chat_id=chat_id,
@@ -199,35 +123,6 @@ async def handle_ids(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=reply_markup,
         )
 
-        # Update user's "Current Step" in user_states
-        try:
-            try:
-                logger.info(f"Executing query: {next_step}, with params: {(current_step, user_id)}")
-                execute_non_query(query=next_step, params=(current_step, user_id))
-            except Exception as e:
-                logger.error(
-                    f"[SQL ERROR] Query failed: {next_step} - Params: {(current_step, user_id)} - Error: {e}")
-
-            logger.info(f"[CONNECTION] Updated user {user_id} current step to {current_step}.")
-
-            # Verify update
-            fetch_query = "SELECT current_step FROM user_states WHERE user_id = ?;"
-            updated_result = execute_query(fetch_query, params=(user_id,))
-
-            if not updated_result or updated_result[0][0] != current_step:
-                logger.error(
-                    f"[VERIFICATION FAILED] User {user_id} current_step verification failed. Expected: {current_step}, Found: {updated_result}")
-                await context.bot.send_message(chat_id=chat_id,
-                                               text="⚠️ Failed to update your progress. Please try again.")
-                return
-        except Exception as e:
-            logger.error(f"[DATABASE ERROR] Failed to update/verify current_step for user {user_id}: {e}")
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="❌ An error occurred. Please try again later."
-            )
-            return
-
     except Exception as e:
         logger.error(f"[IDS Input Error] Unexpected error (user_id={user_id}): {str(e)}")
         await context.bot.send_message(
@@ -236,11 +131,6 @@ async def handle_ids(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 async def handle_source_group_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    expected_step = SK_ADD3
-    current_step = SK_ADD4
-    connection_id = context.user_data.get("connection_id")
-    next_step = SQL_NEXT_STEP
-
     query: CallbackQuery = update.callback_query
     await query.answer()  # Acknowledge callback query
 
@@ -248,60 +138,40 @@ async def handle_source_group_selection(update: Update, context: ContextTypes.DE
     user_id = query.from_user.id
 
     try:
-        # Step-checker to ensure the user is in the correct stage
-        if not await step_checker(user_id, expected_step):
-            logger.warning(f"[STEP CHECK] User {user_id} is not in step '{expected_step}' while trying to add IDs.")
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="❌ Unexpected input. It seems you're not in the correct stage. Restarting the workflow."
-            )
+        wizard = await active_wizard(user_id, chat_id, SK_ADD3, context)
+        if wizard is None:
             return
 
-        # Handle callback data
-        if query.data == "source_group_none":
-            # Allow skipping if no source group is selected
-            logger.info(f"[Group Selection] User {user_id} chose 'No specific group'.")
-            context.user_data["source_group_id"] = None
-            await context.bot.send_message(chat_id=chat_id, text="✅ No source group has been selected.")
-        elif query.data.startswith("source_group_"):
-            # Extract group_id from callback data
-            callback_group_id = query.data.replace("source_group_", "").strip()
-
-            # Fetch and validate the group from the database
-            fetch_groups_query = "SELECT group_id, group_name FROM user_groups WHERE user_id = ?;"
-            user_groups = execute_query(fetch_groups_query, (user_id,))
-            if not user_groups:
-                logger.warning(f"[Group Selection] No groups found for user_id {user_id}.")
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text="⚠️ No groups are configured. Please add groups and try again."
-                )
-                return
-
-            # Match the callback group_id to one in the user's groups
-            matching_group = next((group for group in user_groups if str(group[0]) == callback_group_id), None)
-            if not matching_group:
-                logger.error(f"[Group Selection] Invalid group_id {callback_group_id} for user_id {user_id}.")
-                await context.bot.send_message(chat_id=chat_id, text="❌ Selected group is invalid. Please try again.")
-                return
-
-            source_group_id, source_group_name = matching_group
-            context.user_data["source_group_id"] = source_group_id
-
-            # Update user connection with selected source group
-            update_query = "UPDATE user_connections SET source_group_id = ? WHERE connection_id = ?;"
-            execute_non_query(update_query, (source_group_id, connection_id))
+        if not query.data.startswith("source_group_"):
+            raise ValueError(f"Unexpected callback data format: {query.data}")
+        callback_group_id = query.data.replace("source_group_", "").strip()
 
+        # Validate the group against the groups the user has added to the bot
+        user_groups = await get_user_groups(user_id)
+        if not user_groups:
+            logger.warning(f"[Group Selection] No groups found for user_id {user_id}.")
             await context.bot.send_message(
                 chat_id=chat_id,
-                text=f"✅ Group '{source_group_name}' has been selected as the source group."
+                text="⚠️ No groups are configured. Please add groups and try again."
             )
-        else:
-            raise ValueError(f"Unexpected callback data format: {query.data}")
+            return
+
+        # Match the callback group_id to one in the user's groups
+        matching_group = next((group for group in user_groups if str(group[0]) == callback_group_id), None)
+        if not matching_group:
+            logger.error(f"[Group Selection] Invalid group_id {callback_group_id} for user_id {user_id}.")
+            await context.bot.send_message(chat_id=chat_id, text="❌ Selected group is invalid. Please try again.")
+            return
+
+        source_group_id, source_group_name = matching_group
+        wizard.choose_source_group(source_group_id)
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=f"✅ Group '{source_group_name}' has been selected as the source group."
+        )
 
         # Fetch topics for the selected source group
-        source_group_id = context.user_data.get("source_group_id")
-        group_topics = get_group_topics(source_group_id) if source_group_id else []
+        group_topics = await get_group_topics(source_group_id)
         if not group_topics:
             logger.warning(f"[Group Topics] No topics found for group_id {source_group_id}.")
             await context.bot.send_message(
@@ -321,9 +191,6 @@ async def handle_source_group_selection(update: Update, context: ContextTypes.DE
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
 
-        # Update user step state
-        execute_non_query(next_step, (current_step, user_id))
-
     except Exception as e:
         logger.error(f"[Group Selection Error] User {user_id} encountered an error: {e}")
         await context.bot.send_message(
@@ -331,7 +198,7 @@ async def handle_source_group_selection(update: Update, context: ContextTypes.DE
             text="❌ An unexpected error occurred. Please restart the workflow and try again."
         )
 
-def get_group_topics(group_id: int) -> list:
+async def get_group_topics(group_id: int) -> list:
     try:
         # Log the group_id received
         logger.info(f"Received group_id: {group_id} Fetching topics for group_id: {group_id} (type: {type(group_id)})")
@@ -342,7 +209,7 @@ def get_group_topics(group_id: int) -> list:
             WHERE group_id = ?;
         """
         # Ensure group_id is passed as a tuple
-        return execute_query(query=query, params=(group_id,))  # Params must be a tuple, e.g., (group_id,)
+        return await execute_query_async(query=query, params=(group_id,))  # Params must be a tuple, e.g., (group_id,)
     except Exception as e:
         # Log any errors during query execution
         logger.error(f"[Fetching Topics Error] Could not fetch topics for group_id {group_id}: {e}")
@@ -352,32 +219,23 @@ async def handle_source_topic_selection(update: Update, context: ContextTypes.DE
     query: CallbackQuery = update.callback_query
     await query.answer()
 
-    expected_step = SK_ADD4
-    current_step = SK_ADD5
-    next_step = SQL_NEXT_STEP
-
     user_id = query.from_user.id
     chat_id = update.effective_chat.id
-    connection_id = context.user_data.get("connection_id")
 
     try:
-        if not await step_checker(user_id, expected_step):
-            logger.warning(f"[STEP CHECK] User {user_id} is not in step '{expected_step}' for source topic selection.")
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="❌ Unexpected input. It seems you're not in the correct stage. Restarting the workflow."
-            )
+        wizard = await active_wizard(user_id, chat_id, SK_ADD4, context)
+        if wizard is None:
             return
 
         # Handle callback data
         if query.data == "source_topic_none":
-            context.user_data["source_topic_id"] = None
+            wizard.choose_source_topic(None)
             await context.bot.send_message(
                 chat_id=chat_id, text="✅ No source topic has been selected."
             )
         elif query.data.startswith("source_topic_"):
             callback_topic_id = query.data.replace("source_topic_", "").strip()
-            context.user_data["source_topic_id"] = int(callback_topic_id)
+            wizard.choose_source_topic(int(callback_topic_id))
             await context.bot.send_message(
                 chat_id=chat_id,
                 text="✅ Source topic has been successfully selected."
@@ -386,7 +244,7 @@ async def handle_source_topic_selection(update: Update, context: ContextTypes.DE
             raise ValueError(f"Unexpected callback data format: {query.data}")
 
         # Fetch user groups to assign target group
-        user_groups = get_user_groups(user_id)
+        user_groups = await get_user_groups(user_id)
         if not user_groups:
             await context.bot.send_message(
                 chat_id=chat_id,
@@ -405,19 +263,6 @@ async def handle_source_topic_selection(update: Update, context: ContextTypes.DE
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
 
-        # Update source_topic_id in the database
-        source_topic_id = context.user_data.get("source_topic_id")
-        update_query = """
-            UPDATE user_connections
-            SET source_topic_id = ?
-            WHERE connection_id = ?;
-        """
-        execute_non_query(update_query, (source_topic_id, connection_id))
-        logger.info(f"Updated source_topic_id {source_topic_id} for connection_id {connection_id}.")
-
-        # Update user step state
-        execute_non_query(next_step, (current_step, user_id))
-
     except Exception as e:
         logger.error(f"[Source Topic Selection Error] User {user_id} encountered an error: {e}")
         await context.bot.send_message(
@@ -429,33 +274,23 @@ async def handle_target_group_selection(update: Update, context: ContextTypes.DE
     query: CallbackQuery = update.callback_query
     await query.answer()
 
-    expected_step = SK_ADD5
-    current_step = SK_ADD6
-    next_step = SQL_NEXT_STEP
-
     user_id = query.from_user.id
     chat_id = query.message.chat.id
-    connection_id = context.user_data.get("connection_id")
 
     try:
-        if not await step_checker(user_id, expected_step):
-            logger.warning(f"[STEP CHECK] User {user_id} is not in step '{expected_step}' for target group selection.")
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="❌ Unexpected input. It seems you're not in the correct stage. Restarting the workflow."
-            )
+        wizard = await active_wizard(user_id, chat_id, SK_ADD5, context)
+        if wizard is None:
             return
 
         if query.data.startswith("target_group_"):
             callback_group_id = query.data.replace("target_group_", "").strip()
-            context.user_data["target_group_id"] = int(callback_group_id)
+            wizard.choose_target_group(int(callback_group_id))
             await context.bot.send_message(chat_id=chat_id, text="✅ Target group successfully selected.")
         else:
             raise ValueError(f"Unexpected callback data format: {query.data}")
 
         # Fetch target topics
-        target_group_id = context.user_data.get("target_group_id")
-        target_topics = get_group_topics(target_group_id) if target_group_id else []
+        target_topics = await get_group_topics(wizard.target_group_id)
         keyboard = [
             [InlineKeyboardButton(topic_name, callback_data=f"target_topic_{topic_id}")]
             for topic_id, topic_name in target_topics
@@ -467,19 +302,6 @@ async def handle_target_group_selection(update: Update, context: ContextTypes.DE
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
 
-        # Update target_group_id in the database
-        target_group_id = context.user_data.get("target_group_id")
-        update_query = """
-            UPDATE user_connections
-            SET target_group_id = ?
-            WHERE connection_id = ?;
-        """
-        execute_non_query(update_query, (target_group_id, connection_id))
-        logger.info(f"Updated target_group_id {target_group_id} for connection_id {connection_id}.")
-
-        # Update user step state
-        execute_non_query(next_step, (current_step, user_id))
-
     except Exception as e:
         logger.error(f"[Target Group Selection Error] User {user_id} encountered an error: {e}")
         await context.bot.send_message(
@@ -491,57 +313,41 @@ async def handle_target_topic_selection(update: Update, context: ContextTypes.DE
     query: CallbackQuery = update.callback_query
     await query.answer()
 
-    expected_step = SK_ADD6
-    current_step = SK_START
-    next_step = SQL_NEXT_STEP
-
     user_id = query.from_user.id
     chat_id = query.message.chat.id
-    connection_id = context.user_data.get("connection_id")
 
     try:
-        if not await step_checker(user_id, expected_step):
-            logger.warning(f"[STEP CHECK] User {user_id} is not in step '{expected_step}' for target topic selection.")
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="❌ Unexpected input. It seems you're not in the correct stage. Restarting the workflow."
-            )
+        wizard = await active_wizard(user_id, chat_id, SK_ADD6, context)
+        if wizard is None:
             return
 
         if query.data == "target_topic_none":
-            context.user_data["target_topic_id"] = None
-            await context.bot.send_message(
-                chat_id=chat_id, text="✅ No target topic has been selected."
-            )
+            wizard.choose_target_topic(None)
         elif query.data.startswith("target_topic_"):
             callback_topic_id = query.data.replace("target_topic_", "").strip()
-            context.user_data["target_topic_id"] = int(callback_topic_id)
-            await context.bot.send_message(chat_id=chat_id, text="✅ Target topic successfully selected.")
+            wizard.choose_target_topic(int(callback_topic_id))
         else:
             raise ValueError(f"Unexpected callback data format: {query.data}")
 
+        # The whole connection is written here, in a single transaction
+        try:
+            connection_id = await run_in_db_thread(wizard.commit)
+        finally:
+            discard_wizard(user_id)
+        wizard_stats["drafts_committed"] += 1
+        await refresh_route(connection_id)
+        logger.info(f"[CONNECTION] Saved connection {connection_id} '{wizard.title}' for user {user_id}.")
+
         # Complete the workflow
         await context.bot.send_message(
             chat_id=chat_id,
-            text="🎉 Connection Configuartion Complete! You can now create another connection or return to the main menu.",
+            text=f"🎉 Connection Configuartion Complete! Your connection ID is `{connection_id}`. "
+                 f"You can now create another connection or return to the main menu.",
             reply_markup=InlineKeyboardMarkup([
                 [InlineKeyboardButton("Return to Main Menu", callback_data="main_menu")]
             ])
         )
 
-        # Update target_topic_id in the database
-        target_topic_id = context.user_data.get("target_topic_id")
-        update_query = """
-            UPDATE user_connections
-            SET target_topic_id = ?
-            WHERE connection_id = ?;
-        """
-        execute_non_query(update_query, (target_topic_id, connection_id))
-        logger.info(f"Updated target_topic_id {target_topic_id} for connection_id {connection_id}.")
-
-        # Update user step state to reset
-        execute_non_query(next_step, (current_step, user_id))
-
     except Exception as e:
         logger.error(f"[Target Topic Selection Error] User {user_id} encountered an error: {e}")
         await context.bot.send_message(
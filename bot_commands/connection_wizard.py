@@ -0,0 +1,126 @@
+import time
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from GLOSSARY import SK_ADD1, SK_ADD3, SK_ADD4, SK_ADD5, SK_ADD6, SK_START, WIZARD_DRAFT_TTL_SECONDS
+from bot_functions.main.metrics import register_counters, register_gauge
+from database.db_manager import transaction
+
+SQL_INSERT_CONNECTION = """
+    INSERT INTO user_connections (user_id, connection_title, source_group_id, source_topic_id, target_group_id,
+                                  target_topic_id, is_active)
+    VALUES (?, ?, ?, ?, ?, ?, 1);
+"""
+
+
+class WizardStepError(Exception):
+    """Raised when a wizard is asked to take a step it is not at."""
+
+
+#### ------- [ CONNECTION WIZARD ] ------- ####
+class ConnectionWizard:
+    """
+    One user's connection while it is being built by the add connection flow.
+
+    The draft lives only in memory and moves through
+    SK_ADD1 (title) -> SK_ADD3 (source group) -> SK_ADD4 (source topic) -> SK_ADD5 (target group)
+    -> SK_ADD6 (target topic) -> SK_START (complete). Nothing is written until commit(), which
+    inserts the finished connection in one transaction, so an abandoned wizard leaves no row behind.
+    """
+
+    __slots__ = ("user_id", "step", "touched_at", "title", "source_group_id", "source_topic_id",
+                 "target_group_id", "target_topic_id")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.step = SK_ADD1
+        self.touched_at = time.monotonic()
+        self.title: Optional[str] = None
+        self.source_group_id: Optional[int] = None
+        self.source_topic_id: Optional[int] = None
+        self.target_group_id: Optional[int] = None
+        self.target_topic_id: Optional[int] = None
+
+    def _advance(self, expected_step: str, next_step: str):
+        if self.step != expected_step:
+            raise WizardStepError(f"Wizard for user {self.user_id} is at '{self.step}', not '{expected_step}'")
+        self.step = next_step
+
+    def set_title(self, title: str):
+        self._advance(SK_ADD1, SK_ADD3)
+        self.title = title
+
+    def choose_source_group(self, group_id: int):
+        self._advance(SK_ADD3, SK_ADD4)
+        self.source_group_id = group_id
+
+    def choose_source_topic(self, topic_id: Optional[int]):
+        self._advance(SK_ADD4, SK_ADD5)
+        self.source_topic_id = topic_id
+
+    def choose_target_group(self, group_id: int):
+        self._advance(SK_ADD5, SK_ADD6)
+        self.target_group_id = group_id
+
+    def choose_target_topic(self, topic_id: Optional[int]):
+        self._advance(SK_ADD6, SK_START)
+        self.target_topic_id = topic_id
+
+    def commit(self) -> int:
+        """
+        Inserts the finished connection. Blocking; run it on the DB thread.
+        Returns the new connection_id.
+        """
+        if self.step != SK_START:
+            raise WizardStepError(f"Wizard for user {self.user_id} is incomplete (at '{self.step}')")
+        with transaction() as cursor:
+            cursor.execute(SQL_INSERT_CONNECTION, (self.user_id, self.title, self.source_group_id,
+                                                   self.source_topic_id, self.target_group_id, self.target_topic_id))
+            return cursor.lastrowid
+
+
+#### ------- [ ACTIVE WIZARDS ] ------- ####
+# user_id -> that user's wizard, least recently touched first. Every draft shares one TTL, so the
+# front of the dict is always the next to expire and eviction only ever pops from there.
+_wizards: OrderedDict[int, ConnectionWizard] = OrderedDict()
+
+wizard_stats = Counter()
+register_counters("wizard", wizard_stats)
+register_gauge("wizard_active_drafts", "Connections being built in the add connection wizard", lambda: len(_wizards))
+
+
+def start_wizard(user_id: int) -> ConnectionWizard:
+    """Starts a new wizard for the user, replacing any draft they already had."""
+    _evict_expired(time.monotonic())
+    if _wizards.pop(user_id, None) is not None:
+        wizard_stats["drafts_replaced"] += 1
+
+    wizard = _wizards[user_id] = ConnectionWizard(user_id)
+    wizard_stats["drafts_started"] += 1
+    return wizard
+
+
+def get_wizard(user_id: int) -> Optional[ConnectionWizard]:
+    """Returns the user's wizard and marks it as used, or None if they have none or it expired."""
+    now = time.monotonic()
+    _evict_expired(now)
+    wizard = _wizards.get(user_id)
+    if wizard is not None:
+        wizard.touched_at = now
+        _wizards.move_to_end(user_id)
+    return wizard
+
+
+def discard_wizard(user_id: int):
+    """Forgets the user's wizard once its connection is committed (or the user starts over)."""
+    _wizards.pop(user_id, None)
+
+
+def _evict_expired(now: float):
+    cutoff = now - WIZARD_DRAFT_TTL_SECONDS
+    while _wizards:
+        user_id, wizard = next(iter(_wizards.items()))
+        if wizard.touched_at > cutoff:
+            break
+        del _wizards[user_id]
+        wizard_stats["drafts_expired"] += 1
@@ -0,0 +1,146 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Optional
+
+#### ------- [ LOGGER NAMES ] ------- ####
+ROOT_LOGGER_NAME = "fwedbot"
+
+
+def get_logger(subsystem: str) -> logging.Logger:
+    """
+    Returns the logger for a subsystem (e.g. "database", "forwarding"), a child of the bot's
+    root logger, so its level can be set on its own through LOG_LEVELS in GLOSSARY.
+    """
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{subsystem}")
+
+
+#### ------- [ FORMATTERS ] ------- ####
+class UTF8Encoder(logging.StreamHandler):
+    def __init__(self, stream=None):
+        if stream is None:
+            # Ensure the default stream is stdout
+            stream = sys.stdout
+        # No need to manually re-wrap the stream with open()
+        super().__init__(stream)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as a single JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+#### ------- [ OFF-LOOP OUTPUT ] ------- ####
+# Callers only put records on a queue; a listener thread formats and writes them,
+# so a slow stdout or disk never stalls the event loop.
+_listener: Optional[logging.handlers.QueueListener] = None
+_traceback_formatter = logging.Formatter()
+
+
+class DeferredFormatQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler that only resolves the message on the calling thread (its args may change
+    once the call returns) and leaves timestamps, layout and JSON encoding to the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks cannot be pickled or kept alive safely, so render them now
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(level: str = "INFO", subsystem_levels: Optional[dict] = None, json_output: bool = False,
+                      log_file: Optional[str] = None, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5):
+    """
+    Routes all logging through a QueueHandler drained by a background QueueListener.
+
+    Args:
+        level (str): Level for the root logger and the bot's own loggers.
+        subsystem_levels (dict): Subsystem name -> level, overriding `level` for that subsystem.
+        json_output (bool): Write one JSON object per line instead of plain text.
+        log_file (str): Also write to this file, rotated once it reaches `max_bytes`.
+        max_bytes (int): Size at which the log file is rotated.
+        backup_count (int): Number of rotated log files to keep.
+    """
+    global _listener
+    stop_logging()
+
+    formatter = JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT)
+    handlers = [UTF8Encoder()]
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes,
+                                                             backupCount=backup_count, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredFormatQueueHandler(log_queue))
+    root.setLevel(level)
+
+    logging.getLogger(ROOT_LOGGER_NAME).setLevel(level)
+    for subsystem, subsystem_level in (subsystem_levels or {}).items():
+        get_logger(subsystem).setLevel(subsystem_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Writes out any queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+#### ------- [ SAMPLING ] ------- ####
+class LogSampler:
+    """
+    Lets one in every `every` occurrences of a high-volume log line through.
+
+    Usage:
+        suppressed = sampler.sample()
+        if suppressed:
+            logger.info("... (%s occurrences)", suppressed)
+    """
+
+    __slots__ = ("every", "_count")
+
+    def __init__(self, every: int):
+        self.every = max(1, every)
+        self._count = 0
+
+    def sample(self) -> int:
+        """Counts an occurrence; returns how many occurrences to report now, or 0 to stay quiet."""
+        self._count += 1
+        if self._count < self.every:
+            return 0
+        count, self._count = self._count, 0
+        return count
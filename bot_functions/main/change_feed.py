@@ -0,0 +1,119 @@
+import asyncio
+from collections import Counter
+from typing import Optional
+
+from GLOSSARY import CHANGE_FEED_POLL_INTERVAL_SECONDS, CHANGE_FEED_FULL_RELOAD_THRESHOLD, CHANGE_LOG_MAX_ROWS
+from bot_functions.helpers.log_setup import get_logger
+from bot_functions.main.metrics import register_counters
+from bot_functions.main.routing import refresh_route, reload_routing_table_async
+from database.db_manager import get_connection, run_in_db_thread
+from database.user_state_store import forget_user
+
+logger = get_logger("change_feed")
+
+SQL_GET_CHANGES = """
+    SELECT change_id, table_name, row_id
+    FROM change_log
+    WHERE change_id > ?
+    ORDER BY change_id;
+"""
+
+#### ------- [ CROSS-PROCESS CHANGE FEED ] ------- ####
+# Other processes (a second bot, an admin running db_bulk_tool or a removal) write the same
+# database file. Triggers record every write to a cached table in change_log (migration 6).
+# The feed checks PRAGMA data_version, which only moves when another connection commits, so an
+# idle poll is a single pragma on the DB thread. Only when it moves are the new change_log rows
+# read and the affected connections / user states patched in memory.
+_last_change_id = 0
+_data_version: Optional[int] = None
+_poll_task: Optional[asyncio.Task] = None
+
+change_feed_stats = Counter()
+register_counters("change_feed", change_feed_stats)
+
+
+def _read_changes(last_change_id: int) -> tuple[Optional[list[tuple]], bool]:
+    """
+    Runs on the DB thread. Returns (new changes, or None if no other connection committed since
+    the last poll, and whether change_log was pruned past `last_change_id`). The first poll
+    always reads change_log, since there is no data_version to compare with yet.
+    """
+    global _data_version
+    conn = get_connection()
+    data_version = conn.execute("PRAGMA data_version;").fetchone()[0]
+    if data_version == _data_version:
+        return None, False
+    _data_version = data_version
+
+    changes = conn.execute(SQL_GET_CHANGES, (last_change_id,)).fetchall()
+    oldest = conn.execute("SELECT MIN(change_id) FROM change_log;").fetchone()[0]
+    return changes, oldest is not None and oldest > last_change_id + 1
+
+
+def prepare_change_feed():
+    """
+    Trims change_log to its newest CHANGE_LOG_MAX_ROWS rows and starts the feed after the latest
+    change. Call it at startup before the caches are loaded, so no change can fall in between.
+    """
+    global _last_change_id
+    conn = get_connection()
+    conn.execute("DELETE FROM change_log WHERE change_id <= (SELECT MAX(change_id) FROM change_log) - ?;",
+                 (CHANGE_LOG_MAX_ROWS,))
+    _last_change_id = conn.execute("SELECT COALESCE(MAX(change_id), 0) FROM change_log;").fetchone()[0]
+
+
+async def poll_changes() -> int:
+    """
+    Applies changes other processes made since the last poll and returns how many were read.
+    Connections are re-read individually, or the routing table is reloaded whole when the feed
+    has fallen behind a prune or a bulk change touched many of them.
+    """
+    global _last_change_id
+    change_feed_stats["polls"] += 1
+    changes, pruned = await run_in_db_thread(_read_changes, _last_change_id)
+    if not changes:
+        return 0
+
+    connection_ids = set()
+    for _change_id, table_name, row_id in changes:
+        if table_name == "user_connections":
+            connection_ids.add(row_id)
+        elif table_name == "user_states":
+            forget_user(row_id)  # Re-read from user_states on next use
+
+    if pruned or len(connection_ids) > CHANGE_FEED_FULL_RELOAD_THRESHOLD:
+        await reload_routing_table_async()
+        change_feed_stats["full_reloads"] += 1
+    else:
+        for connection_id in connection_ids:
+            await refresh_route(connection_id)
+
+    _last_change_id = changes[-1][0]
+    change_feed_stats["changes_applied"] += len(changes)
+    logger.info("[Change Feed] Applied %s change(s) from other processes (%s connection(s)).",
+                len(changes), len(connection_ids))
+    return len(changes)
+
+
+async def start_change_feed():
+    """Starts polling for changes made by other processes."""
+    global _poll_task
+    if _poll_task is None and CHANGE_FEED_POLL_INTERVAL_SECONDS > 0:
+        _poll_task = asyncio.create_task(_poll_periodically(), name="change-feed")
+
+
+async def stop_change_feed():
+    global _poll_task
+    if _poll_task is not None:
+        _poll_task.cancel()
+        await asyncio.gather(_poll_task, return_exceptions=True)
+        _poll_task = None
+
+
+async def _poll_periodically():
+    while True:
+        await asyncio.sleep(CHANGE_FEED_POLL_INTERVAL_SECONDS)
+        try:
+            await poll_changes()
+        except Exception as poll_error:
+            logger.error("[Change Feed] Failed to apply changes: %s", poll_error, exc_info=True)
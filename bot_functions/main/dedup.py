@@ -0,0 +1,84 @@
+import sqlite3
+from collections import Counter
+from typing import Optional
+
+from GLOSSARY import FORWARD_DEDUP_WINDOW_SECONDS
+from bot_functions.main.metrics import register_counters
+
+SQL_RECORD_ADDRESS = """
+    INSERT INTO recent_forwards (target_group_id, target_topic_id, address, forwarded_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT DO UPDATE SET forwarded_at = excluded.forwarded_at WHERE forwarded_at <= ?
+    RETURNING address;
+"""
+SQL_FORGET_ROW_ADDRESSES = """
+    DELETE FROM recent_forwards
+    WHERE (target_group_id, target_topic_id, address) IN (
+        SELECT outbox.chat_id, COALESCE(outbox.topic_id, 0), json_extract(entry.value, '$.address')
+        FROM outbox, json_each(outbox.addresses) AS entry
+        WHERE outbox.outbox_id = ?
+    );
+"""
+SQL_PRUNE = "DELETE FROM recent_forwards WHERE forwarded_at <= ?;"
+
+#### ------- [ FORWARD DE-DUPLICATION WINDOW ] ------- ####
+# When each CA was last forwarded to each target, in the recent_forwards table, so the window holds
+# for the bot as a whole however many worker processes forward to a target. The outbox applies it
+# in the transaction that writes a forward or digest entry, which records the CAs it lets through.
+
+# Suppression counters, see get_dedup_stats()
+dedup_stats = Counter()
+register_counters("dedup", dedup_stats)
+
+
+def filter_new_addresses(cursor: sqlite3.Cursor, target_group_id: int, target_topic_id: Optional[int],
+                         addresses: list, now: float) -> list:
+    """
+    Drops addresses already forwarded to this target within the de-duplication window
+    and records the remaining ones as forwarded. Runs in the transaction writing the forward.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor of the outbox's write transaction.
+        target_group_id (int): The target group.
+        target_topic_id (Optional[int]): The target topic, if any.
+        addresses (list): Dictionaries of addresses and their types, as returned by the extractor.
+        now (float): The current unix time.
+
+    Returns:
+        list: The addresses that should still be forwarded to this target.
+    """
+    if FORWARD_DEDUP_WINDOW_SECONDS <= 0:
+        return addresses
+
+    new_addresses = []
+    for address in addresses:
+        recorded = cursor.execute(SQL_RECORD_ADDRESS, (target_group_id, target_topic_id or 0, address["address"], now,
+                                                       now - FORWARD_DEDUP_WINDOW_SECONDS)).fetchall()
+        if recorded:
+            new_addresses.append(address)
+        else:
+            dedup_stats["addresses_suppressed"] += 1
+
+    if addresses and not new_addresses:
+        dedup_stats["forwards_suppressed"] += 1
+    elif len(new_addresses) < len(addresses):
+        dedup_stats["forwards_folded"] += 1
+
+    return new_addresses
+
+
+def forget_row_addresses(cursor: sqlite3.Cursor, outbox_id: int):
+    """
+    Removes the addresses of an outbox row from the window again, e.g. when it was dead-lettered,
+    so a later call of them is forwarded.
+    """
+    cursor.execute(SQL_FORGET_ROW_ADDRESSES, (outbox_id,))
+
+
+def prune_recent_forwards(cursor: sqlite3.Cursor, now: float) -> int:
+    """Deletes the forwards that are past the de-duplication window."""
+    return cursor.execute(SQL_PRUNE, (now - max(FORWARD_DEDUP_WINDOW_SECONDS, 0),)).rowcount
+
+
+def get_dedup_stats() -> dict:
+    """Returns the suppression counters."""
+    return dict(dedup_stats)
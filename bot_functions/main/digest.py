@@ -0,0 +1,174 @@
+import json
+import sqlite3
+import time
+from typing import Optional
+
+from telegram import Bot
+from GLOSSARY import DIGEST_MAX_ADDRESSES, TELEGRAM_MESSAGE_LIMIT
+from bot_functions.helpers.log_setup import get_logger
+from bot_functions.main.outbox import enqueue_for_digest, flush_outbox, register_claim_step, claim_soon
+from bot_functions.main.templates import escape_markdown, render_link
+from database.db_manager import transaction, run_in_db_thread
+
+logger = get_logger("forwarding")
+
+# Targets with a due entry, or enough addresses waiting to send early. Only scans the partial index
+# of entries waiting for a digest, which holds one window's worth of CAs.
+SQL_DUE_DIGESTS = """
+    SELECT chat_id, topic_id FROM outbox
+    WHERE kind = 'digest' AND status = 'pending'
+    GROUP BY chat_id, topic_id
+    HAVING MIN(due_at) <= ? OR SUM(json_array_length(addresses)) >= ?;
+"""
+SQL_DIGEST_ENTRIES = """
+    SELECT outbox_id, addresses, title FROM outbox
+    WHERE kind = 'digest' AND status = 'pending' AND chat_id = ? AND topic_id IS ?
+    ORDER BY outbox_id;
+"""
+SQL_INSERT_PART = """
+    INSERT INTO outbox (idempotency_key, chat_id, topic_id, text, parse_mode, status, due_at, created_at, addresses)
+    VALUES (?, ?, ?, ?, 'Markdown', 'pending', ?, ?, ?)
+    ON CONFLICT(idempotency_key) DO NOTHING;
+"""
+SQL_MARK_MERGED = "UPDATE outbox SET status = 'merged' WHERE outbox_id = ?;"
+SQL_ALL_DUE = "UPDATE outbox SET due_at = ? WHERE kind = 'digest' AND status = 'pending' AND due_at > ?;"
+
+#### ------- [ DIGEST ENTRIES ] ------- ####
+# A CA for a digest connection is written to the outbox as an entry, due when its connection's
+# window ends, so it survives a crash like any forward. The process sending the outbox merges all
+# of a target's entries into the digest messages as soon as one of them is due (or they hold
+# DIGEST_MAX_ADDRESSES), in the transaction that claims rows to send. Entries from every process
+# meet there, so a target gets one digest however many worker processes fed it, and no address
+# waits longer than its own connection's window, whichever connections share the target.
+
+
+def add_to_digest(bot: Bot, source_group_id: int, source_message_id: int, target_group_id: int,
+                  target_topic_id: Optional[int], connection_title: str, addresses: list, window_seconds: int):
+    """Queues addresses from a source message for the target's next digest, due in `window_seconds`."""
+    enqueue_for_digest(bot, f"digest-entry:{source_group_id}:{source_message_id}:{target_group_id}:"
+                            f"{target_topic_id or 0}", target_group_id, target_topic_id,
+                       connection_title or "Unnamed Connection", addresses, window_seconds)
+
+
+def merge_due_digests(cursor: sqlite3.Cursor, now: float) -> int:
+    """
+    Runs in the outbox's claim transaction: turns the entries of every target whose digest is due
+    into digest messages, due now. Returns the number of messages.
+    """
+    merged = 0
+    for target_group_id, target_topic_id in cursor.execute(SQL_DUE_DIGESTS, (now, DIGEST_MAX_ADDRESSES)).fetchall():
+        entries = cursor.execute(SQL_DIGEST_ENTRIES, (target_group_id, target_topic_id)).fetchall()
+        addresses: dict[str, str] = {}  # address -> type, in order of detection
+        connection_titles: dict[str, None] = {}  # ordered set of source connection names
+        for _, entry_addresses, title in entries:
+            for address in json.loads(entry_addresses):
+                addresses.setdefault(address["address"], address["type"])
+            connection_titles[title] = None
+
+        parts = format_digest_messages(addresses, list(connection_titles))
+        # Every part carries all of the digest's addresses, to release them if it is dead-lettered
+        flushed_addresses = json.dumps([{"address": address, "type": address_type}
+                                        for address, address_type in addresses.items()])
+        first_entry = entries[0][0]
+        cursor.executemany(SQL_INSERT_PART, [
+            (f"digest:{target_group_id}:{target_topic_id or 0}:{first_entry}:{index}", target_group_id,
+             target_topic_id, part, now, now, flushed_addresses)
+            for index, part in enumerate(parts)
+        ])
+        cursor.executemany(SQL_MARK_MERGED, [(entry[0],) for entry in entries])
+        merged += len(parts)
+        logger.info("[Digest] Queued digest of %s address(es) in %s message(s) for Target (%s, %s).",
+                    len(addresses), len(parts), target_group_id, target_topic_id)
+    return merged
+
+
+register_claim_step(merge_due_digests)
+
+
+def _make_all_due(now: float):
+    with transaction() as cursor:
+        cursor.execute(SQL_ALL_DUE, (now, now))
+
+
+async def flush_all_digests():
+    """Makes every waiting digest due now, e.g. before shutting down."""
+    await flush_outbox()  # This process's entries first
+    await run_in_db_thread(_make_all_due, time.time())
+    claim_soon()
+
+
+#### ------- [ DIGEST FORMATTING ] ------- ####
+FOOTER_BUDGET_SHARE = 0.25  # The source names never take more of a message than this; the rest are counted
+
+def format_digest_messages(addresses: dict[str, str], connection_titles: list,
+                           limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    """
+    Formats buffered addresses as one message grouped by PumpFun/Regular, split into several
+    messages at line boundaries if it would exceed Telegram's length limit.
+
+    Args:
+        addresses (dict): Address -> type ("PumpFun" or "Regular"), in order of detection.
+        connection_titles (list): Names of the source connections that contributed.
+        limit (int): Maximum message length.
+
+    Returns:
+        list: The message texts, in send order.
+    """
+    header = f"📩 **New Alpha Digest!** ({len(addresses)} CAs)"
+    budget = limit - len("(99/99) ")  # Room for the part counter if the digest has to be split
+    footer = _format_footer(connection_titles, int(budget * FOOTER_BUDGET_SHARE))
+    sections = [
+        ("\n🚀 PumpFun:", [render_link(address) for address, kind in addresses.items() if kind == "PumpFun"]),
+        ("\n🚀 Regular:", [render_link(address) for address, kind in addresses.items() if kind == "Regular"]),
+    ]
+    longest_addition = max((_telegram_length(title) + _telegram_length(link) + 2
+                            for title, links in sections for link in links), default=0)
+    assert _telegram_length(header) + _telegram_length(footer) + longest_addition <= budget, \
+        "A digest message must have room for at least one link"
+    parts = []
+    lines = [header]
+    size = _telegram_length(header) + _telegram_length(footer)
+    for title, links in sections:
+        section_open = False
+        for link in links:
+            addition = [link] if section_open else [title, link]
+            addition_size = sum(_telegram_length(line) + 1 for line in addition)
+
+            # Start a new message rather than cutting through a link
+            if size + addition_size > budget and len(lines) > 1:
+                parts.append("\n".join(lines) + footer)
+                lines = [header]
+                size = _telegram_length(header) + _telegram_length(footer)
+                addition = [title, link]
+                addition_size = sum(_telegram_length(line) + 1 for line in addition)
+
+            lines.extend(addition)
+            size += addition_size
+            section_open = True
+
+    if len(lines) > 1:
+        parts.append("\n".join(lines) + footer)
+
+    if len(parts) > 1:
+        parts = [f"({index}/{len(parts)}) {part}" for index, part in enumerate(parts, start=1)]
+    return parts
+
+
+def _format_footer(connection_titles: list, max_length: int) -> str:
+    """The source names line, listing as many names as fit in `max_length` and counting the rest."""
+    prefix = "\n\n🔗 **Source Connection Names**: "
+    names = [escape_markdown(title) for title in connection_titles]
+    for shown in range(len(names), -1, -1):
+        hidden = len(names) - shown
+        listed = ", ".join(names[:shown])
+        if hidden:
+            listed = f"{listed} and {hidden} more" if shown else f"{hidden} connections"
+        footer = prefix + listed
+        if _telegram_length(footer) <= max_length:
+            return footer
+    return prefix.rstrip()
+
+
+def _telegram_length(text: str) -> int:
+    # Telegram counts message length in UTF-16 code units
+    return len(text.encode("utf-16-le")) // 2
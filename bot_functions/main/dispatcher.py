@@ -0,0 +1,50 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from GLOSSARY import SK_ADD1, SK_ADD3
+from bot_commands.add_connection import handle_title, handle_ids
+from bot_commands.connection_wizard import get_wizard
+from bot_functions.helpers.log_setup import get_logger
+from bot_functions.main.forwarding import detect_and_forward
+from bot_functions.main.metrics import pipeline_stats
+
+logger = get_logger("dispatcher")
+
+#### ------- [ TEXT MESSAGE DISPATCH ] ------- ####
+GROUP_CHAT_TYPES = frozenset(("group", "supergroup"))
+
+# Wizard step -> handler for free text a user sends in private at that step
+PRIVATE_TEXT_HANDLERS = {
+    SK_ADD1: handle_title,  # Naming a new connection
+    SK_ADD3: handle_ids,  # Re-shows the source group picker
+}
+
+
+async def dispatch_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    The single handler for non-command text messages.
+    Group messages go straight to the forwarding pipeline without any user-state lookup;
+    private messages go to the handler for the step of the user's add connection wizard, if they have one.
+    """
+    message = update.message
+    if message is None or not message.text:
+        return
+    pipeline_stats["messages_seen"] += 1
+
+    chat_type = message.chat.type
+    if chat_type in GROUP_CHAT_TYPES:
+        await detect_and_forward(update, context)
+        return
+
+    if chat_type != "private":
+        logger.debug("[Dispatch] Ignored message from Chat ID %s, Chat Type %s.", message.chat_id, chat_type)
+        return
+
+    user_id = update.effective_user.id
+    wizard = get_wizard(user_id)
+    handler = PRIVATE_TEXT_HANDLERS.get(wizard.step) if wizard else None
+    if handler is None:
+        logger.debug("[Dispatch] Ignored private message from user %s outside the wizard's text steps.", user_id)
+        return
+
+    await handler(update, context)
@@ -1,17 +1,29 @@
 import re
+import time
+from collections import Counter
+from functools import lru_cache
 from typing import Optional
 
+from solders.pubkey import Pubkey
 from telegram import Update
 from telegram.ext import ContextTypes
-from GLOSSARY import logger
-from bot_functions.helpers.helpers import get_current_step_from_db
-from database.db_manager import execute_query
+from GLOSSARY import ADDRESS_VALIDATION_CACHE_SIZE, LOG_NO_ADDRESS_SAMPLE_EVERY
+from bot_functions.helpers.log_setup import get_logger, LogSampler
+from bot_functions.main.digest import add_to_digest
+from bot_functions.main.metrics import EXTRACTION_SECONDS, ROUTING_SECONDS, FORMATTING_SECONDS, register_counters
+from bot_functions.main.routing import get_routes_for_source
+from bot_functions.main.outbox import enqueue
+from bot_functions.main.templates import compile_template, UNATTRIBUTED_TEMPLATE
+
+logger = get_logger("forwarding")
+# Most group messages carry no CA, so that line is only logged once per LOG_NO_ADDRESS_SAMPLE_EVERY messages
+no_address_sampler = LogSampler(LOG_NO_ADDRESS_SAMPLE_EVERY)
 
 
 async def detect_and_forward(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Detects coin addresses in a message and forwards the message exclusively
-    to the preconfigured target destination if valid coin addresses are found.
+    Detects coin addresses in a message and forwards the message to every
+    preconfigured target destination of the source if valid coin addresses are found.
     """
     # Ensure the message contains valid text
     if not update.message or not update.message.text:
@@ -20,115 +32,105 @@ async def detect_and_forward(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # Step 1: Extract message details
     source_group_id = update.message.chat_id
     source_topic_id = update.message.message_thread_id  # Topic ID for thread-enabled chats
+    source_message_id = update.message.message_id
     message_text = update.message.text.strip()
 
     # Step 2: Detect valid coin addresses in the message
+    started = time.perf_counter()
     detected_address = extract_coin_address_with_types(message_text)
+    EXTRACTION_SECONDS.observe(time.perf_counter() - started)
 
     # Validate detection results
     if not isinstance(detected_address, list):
         logger.error("[Detect And Forward] Invalid return from extract_coin_addresses_with_types.")
         return
     if not detected_address:
-        logger.info("[Detect And Forward] No valid coin addresses detected in the message.")
+        sampled_count = no_address_sampler.sample()
+        if sampled_count:
+            logger.info("[Detect And Forward] No valid coin addresses detected in %s message(s).", sampled_count)
         return  # Stop if no addresses are found
 
-    # Step 3: Format the message with detected addresses
-    formatted_message = format_forwarded_message_with_hyperlinks(detected_address)
-
-    # Step 4: Retrieve the configured target for this source group/topic
-    connection = get_connection_for_source(source_group_id, source_topic_id)
+    # Step 3: Retrieve the configured targets for this source group/topic
+    started = time.perf_counter()
+    connections = get_connections_for_source(source_group_id, source_topic_id)
+    ROUTING_SECONDS.observe(time.perf_counter() - started)
 
-    if not connection:
-        logger.info(
+    if not connections:
+        logger.debug(
             "[Detect And Forward] No configured destination for source: Group ID %s, Topic ID %s",
             source_group_id, source_topic_id
         )
         return
 
+    # Step 4: Put a forward for every target in the outbox; each send handles its own failures
+    for connection in connections:
+        forward_to_target(context, connection, detected_address, source_group_id, source_topic_id, source_message_id)
+
+def forward_to_target(context: ContextTypes.DEFAULT_TYPE, connection: tuple, detected_address: list,
+                      source_group_id: int, source_topic_id: Optional[int], source_message_id: int):
+    """
+    Formats the detected addresses for a single target connection and queues the send in the outbox.
+    Send errors are handled by the outbox so one bad target does not affect the others.
+    """
     # Unpack connection details
-    target_group_id, target_topic_id, connection_title = connection
+    target_group_id, target_topic_id, connection_title, digest_window_seconds = connection
 
-    # Step 5: Forward the message to the exclusive target destination
-    try:
-        # Attribute the message with the connection title
-        attributed_message = (
-            f"{formatted_message}\n\n🔗 **Source Connection Name**: {connection_title or 'Unnamed Connection'}"
-        )
+    # Addresses this target already received within the de-duplication window (from any process)
+    # are dropped by the outbox as it writes the forward or digest entry
 
-        # Forward message to a topic or group
-        if target_topic_id:
-            await context.bot.send_message(
-                chat_id=target_group_id,
-                text=attributed_message,
-                message_thread_id=target_topic_id,
-                parse_mode="Markdown"  # Telegram Markdown to support clickable links
-            )
-        else:
-            await context.bot.send_message(
-                chat_id=target_group_id,
-                text=attributed_message,
-                parse_mode="Markdown"
-            )
-
-        # Log success
-        logger.info(
-            "[Detect And Forward] Message successfully forwarded from Source (%s, %s) to Target (%s, %s).",
-            source_group_id, source_topic_id, target_group_id, target_topic_id
-        )
+    # Digest connections queue their CAs for one combined message per window
+    if digest_window_seconds:
+        add_to_digest(context.bot, source_group_id, source_message_id, target_group_id, target_topic_id,
+                      connection_title, detected_address, digest_window_seconds)
+        return
+
+    # Format the addresses with the connection's compiled template (escaped attribution included)
+    template = compile_template(connection_title)
+    started = time.perf_counter()
+    attributed_message = template.render(detected_address)
+    FORMATTING_SECONDS.observe(time.perf_counter() - started)
 
-    except Exception as forward_error:
+    def on_dead(forward_error: Exception):
+        # The outbox lets a later call of the same CAs through, since this one never arrived
         logger.error(
-            "[Detect And Forward] Error while forwarding message: %s",
-            forward_error, exc_info=True
+            "[Detect And Forward] Gave up forwarding message from Source (%s, %s) to Target (%s, %s): %s",
+            source_group_id, source_topic_id, target_group_id, target_topic_id, forward_error
         )
 
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """
-    Handles incoming messages and filters based on user state or group context.
-    """
-    user_id = update.effective_user.id
-    chat_type = update.message.chat.type  # Determine if it's a group/private chat
-
-    # Handle messages in Source Groups WITHOUT step checking
-    if chat_type in ["group", "supergroup"]:
-        logger.info(
-            "[GROUP MESSAGE] Processing message in source group: Chat ID %s",
-            update.message.chat_id
-        )
-        # Send the message directly to the forwarding function
-        await detect_and_forward(update, context)  # Skip step validation
-        return
+    # Forward message to a topic or group; the same source message is only ever forwarded once per target
+    enqueue(
+        context.bot,
+        f"forward:{source_group_id}:{source_message_id}:{target_group_id}:{target_topic_id or 0}",
+        chat_id=target_group_id,
+        text=attributed_message,
+        topic_id=target_topic_id,
+        parse_mode="Markdown",  # Telegram Markdown to support clickable links
+        on_dead=on_dead,
+        addresses=detected_address,
+        render=template.render,  # Without the addresses the window drops
+    )
 
-    # Handle private messages WITH step validation
-    if chat_type == "private":
-        # Fetch the current step for the user
-        current_step = get_current_step_from_db(user_id)
-        logger.info("[STEP CHECK] User %s current step in DB: '%s'", user_id, current_step)
-
-        # Process only if the user is in the required step
-        if current_step != "adding_connection":
-            logger.info(
-                "[STEP CHECK] Ignored message from user %s not in step 'adding_connection'.",
-                user_id
-            )
-            return  # Ignore private message if step doesn't match
-
-        # Handle private message further (e.g., process connection adding)
-        logger.info("[PRIVATE MESSAGE] Processing user %s's private message in step '%s'.", user_id, current_step)
-
-    # Log unexpected chat types
-    else:
-        logger.warning(
-            "[UNKNOWN CHAT TYPE] Ignored message from Chat ID %s, Chat Type %s.",
-            update.message.chat_id, chat_type
-        )
+    logger.info(
+        "[Detect And Forward] Message queued for forwarding from Source (%s, %s) to Target (%s, %s).",
+        source_group_id, source_topic_id, target_group_id, target_topic_id
+    )
 
 #### ------- [ Forwarding Function Helper ] ------- ####
 
+# Solana addresses are 32-44 base58 characters; PumpFun mints additionally end in "pump".
+MIN_ADDRESS_LENGTH = 32
+PUMPFUN_SUFFIX = "pump"
+ADDRESS_PATTERN = re.compile(r"\b[1-9A-HJ-NP-Za-km-z]{32,44}\b")
+
+# Per-stage counters for the address scanner, see get_extraction_stats()
+extraction_stats = Counter()
+register_counters("extraction", extraction_stats)
+
 def extract_coin_address_with_types(message: str) -> list:
     """
-    Extracts and classifies Solana coin addresses.
+    Extracts and classifies Solana coin addresses in a single pass.
+    Repeated addresses are only reported once, PumpFun addresses first, in order of appearance.
+    Candidates that do not decode to a 32-byte public key are dropped.
 
     Args:
         message (str): The input message.
@@ -139,30 +141,64 @@ def extract_coin_address_with_types(message: str) -> list:
     if not message or not isinstance(message, str):
         return []  # Return an empty list if the input is invalid
 
-    # Regex patterns
-    regular_pattern = r"\b[1-9A-HJ-NP-Za-km-z]{32,44}\b"
-    # noinspection SpellCheckingInspection
-    pumpfun_pattern = r"\b[1-9A-HJ-NP-Za-km-z]{28,40}pump\b"
+    extraction_stats["messages_scanned"] += 1
 
-    # Match using the regex
-    pumpfun_matches = re.findall(pumpfun_pattern, message)
-    regular_matches = re.findall(regular_pattern, message)
+    # Cheap pre-filter: an address needs an unbroken run of at least 32 characters
+    if len(message) < MIN_ADDRESS_LENGTH or max(map(len, message.split()), default=0) < MIN_ADDRESS_LENGTH:
+        extraction_stats["messages_rejected_prefilter"] += 1
+        return []
 
-    # Validation (ensure it's a real coin address - adjust further as needed)
-    min_address_length = 32
-    max_address_length = 44
+    candidates = ADDRESS_PATTERN.findall(message)
+    if not candidates:
+        extraction_stats["messages_rejected_pattern"] += 1
+        return []
 
-    pumpfun_matches = [addr for addr in pumpfun_matches if min_address_length <= len(addr) <= max_address_length]
-    regular_matches = [addr for addr in regular_matches if min_address_length <= len(addr) <= max_address_length]
+    # dicts keep first-seen order while dropping repeats
+    pumpfun_addresses = {}
+    regular_addresses = {}
+    for address in candidates:
+        if address in pumpfun_addresses or address in regular_addresses:
+            continue
 
-    results = [{"address": address, "type": "PumpFun"} for address in pumpfun_matches]
-    results.extend(
-        {"address": address, "type": "Regular"}
-        for address in regular_matches
-        if address not in pumpfun_matches
-    )
+        extraction_stats["candidates_matched"] += 1
+        if not is_valid_public_key(address):
+            extraction_stats["candidates_rejected_decode"] += 1
+            continue
+
+        if address.endswith(PUMPFUN_SUFFIX):
+            pumpfun_addresses[address] = None
+        else:
+            regular_addresses[address] = None
+
+    results = [{"address": address, "type": "PumpFun"} for address in pumpfun_addresses]
+    results.extend({"address": address, "type": "Regular"} for address in regular_addresses)
+    extraction_stats["addresses_accepted"] += len(results)
     return results
 
+@lru_cache(maxsize=ADDRESS_VALIDATION_CACHE_SIZE)
+def is_valid_public_key(candidate: str) -> bool:
+    """
+    Returns True if the candidate base58-decodes to exactly 32 bytes (an ed25519 public key).
+    Results are memoized, so popular CAs are only decoded once.
+    """
+    try:
+        Pubkey.from_string(candidate)
+    except ValueError:
+        return False
+    return True
+
+def get_extraction_stats() -> dict:
+    """
+    Returns the address scanner's per-stage counters along with the validation cache statistics.
+    """
+    cache_info = is_valid_public_key.cache_info()
+    return {
+        **extraction_stats,
+        "validation_cache_hits": cache_info.hits,
+        "validation_cache_misses": cache_info.misses,
+        "validation_cache_size": cache_info.currsize,
+    }
+
 def format_forwarded_message_with_hyperlinks(addresses_with_types: list) -> str:
     """
     Formats the forwarded message with clickable hyperlinks for detected PumpFun or Regular addresses.
@@ -171,47 +207,16 @@ def format_forwarded_message_with_hyperlinks(addresses_with_types: list) -> str:
         addresses_with_types (list): List of dictionaries containing addresses and their types.
 
     Returns:
-        str: A formatted message.
+        str: A formatted message, without the connection attribution.
     """
-    # Base referral URL template
-    referral_link_template = "https://t.me/TradeonNovaBot?start=r-CE0V7EW-{address}"
-
-    # Separate PumpFun and Regular addresses
-    pumpfun_addresses = [
-        f"[{addr['address']}]({referral_link_template.format(address=addr['address'])})"
-        for addr in addresses_with_types if addr["type"] == "PumpFun"
-    ]
-    regular_addresses = [
-        f"[{addr['address']}]({referral_link_template.format(address=addr['address'])})"
-        for addr in addresses_with_types if addr["type"] == "Regular"
-    ]
-
-    if pumpfun_addresses:
-        # If PumpFun type exists, emphasize it
-        message = "📩 **New PumpFun Alpha Found!**\n\n" + "🚀 Trade Now:\n\n" + "\n".join(pumpfun_addresses)
-    else:
-        # Otherwise, fallback to Regular
-        message = "📩 **New Alpha Found!**\n\n" + "🚀 Trade Now:\n\n" + "\n".join(regular_addresses)
-
-    return message
-
-def get_connection_for_source(source_group_id: int, source_topic_id: Optional[int] = None):
+    return UNATTRIBUTED_TEMPLATE.render(addresses_with_types)
+
+def get_connections_for_source(source_group_id: int, source_topic_id: Optional[int] = None) -> list:
     """
-    Fetch the exclusive target destination for the source group/topic from the database.
+    Fetch every target destination for the source group/topic from the in-memory routing table.
     """
     try:
-        query = """
-            SELECT target_group_id, target_topic_id, connection_title
-            FROM user_connections
-            WHERE source_group_id = ? AND (source_topic_id = ? OR source_topic_id IS NULL)
-        """
-        params = (source_group_id, source_topic_id)
-        result = execute_query(query, params)
-
-        if result:
-            return result[0]  # Exclusive rule: Return the first/only connection
-        return None
+        return get_routes_for_source(source_group_id, source_topic_id)
     except Exception as e:
-        logger.error("[Database Error] Failed to fetch connection: %s", e, exc_info=True)
-        return None
-
+        logger.error("[Routing Error] Failed to fetch connections: %s", e, exc_info=True)
+        return []
@@ -0,0 +1,263 @@
+import asyncio
+import functools
+import heapq
+import time
+from collections import Counter
+from typing import Any, Awaitable, Optional
+
+from telegram import Bot, Update
+from telegram.error import TelegramError
+
+from GLOSSARY import HANDLED_UPDATES_FLUSH_INTERVAL_SECONDS, HANDLED_MESSAGE_RETENTION_SECONDS
+from bot_functions.helpers.log_setup import get_logger
+from bot_functions.main.metrics import register_counters, register_gauge
+from bot_functions.main.outbox import when_written
+from bot_functions.main.update_processor import KeyedUpdateProcessor
+from database.db_manager import get_connection, transaction, run_in_db_thread
+
+logger = get_logger("handled_updates")
+
+TELEGRAM_UPDATE_RETENTION_SECONDS = 24 * 60 * 60  # Telegram drops updates nobody fetched after this long
+PRUNE_INTERVAL_SECONDS = 60 * 60  # How often handled messages past their retention are deleted
+
+SQL_GET_OFFSET = "SELECT last_update_id, saved_at FROM update_offset WHERE id = 1;"
+SQL_SAVE_OFFSET = """
+    INSERT INTO update_offset (id, last_update_id, saved_at) VALUES (1, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET last_update_id = excluded.last_update_id, saved_at = excluded.saved_at;
+"""
+SQL_GET_HANDLED_PAST = "SELECT chat_id, message_id FROM handled_messages WHERE update_id > ? AND handled_at > ?;"
+SQL_INSERT_HANDLED = """
+    INSERT OR IGNORE INTO handled_messages (chat_id, message_id, update_id, handled_at) VALUES (?, ?, ?, ?);
+"""
+SQL_PRUNE_HANDLED = "DELETE FROM handled_messages WHERE handled_at < ?;"
+
+#### ------- [ HANDLED UPDATES ] ------- ####
+# Telegram sends an update again until a getUpdates call confirms it, so a restart would otherwise
+# hand the previous run's last updates (or, after a crash, its whole unconfirmed backlog) to the
+# handlers again, and forward their CAs a second time. This records the update every earlier
+# update has been handled up to (updates of different chats finish out of order) and the messages
+# handled past it. At startup getUpdates confirms everything up to that offset, so it is not even
+# downloaded again, and whatever still arrives is skipped when it is not newer than the offset or
+# is a message already handled.
+#
+# An update only counts as handled once the forwards it enqueued are written to the outbox
+# (outbox.when_written), so a crash never loses a forward whose update was already recorded. CAs
+# for digest connections are outbox rows too, waiting for their digest (digest).
+#
+# Only the process receiving updates tracks them: with worker processes, workers report the
+# updates they finished back to it (sharding.WorkerShardProcessor).
+
+
+class UpdateOffset:
+    """The last update that every earlier update has been handled up to, with updates finishing out of order."""
+
+    __slots__ = ("last_update_id", "_highest", "_running", "_pending")
+
+    def __init__(self, last_update_id: int = 0):
+        self.last_update_id = last_update_id
+        self._highest = last_update_id  # The update received last
+        self._running: list[int] = []  # Heap of the update IDs being handled, finished ones popped lazily
+        self._pending: dict[int, Optional[tuple[int, int]]] = {}  # update_id -> its message key, until handled
+
+    def received(self, update_id: int, message_key: Optional[tuple[int, int]]):
+        heapq.heappush(self._running, update_id)
+        self._pending[update_id] = message_key
+        self._highest = update_id  # Not max(): update IDs restart at random after a week without updates
+
+    def finished(self, update_id: int) -> Optional[tuple[int, int]]:
+        """Marks an update as handled and returns its message key."""
+        message_key = self._pending.pop(update_id, None)
+        while self._running and self._running[0] not in self._pending:
+            heapq.heappop(self._running)
+        self.last_update_id = self._running[0] - 1 if self._running else self._highest
+        return message_key
+
+    def __contains__(self, update_id: int) -> bool:
+        return update_id in self._pending
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+_offset = UpdateOffset()
+_resumed_from = 0  # The offset the previous run stopped at; updates up to it are skipped
+_handled_before: set[tuple[int, int]] = set()  # Messages the previous run handled past that offset
+_resume_expires_at = 0.0  # After this, nothing the previous run handled can be delivered again
+_handled: list[tuple] = []  # Handled messages not yet written, as statement parameters
+_saved_offset = 0
+_flush_task: Optional[asyncio.Task] = None
+_flush_lock: Optional[asyncio.Lock] = None  # One flush at a time, so stopping waits for the writer's
+_last_prune = 0.0
+
+handled_update_stats = Counter()
+register_counters("handled_updates", handled_update_stats)
+register_gauge("handled_updates_running", "Updates received and not yet handled", lambda: len(_offset))
+
+
+def message_key(update: Update) -> Optional[tuple[int, int]]:
+    """(chat_id, message_id) of a new message. Edits and button presses reuse a message ID, so they have none."""
+    message = update.message or update.channel_post
+    return (message.chat_id, message.message_id) if message else None
+
+
+def payload_message_key(payload: dict) -> Optional[tuple[int, int]]:
+    """message_key of an update payload that has not been parsed."""
+    message = payload.get("message") or payload.get("channel_post")
+    return (message["chat"]["id"], message["message_id"]) if message else None
+
+
+def load_handled_updates() -> int:
+    """
+    Reads the offset the previous run stopped at and the messages it handled past it. Call it at
+    startup before any update is received. An offset older than Telegram keeps updates for is
+    ignored: nothing it covers can arrive again, and update IDs may restart after a quiet week.
+    """
+    global _offset, _resumed_from, _resume_expires_at, _saved_offset, _last_prune
+    now = time.time()
+    with transaction() as cursor:
+        cursor.execute(SQL_PRUNE_HANDLED, (now - HANDLED_MESSAGE_RETENTION_SECONDS,))
+    _last_prune = now
+
+    conn = get_connection()
+    saved = conn.execute(SQL_GET_OFFSET).fetchone()
+    if saved is None or now - saved[1] > TELEGRAM_UPDATE_RETENTION_SECONDS:
+        return 0
+    _resumed_from = _saved_offset = saved[0]
+    _resume_expires_at = saved[1] + TELEGRAM_UPDATE_RETENTION_SECONDS
+    _offset = UpdateOffset(_resumed_from)
+    _handled_before.update(conn.execute(SQL_GET_HANDLED_PAST,
+                                        (_resumed_from, now - HANDLED_MESSAGE_RETENTION_SECONDS)))
+    logger.info("[Handled Updates] Resuming after update %s (%s message(s) past it already handled).",
+                _resumed_from, len(_handled_before))
+    return _resumed_from
+
+
+def update_received(update_id: int, key: Optional[tuple[int, int]]) -> bool:
+    """
+    Starts tracking an update, in the order updates arrive. Returns False if the previous run
+    already handled it, in which case it must be skipped.
+    """
+    if update_id <= _resumed_from or (key is not None and key in _handled_before):
+        if time.time() < _resume_expires_at:
+            handled_update_stats["updates_skipped" if update_id <= _resumed_from else "messages_skipped"] += 1
+            return False
+        _forget_previous_run()  # A new update whose ID restarted below the old ones
+    if update_id in _offset:
+        handled_update_stats["updates_skipped"] += 1  # Delivered again while still being handled
+        return False
+    _offset.received(update_id, key)
+    return True
+
+
+def _forget_previous_run():
+    global _resumed_from
+    _resumed_from = 0
+    _handled_before.clear()
+
+
+def update_finished(update_id: int):
+    """Records that every handler is done with an update (or that it was dropped)."""
+    key = _offset.finished(update_id)
+    if key is not None:
+        _handled.append((*key, update_id, time.time()))
+
+
+async def skip_handled_updates(bot: Bot):
+    """
+    Confirms every update up to the offset the previous run stopped at, so getUpdates (or the
+    webhook) only delivers the updates after it. Call it before updates are received.
+    """
+    if not _resumed_from:
+        return
+    try:
+        await bot.get_updates(offset=_resumed_from + 1, limit=1, timeout=0)
+    except TelegramError as confirm_error:
+        # E.g. a webhook is set (webhook mode): handled updates arrive again and are skipped one by one
+        logger.info("[Handled Updates] Could not confirm the updates already handled: %s", confirm_error)
+
+
+#### ------- [ WRITING ] ------- ####
+
+def _write_handled(handled: list[tuple], last_update_id: Optional[int], now: float, prune: bool):
+    """Runs on the DB thread: records handled messages and the offset in one transaction."""
+    with transaction() as cursor:
+        cursor.executemany(SQL_INSERT_HANDLED, handled)
+        if last_update_id is not None:
+            cursor.execute(SQL_SAVE_OFFSET, (last_update_id, now))
+        if prune:
+            cursor.execute(SQL_PRUNE_HANDLED, (now - HANDLED_MESSAGE_RETENTION_SECONDS,))
+
+
+async def flush_handled_updates():
+    """Writes the messages handled since the last flush, and the offset if it moved."""
+    global _handled, _saved_offset, _last_prune
+    if _flush_lock is None:
+        return  # Never started, so nothing was received
+    async with _flush_lock:
+        last_update_id = _offset.last_update_id
+        if not _handled and last_update_id == _saved_offset:
+            return
+        handled, _handled = _handled, []
+        now = time.time()
+        prune = now - _last_prune > PRUNE_INTERVAL_SECONDS
+        try:
+            await run_in_db_thread(_write_handled, handled,
+                                   last_update_id if last_update_id != _saved_offset else None, now, prune)
+        except Exception:
+            _handled[:0] = handled  # Keep them for the next flush
+            raise
+        _saved_offset = last_update_id
+        if prune:
+            _last_prune = now
+        handled_update_stats["messages_recorded"] += len(handled)
+
+
+async def _flush_periodically():
+    while True:
+        await asyncio.sleep(HANDLED_UPDATES_FLUSH_INTERVAL_SECONDS)
+        try:
+            await asyncio.shield(flush_handled_updates())  # Finishes even if stop_handled_updates cancels this
+        except Exception as write_error:
+            logger.error("[Handled Updates] Failed to record handled updates: %s", write_error, exc_info=True)
+
+
+async def start_handled_updates():
+    """Starts recording handled updates in the background."""
+    global _flush_task, _flush_lock
+    if _flush_task is None:
+        _flush_lock = asyncio.Lock()
+        _flush_task = asyncio.create_task(_flush_periodically(), name="handled-updates-writer")
+
+
+async def stop_handled_updates():
+    """Stops the background writer and records what was handled since its last run."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        await asyncio.gather(_flush_task, return_exceptions=True)
+        _flush_task = None
+    await flush_handled_updates()
+    if len(_offset):
+        logger.warning("[Handled Updates] Stopped with %s update(s) unfinished, they are handled after the restart.",
+                       len(_offset))
+
+
+#### ------- [ UPDATE PROCESSOR ] ------- ####
+class ResumingUpdateProcessor(KeyedUpdateProcessor):
+    """
+    The update processor of a bot receiving its own updates: skips the updates the previous run
+    already handled and tracks the ones it handles, like the receiving process does for workers.
+    """
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Runs first thing in the update's task, so updates are received in the order they arrived
+        if isinstance(update, Update):
+            if not update_received(update.update_id, message_key(update)):
+                coroutine.close()
+                return
+            try:
+                await super().process_update(update, coroutine)
+            finally:
+                when_written(functools.partial(update_finished, update.update_id))
+        else:
+            await super().process_update(update, coroutine)
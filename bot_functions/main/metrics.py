@@ -0,0 +1,188 @@
+import asyncio
+import os
+from bisect import bisect_left
+from collections import Counter
+from typing import Callable, Optional
+
+from GLOSSARY import METRICS_HOST, METRICS_PORT, METRICS_FILE, METRICS_DUMP_INTERVAL_SECONDS
+from bot_functions.helpers.log_setup import get_logger
+
+logger = get_logger("metrics")
+
+METRIC_PREFIX = "fwedbot"
+# Upper bounds in seconds, from a cached regex match up to a send parked behind a RetryAfter
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+#### ------- [ HISTOGRAM ] ------- ####
+class Histogram:
+    """
+    A fixed-bucket latency histogram in the Prometheus layout. observe() is a bisect and three
+    additions, so it is cheap enough to leave on every message.
+    """
+
+    __slots__ = ("name", "description", "buckets", "counts", "sum", "count")
+
+    def __init__(self, name: str, description: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is the +Inf bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates the q-quantile (0-1) by interpolating inside its bucket, as Prometheus'
+        histogram_quantile does. Values in the +Inf bucket are reported as the largest bound.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+#### ------- [ PIPELINE METRICS ] ------- ####
+EXTRACTION_SECONDS = Histogram("extraction_seconds", "Time to scan a message for CAs")
+ROUTING_SECONDS = Histogram("routing_lookup_seconds", "Time to look up the targets of a source")
+FORMATTING_SECONDS = Histogram("formatting_seconds", "Time to format a forward for one target")
+QUEUE_WAIT_SECONDS = Histogram("send_queue_wait_seconds",
+                               "Time from queueing a message to the attempt that delivered it")
+SEND_SECONDS = Histogram("send_message_seconds", "Duration of send_message calls")
+HISTOGRAMS = (EXTRACTION_SECONDS, ROUTING_SECONDS, FORMATTING_SECONDS, QUEUE_WAIT_SECONDS, SEND_SECONDS)
+
+# Counters owned by this module; the other stages register their own stats with register_counters()
+pipeline_stats = Counter()
+
+# prefix -> Counter, exported as fwedbot_<prefix>_<key>_total
+_counter_sources: dict[str, Counter] = {"pipeline": pipeline_stats}
+# name -> (description, callable returning the current value)
+_gauges: dict[str, tuple[str, Callable[[], float]]] = {}
+
+
+def register_counters(prefix: str, counters: Counter):
+    """Exports every key of a stats Counter as fwedbot_<prefix>_<key>_total."""
+    _counter_sources[prefix] = counters
+
+
+def register_gauge(name: str, description: str, read: Callable[[], float]):
+    """Exports a value read at scrape time as fwedbot_<name>."""
+    _gauges[name] = (description, read)
+
+
+def render_metrics() -> str:
+    """Renders every histogram, counter and gauge in the Prometheus text exposition format."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        name = f"{METRIC_PREFIX}_{histogram.name}"
+        lines.append(f"# HELP {name} {histogram.description}")
+        lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum {histogram.sum}")
+        lines.append(f"{name}_count {histogram.count}")
+
+    for prefix, counters in _counter_sources.items():
+        for key, value in sorted(counters.items()):
+            name = f"{METRIC_PREFIX}_{prefix}_{key}_total"
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+
+    for gauge_name, (description, read) in _gauges.items():
+        name = f"{METRIC_PREFIX}_{gauge_name}"
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {read()}")
+
+    return "\n".join(lines) + "\n"
+
+
+#### ------- [ METRICS EXPORT ] ------- ####
+_server: Optional[asyncio.AbstractServer] = None
+_dump_task: Optional[asyncio.Task] = None
+_metrics_file: Optional[str] = None
+
+
+async def start_metrics(port: Optional[int] = METRICS_PORT, path: Optional[str] = METRICS_FILE):
+    """
+    Starts the local /metrics endpoint if `port` is set, and the periodic file dump if `path` is
+    set. They default to METRICS_PORT and METRICS_FILE; worker processes pass their own.
+    """
+    global _server, _dump_task, _metrics_file
+    if port and _server is None:
+        _server = await asyncio.start_server(_serve_metrics, METRICS_HOST, port)
+        logger.info("[Metrics] Serving metrics on http://%s:%s/metrics", METRICS_HOST, port)
+    if path and _dump_task is None:
+        _metrics_file = path
+        _dump_task = asyncio.create_task(_dump_metrics_periodically(), name="metrics-dump")
+
+
+async def stop_metrics():
+    """Stops the endpoint and writes a final metrics file."""
+    global _server, _dump_task
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
+    if _dump_task is not None:
+        _dump_task.cancel()
+        await asyncio.gather(_dump_task, return_exceptions=True)
+        _dump_task = None
+        write_metrics_file(_metrics_file)
+
+
+def write_metrics_file(path: str):
+    """Writes the current metrics to a file, replacing it atomically (node_exporter textfile format)."""
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as metrics_file:
+        metrics_file.write(render_metrics())
+    os.replace(temporary_path, path)
+
+
+async def _dump_metrics_periodically():
+    while True:
+        await asyncio.sleep(METRICS_DUMP_INTERVAL_SECONDS)
+        try:
+            write_metrics_file(_metrics_file)
+        except OSError as write_error:
+            logger.error("[Metrics] Failed to write %s: %s", _metrics_file, write_error)
+
+
+async def _serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass  # Headers are not needed
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render_metrics().encode()
+        else:
+            status, body = "404 Not Found", b"Not Found\n"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
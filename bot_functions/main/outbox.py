@@ -0,0 +1,429 @@
+import asyncio
+import functools
+import json
+import sqlite3
+import time
+import uuid
+from collections import Counter
+from typing import Callable, Optional
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden
+from GLOSSARY import (OUTBOX_FLUSH_INTERVAL_SECONDS, OUTBOX_POLL_INTERVAL_SECONDS, OUTBOX_CLAIM_BATCH,
+                      OUTBOX_LEASE_SECONDS, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BACKOFF_SECONDS,
+                      OUTBOX_SENT_RETENTION_SECONDS, OUTBOX_DEAD_LETTER_RETENTION_SECONDS)
+from bot_functions.helpers.log_setup import get_logger
+from bot_functions.main.dedup import filter_new_addresses, forget_row_addresses, prune_recent_forwards
+from bot_functions.main.metrics import register_counters, register_gauge
+from bot_functions.main.send_scheduler import send_scheduler
+from database.db_manager import transaction, run_in_db_thread
+
+logger = get_logger("outbox")
+
+PRUNE_INTERVAL_SECONDS = 60 * 60  # How often sent and dead-lettered rows past their retention are deleted
+LEASE_RENEW_INTERVAL_SECONDS = OUTBOX_LEASE_SECONDS / 3  # Renewing well before the lease runs out
+
+SQL_INSERT_ROW = """
+    INSERT INTO outbox (idempotency_key, chat_id, topic_id, text, parse_mode, status, due_at, created_at, owner,
+                        kind, addresses, title)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(idempotency_key) DO NOTHING
+    RETURNING outbox_id;
+"""
+SQL_CLAIM_DUE = """
+    UPDATE outbox SET status = 'sending', due_at = ?, owner = ?
+    WHERE outbox_id IN (
+        SELECT outbox_id FROM outbox
+        WHERE status IN ('pending', 'sending') AND due_at <= ? AND kind = 'message'
+        ORDER BY due_at
+        LIMIT ?
+    )
+    RETURNING outbox_id, chat_id, topic_id, text, parse_mode, attempts;
+"""
+SQL_MARK_SENT = "UPDATE outbox SET status = 'sent', attempts = attempts + 1, last_error = NULL WHERE outbox_id = ?;"
+SQL_MARK_RETRY = """
+    UPDATE outbox SET status = 'pending', attempts = attempts + 1, due_at = ?, last_error = ? WHERE outbox_id = ?;
+"""
+SQL_MARK_DEAD = "UPDATE outbox SET status = 'dead', attempts = attempts + 1, last_error = ? WHERE outbox_id = ?;"
+SQL_RENEW_LEASES = "UPDATE outbox SET due_at = ? WHERE owner = ? AND status = 'sending';"
+SQL_RELEASE_LEASES = "UPDATE outbox SET status = 'pending', due_at = ?, owner = NULL WHERE status = 'sending';"
+SQL_PRUNE = """
+    DELETE FROM outbox
+    WHERE (status IN ('sent', 'merged') AND created_at < ?) OR (status = 'dead' AND created_at < ?);
+"""
+
+#### ------- [ OUTBOX ] ------- ####
+# Handlers only enqueue a forward. The writer inserts what was enqueued within
+# OUTBOX_FLUSH_INTERVAL_SECONDS in one transaction, already claimed by this process, and only then
+# hands the rows to the send scheduler; send results are written back with the next batch. The
+# drainer picks up rows that are due again: failed sends waiting out their backoff, and rows whose
+# process died before reporting back. Every row being sent is owned by one process, which renews
+# the leases of all its rows every third of OUTBOX_LEASE_SECONDS, however long its backlog is; only
+# a row whose owner stopped renewing (is gone) can be claimed by another process. Delivery is at
+# least once: a process that dies between Telegram accepting a message and the result being
+# written sends it again.
+#
+# Every row has an idempotency key (the source message and target for a forward), unique in the
+# table for OUTBOX_SENT_RETENTION_SECONDS, so the same forward is never queued twice, e.g. when a
+# source message is handled again after a restart. A row carrying CAs goes through the forward
+# de-duplication window (dedup) as it is written: CAs its chat already got within the window are
+# left out, and a row left with none is not written. A dead-lettered row's CAs leave the window.
+#
+# Rows of kind 'digest' are not messages but CAs waiting for their target's digest (digest). They
+# are never claimed themselves: a claim step merges them into digest messages once they are due.
+#
+# With worker processes, workers only write their rows (set_outbox_write_only) and the receiving
+# process sends every row, so all messages go through one send scheduler and its bot-wide and
+# per-chat rate limits hold for the bot as a whole. The receiving process claims new rows when a
+# worker reports handled updates (claim_soon), not only every OUTBOX_POLL_INTERVAL_SECONDS.
+# `on_dead` is only called in the process that enqueued the row, so it does not run for them.
+
+
+class OutboxRow:
+    """A row this process is sending."""
+
+    __slots__ = ("outbox_id", "chat_id", "topic_id", "text", "parse_mode", "attempts", "on_dead")
+
+    def __init__(self, outbox_id: int, chat_id: int, topic_id: Optional[int], text: str, parse_mode: Optional[str],
+                 attempts: int = 0, on_dead: Optional[Callable[[Exception], None]] = None):
+        self.outbox_id = outbox_id
+        self.chat_id = chat_id
+        self.topic_id = topic_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.attempts = attempts
+        self.on_dead = on_dead
+
+
+_bot: Optional[Bot] = None
+# Enqueued, not yet written:
+# (key, chat_id, topic_id, text, parse_mode, on_dead, kind, delay, addresses, title, render)
+_queued: list[tuple] = []
+_sent: list[tuple] = []  # Results not yet written, as statement parameters
+_retries: list[tuple] = []
+_dead: list[tuple] = []
+_in_flight: dict[int, OutboxRow] = {}  # outbox_id -> row handed to the send scheduler
+_flush_wanted: Optional[asyncio.Event] = None
+_flush_lock: Optional[asyncio.Lock] = None  # One flush at a time, so stopping waits for the writer's
+_claim_wanted: Optional[asyncio.Event] = None
+_on_written: list[Callable[[], None]] = []  # Called once the rows enqueued before them are written
+_claim_steps: list[Callable[[sqlite3.Cursor, float], int]] = []
+_write_only = False  # Rows are left for another process to claim and send
+_tasks: list[asyncio.Task] = []
+_last_prune = 0.0
+_last_renewal = 0.0
+_owner = uuid.uuid4().hex  # This process, as the owner of the rows it is sending
+
+outbox_stats = Counter()
+register_counters("outbox", outbox_stats)
+register_gauge("outbox_in_flight", "Outbox rows handed to the send scheduler and not yet reported back",
+               lambda: len(_in_flight))
+
+
+def enqueue(bot: Bot, idempotency_key: str, chat_id: int, text: str, topic_id: Optional[int] = None,
+            parse_mode: Optional[str] = None, on_dead: Optional[Callable[[Exception], None]] = None,
+            addresses: Optional[list] = None, render: Optional[Callable[[list], str]] = None):
+    """
+    Queues a message for the outbox. It is written with the next batch and sent once written;
+    a key that is already in the outbox is dropped. `on_dead` is called with the last error if this
+    process dead-letters the message. With `addresses`, the CAs in the message: those its chat got
+    within the de-duplication window are left out by writing `render(remaining_addresses)` instead.
+    """
+    _ensure_started(bot)
+    _queued.append((idempotency_key, chat_id, topic_id, text, parse_mode, on_dead, "message", 0, addresses, None,
+                    render))
+    outbox_stats["enqueued"] += 1
+    _flush_wanted.set()
+
+
+def enqueue_for_digest(bot: Bot, idempotency_key: str, chat_id: int, topic_id: Optional[int], title: str,
+                       addresses: list, delay_seconds: float):
+    """
+    Queues addresses for the digest of a chat (and topic), written with the next batch like a
+    message (and through the de-duplication window). They are merged into digest messages once
+    due, in `delay_seconds`.
+    """
+    _ensure_started(bot)
+    _queued.append((idempotency_key, chat_id, topic_id, "", None, None, "digest", delay_seconds, addresses, title,
+                    None))
+    outbox_stats["enqueued_for_digest"] += 1
+    _flush_wanted.set()
+
+
+def register_claim_step(step: Callable[[sqlite3.Cursor, float], int]):
+    """
+    Has the sending process call `step(cursor, now)` in every transaction that claims rows, before
+    claiming, e.g. to turn due digest entries into messages. It returns the number of rows it added.
+    """
+    _claim_steps.append(step)
+
+
+def when_written(callback: Callable[[], None]):
+    """
+    Calls `callback` once everything enqueued so far has been written to the outbox, e.g. to record
+    an update as handled only when its forwards can no longer be lost.
+    """
+    if not _queued and (_flush_lock is None or not _flush_lock.locked()):
+        callback()  # Nothing enqueued is waiting for, or in the middle of, being written
+        return
+    _on_written.append(callback)
+    _flush_wanted.set()
+
+
+def _ensure_started(bot: Bot):
+    global _bot, _flush_wanted, _flush_lock, _claim_wanted
+    if _tasks:
+        return
+    _bot = bot
+    _flush_wanted = asyncio.Event()
+    _flush_lock = asyncio.Lock()
+    _claim_wanted = asyncio.Event()
+    _tasks.append(asyncio.create_task(_write_periodically(), name="outbox-writer"))
+    if not _write_only:
+        _tasks.append(asyncio.create_task(_drain_periodically(), name="outbox-drainer"))
+
+
+async def start_outbox(bot: Bot):
+    """Starts sending rows left over from earlier runs, without waiting for the first enqueue."""
+    _ensure_started(bot)
+
+
+def set_outbox_write_only():
+    """
+    Makes this process only write its rows, for the process receiving updates to claim and send.
+    Call it in a worker process before anything is enqueued.
+    """
+    global _write_only
+    _write_only = True
+
+
+#### ------- [ WRITING ] ------- ####
+
+def _write_batch(queued: list[tuple], sent: list[tuple], retries: list[tuple], dead: list[tuple]) -> list[OutboxRow]:
+    """Runs on the DB thread: inserts the queued rows and records send results."""
+    now = time.time()
+    # Write-only, a row is due now for the sending process; otherwise this process claims it
+    claim = ("pending", now, None) if _write_only else ("sending", now + OUTBOX_LEASE_SECONDS, _owner)
+    inserted = []
+    with transaction() as cursor:
+        for (idempotency_key, chat_id, topic_id, text, parse_mode, on_dead, kind, delay, addresses, title,
+             render) in queued:
+            if addresses is not None:
+                new_addresses = filter_new_addresses(cursor, chat_id, topic_id, addresses, now)
+                if not new_addresses:
+                    continue  # All sent within the window, by this process or another
+                if len(new_addresses) < len(addresses):
+                    addresses = new_addresses
+                    if render is not None:
+                        text = render(addresses)
+            status, due_at, owner = claim if kind == "message" else ("pending", now + delay, None)
+            returned = cursor.execute(SQL_INSERT_ROW, (
+                idempotency_key, chat_id, topic_id, text, parse_mode, status, due_at, now, owner, kind,
+                json.dumps(addresses) if addresses is not None else None, title,
+            )).fetchall()
+            if not returned:
+                outbox_stats["duplicates_dropped"] += 1
+            elif kind == "message":
+                inserted.append(OutboxRow(returned[0][0], chat_id, topic_id, text, parse_mode, on_dead=on_dead))
+        cursor.executemany(SQL_MARK_SENT, sent)
+        cursor.executemany(SQL_MARK_RETRY, retries)
+        cursor.executemany(SQL_MARK_DEAD, dead)
+        for _, outbox_id in dead:
+            forget_row_addresses(cursor, outbox_id)  # A later call of its CAs is let through
+    return inserted
+
+
+async def flush_outbox():
+    """Writes what was enqueued and the send results since the last flush, then sends the new rows."""
+    global _queued, _sent, _retries, _dead, _on_written
+    if _flush_lock is None:
+        return  # Never started, so nothing was enqueued
+    async with _flush_lock:
+        batch = (_queued, _sent, _retries, _dead)
+        if not any(batch):
+            on_written, _on_written = _on_written, []
+            for callback in on_written:
+                callback()  # Their rows were in the batch written before this flush
+            return
+        on_written = _on_written
+        _queued, _sent, _retries, _dead, _on_written = [], [], [], [], []
+        try:
+            inserted = await run_in_db_thread(_write_batch, *batch)
+        except sqlite3.Error:
+            # Keep everything for the next flush
+            for pending, failed in zip((_queued, _sent, _retries, _dead, _on_written), (*batch, on_written)):
+                pending[:0] = failed
+            raise
+
+        for callback in on_written:
+            callback()
+        if _write_only:
+            outbox_stats["rows_handed_off"] += len(inserted)
+            return
+        for row in inserted:
+            _submit(row)
+
+
+async def _write_periodically():
+    while True:
+        await _flush_wanted.wait()
+        await asyncio.sleep(OUTBOX_FLUSH_INTERVAL_SECONDS)  # Let a burst's forwards share one transaction
+        _flush_wanted.clear()
+        try:
+            # Shielded: once taken off the lists, a batch is written and sent even if stop_outbox cancels this
+            await asyncio.shield(flush_outbox())
+        except Exception as write_error:
+            logger.error("[Outbox] Failed to write to the outbox, retrying: %s", write_error, exc_info=True)
+            _flush_wanted.set()
+
+
+#### ------- [ SENDING ] ------- ####
+
+def _submit(row: OutboxRow):
+    if row.outbox_id in _in_flight:
+        return  # Still being sent by this process; the claim only renewed its lease
+    _in_flight[row.outbox_id] = row
+    send_options = {"message_thread_id": row.topic_id} if row.topic_id else {}
+    if row.parse_mode:
+        send_options["parse_mode"] = row.parse_mode
+    send_scheduler.submit(_bot, chat_id=row.chat_id, text=row.text, on_sent=functools.partial(_on_sent, row),
+                          on_failure=functools.partial(_on_failure, row), **send_options)
+
+
+def _on_sent(row: OutboxRow):
+    del _in_flight[row.outbox_id]
+    _sent.append((row.outbox_id,))
+    outbox_stats["sent"] += 1
+    _flush_wanted.set()
+
+
+def _on_failure(row: OutboxRow, send_error: Exception):
+    del _in_flight[row.outbox_id]
+    _flush_wanted.set()
+    attempts = row.attempts + 1
+    if attempts < OUTBOX_MAX_ATTEMPTS and not isinstance(send_error, (BadRequest, Forbidden)):
+        retry_in = OUTBOX_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+        _retries.append((time.time() + retry_in, str(send_error), row.outbox_id))
+        outbox_stats["retried"] += 1
+        logger.warning("[Outbox] Sending message %s to chat %s failed (attempt %s), retrying in %ss: %s",
+                       row.outbox_id, row.chat_id, attempts, retry_in, send_error)
+        return
+
+    _dead.append((str(send_error), row.outbox_id))
+    outbox_stats["dead_lettered"] += 1
+    logger.error("[Outbox] Dead-lettered message %s to chat %s after %s attempt(s): %s",
+                 row.outbox_id, row.chat_id, attempts, send_error)
+    if row.on_dead is not None:
+        row.on_dead(send_error)
+
+
+#### ------- [ DRAINING ] ------- ####
+
+def _claim_due(limit: int) -> list[OutboxRow]:
+    """Runs on the DB thread: claims up to `limit` due rows for this process, after the claim steps."""
+    now = time.time()
+    with transaction() as cursor:
+        for step in _claim_steps:
+            outbox_stats["rows_added_by_claim_steps"] += step(cursor, now)
+        rows = cursor.execute(SQL_CLAIM_DUE, (now + OUTBOX_LEASE_SECONDS, _owner, now, limit)).fetchall()
+    return [OutboxRow(*row) for row in rows]
+
+
+def _renew_leases(now: float) -> int:
+    """Runs on the DB thread: extends the lease of every row this process is sending."""
+    with transaction() as cursor:
+        return cursor.execute(SQL_RENEW_LEASES, (now + OUTBOX_LEASE_SECONDS, _owner)).rowcount
+
+
+async def renew_leases():
+    """Keeps the rows this process is sending (or has queued to send) from being claimed by another process."""
+    global _last_renewal
+    now = time.time()
+    if now - _last_renewal < LEASE_RENEW_INTERVAL_SECONDS:
+        return
+    if _in_flight:
+        outbox_stats["leases_renewed"] += await run_in_db_thread(_renew_leases, now)
+    _last_renewal = now
+
+
+def _prune(now: float) -> int:
+    with transaction() as cursor:
+        cursor.execute(SQL_PRUNE, (now - OUTBOX_SENT_RETENTION_SECONDS, now - OUTBOX_DEAD_LETTER_RETENTION_SECONDS))
+        pruned = cursor.rowcount
+        prune_recent_forwards(cursor, now)
+        return pruned
+
+
+async def claim_due_rows() -> int:
+    """Sends rows that are due: retries whose backoff has passed and rows a dead process left behind."""
+    # With no room, only the claim steps run: the send scheduler catches up first
+    rows = await run_in_db_thread(_claim_due, max(OUTBOX_CLAIM_BATCH - len(_in_flight), 0))
+    for row in rows:
+        _submit(row)
+    outbox_stats["rows_claimed"] += len(rows)
+    return len(rows)
+
+
+def claim_soon():
+    """Has the drainer claim due rows now rather than at its next poll, e.g. once a worker has written some."""
+    if _claim_wanted is not None:
+        _claim_wanted.set()
+
+
+async def _drain_periodically():
+    global _last_prune
+    while True:
+        _claim_wanted.clear()
+        try:
+            await renew_leases()  # Also while the send scheduler is backed up and nothing is claimed
+            claimed = await claim_due_rows()
+            if claimed:
+                logger.debug("[Outbox] Picked up %s message(s) due for sending.", claimed)
+            now = time.time()
+            if now - _last_prune > PRUNE_INTERVAL_SECONDS:
+                _last_prune = now
+                outbox_stats["rows_pruned"] += await run_in_db_thread(_prune, now)
+        except Exception as drain_error:
+            logger.error("[Outbox] Failed to pick up due messages: %s", drain_error, exc_info=True)
+        # Not wait_for, which swallows a cancellation arriving as the event is set (before Python 3.12)
+        claim_wanted = asyncio.ensure_future(_claim_wanted.wait())
+        try:
+            await asyncio.wait((claim_wanted,), timeout=OUTBOX_POLL_INTERVAL_SECONDS)
+        finally:
+            claim_wanted.cancel()
+
+
+def release_outbox_leases() -> int:
+    """
+    Makes rows the previous run was still sending due now, instead of after their lease. Call it at
+    startup before any bot process sends, so no live process owns them.
+    """
+    with transaction() as cursor:
+        released = cursor.execute(SQL_RELEASE_LEASES, (time.time(),)).rowcount
+    if released:
+        logger.info("[Outbox] %s message(s) from the previous run will be sent again.", released)
+    return released
+
+
+async def drain_outbox():
+    """
+    Waits until everything enqueued has been written and sent, dead-lettered or scheduled for a
+    retry. The sending process also sends the rows that are due, e.g. what stopped workers wrote.
+    """
+    while True:
+        await flush_outbox()
+        if _in_flight:
+            await send_scheduler.drain()
+        elif any((_queued, _sent, _retries, _dead, _on_written)):
+            continue  # Something finished sending (or was handled) while the flush was being written
+        elif _write_only or _flush_lock is None or not await claim_due_rows():
+            return
+
+
+async def stop_outbox():
+    """Stops picking up rows in the background, then drains the outbox."""
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    await drain_outbox()
@@ -0,0 +1,52 @@
+import asyncio
+import warnings
+from typing import Callable
+
+from telegram import Bot
+from telegram.error import Conflict, NetworkError, RetryAfter, TimedOut
+from telegram.warnings import PTBUserWarning
+
+from bot_functions.helpers.log_setup import get_logger
+
+logger = get_logger("raw_updates")
+
+#### ------- [ RAW UPDATES ] ------- ####
+# Receives updates as the JSON payloads Telegram sends, without building Update objects. The
+# receiving process in front of worker processes only reads the chat off each payload, so the
+# (costly) parsing into Update objects is left to the worker that handles it. The webhook side
+# is in raw_webhook.
+POLLING_TIMEOUT_SECONDS = 10  # Long-polling timeout of each getUpdates call
+POLLING_MAX_BACKOFF_SECONDS = 30  # Longest wait between getUpdates retries after network errors
+
+# getUpdates is called through do_api_request to get the payloads unparsed; PTB suggests the typed method instead
+warnings.filterwarnings("ignore", message=r"Please use 'Bot\.getUpdates'", category=PTBUserWarning)
+
+
+async def poll_raw_updates(bot: Bot, handle_payload: Callable[[dict], None]):
+    """Long-polls getUpdates until cancelled and passes every update payload, in order, to `handle_payload`."""
+    await bot.delete_webhook()
+    offset = 0
+    backoff = 1.0
+    logger.info("[Raw Updates] Polling for updates...")
+    while True:
+        try:
+            payloads = await bot.do_api_request(
+                "getUpdates", api_kwargs={"offset": offset, "timeout": POLLING_TIMEOUT_SECONDS},
+                read_timeout=POLLING_TIMEOUT_SECONDS + 5,
+            )
+        except TimedOut:
+            continue
+        except RetryAfter as retry_after:
+            await asyncio.sleep(retry_after.retry_after)
+            continue
+        except (Conflict, NetworkError) as polling_error:
+            # Conflict: another instance is polling with the same token
+            logger.error("[Raw Updates] getUpdates failed (%s), retrying in %.0fs.", polling_error, backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, POLLING_MAX_BACKOFF_SECONDS)
+            continue
+
+        backoff = 1.0
+        for payload in payloads:
+            offset = payload["update_id"] + 1
+            handle_payload(payload)
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import secrets
+import ssl
+from typing import Callable, Optional
+
+from telegram import Bot
+from tornado.httpserver import HTTPServer
+from tornado.web import Application, RequestHandler, stream_request_body
+
+from GLOSSARY import (WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN,
+                      WEBHOOK_MAX_CONNECTIONS, WEBHOOK_CERT_FILE, WEBHOOK_KEY_FILE)
+from bot_functions.helpers.log_setup import get_logger
+
+logger = get_logger("raw_updates")
+
+#### ------- [ RAW WEBHOOK ] ------- ####
+# The webhook of the receiving process in front of worker processes (raw_updates has the polling
+# side). It is served with tornado like PTB's own webhook, but hands on the JSON payloads instead
+# of parsing them into Update objects. Needs python-telegram-bot[webhooks].
+WEBHOOK_MAX_BODY_BYTES = 1024 * 1024  # Larger requests are refused before their body is read (updates are a few KB)
+WEBHOOK_REQUEST_TIMEOUT_SECONDS = 10  # How long a started webhook request may take to arrive in full
+
+
+@stream_request_body
+class RawWebhookHandler(RequestHandler):
+    """
+    Accepts Telegram's webhook requests. The secret token and the size are checked as soon as
+    the headers are in, so a request that fails either is refused without reading its body.
+    """
+
+    SUPPORTED_METHODS = ("POST",)
+
+    def initialize(self, secret_token: str, handle_payload: Callable[[dict], None]):
+        self.secret_token = secret_token
+        self.handle_payload = handle_payload
+        self._body = bytearray()
+
+    def prepare(self):
+        if not secrets.compare_digest(self.request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""),
+                                      self.secret_token):
+            self.send_error(403)
+            return
+        content_length = self.request.headers.get("Content-Length", "0")
+        if not content_length.isdigit() or int(content_length) > WEBHOOK_MAX_BODY_BYTES:
+            self.send_error(413)
+
+    def data_received(self, chunk: bytes):
+        if self._finished:
+            return
+        # A chunked body has no Content-Length to check up front
+        self._body += chunk
+        if len(self._body) > WEBHOOK_MAX_BODY_BYTES:
+            self.send_error(413)
+
+    def post(self):
+        if self._finished:
+            return
+        try:
+            payload = json.loads(self._body)
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict) or "update_id" not in payload:
+            self.send_error(400)
+            return
+        self.handle_payload(payload)
+
+    def log_exception(self, *args):
+        pass  # Refused requests are not errors of the bot
+
+    def compute_etag(self) -> Optional[str]:
+        return None
+
+
+def _log_request(handler: RequestHandler):
+    # Like PTB's webhook: one line per request only at DEBUG
+    logger.debug("[Raw Updates] %s %s %s", handler.get_status(), handler.request.method, handler.request.uri)
+
+
+async def serve_raw_webhook(bot: Bot, handle_payload: Callable[[dict], None]):
+    """
+    Registers WEBHOOK_URL with Telegram and serves it until cancelled, passing every update payload
+    to `handle_payload`. Uses the same WEBHOOK_* settings as the Application's webhook mode.
+    Raises OSError if WEBHOOK_LISTEN:WEBHOOK_PORT cannot be bound.
+    """
+    secret_token = WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+    ssl_context = None
+    if WEBHOOK_CERT_FILE:
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(WEBHOOK_CERT_FILE, WEBHOOK_KEY_FILE)
+
+    web_app = Application([(rf"/{WEBHOOK_PATH.strip('/')}/?", RawWebhookHandler,
+                            {"secret_token": secret_token, "handle_payload": handle_payload})],
+                          log_function=_log_request)
+    server = HTTPServer(web_app, ssl_options=ssl_context, max_body_size=WEBHOOK_MAX_BODY_BYTES,
+                        body_timeout=WEBHOOK_REQUEST_TIMEOUT_SECONDS)
+    server.listen(WEBHOOK_PORT, address=WEBHOOK_LISTEN)
+    try:
+        if WEBHOOK_CERT_FILE:
+            with open(WEBHOOK_CERT_FILE, "rb") as certificate:
+                await bot.set_webhook(WEBHOOK_URL, certificate=certificate, max_connections=WEBHOOK_MAX_CONNECTIONS,
+                                      secret_token=secret_token)
+        else:
+            await bot.set_webhook(WEBHOOK_URL, max_connections=WEBHOOK_MAX_CONNECTIONS, secret_token=secret_token)
+        logger.info("[Raw Updates] Serving the webhook on %s:%s/%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+        await asyncio.Event().wait()  # Until cancelled
+    finally:
+        server.stop()
+        await server.close_all_connections()
@@ -0,0 +1,129 @@
+from typing import Optional
+
+from bot_functions.helpers.log_setup import get_logger
+from database.db_manager import execute_query, execute_query_async
+
+logger = get_logger("forwarding")
+
+#### ------- [ ROUTING QUERIES ] ------- ####
+SQL_GET_ROUTES = """
+    SELECT connection_id, source_group_id, source_topic_id, target_group_id, target_topic_id, connection_title,
+           digest_window_seconds
+    FROM user_connections
+    WHERE source_group_id IS NOT NULL AND target_group_id IS NOT NULL AND is_active = 1
+    ORDER BY connection_id;
+"""
+SQL_GET_ROUTE = """
+    SELECT connection_id, source_group_id, source_topic_id, target_group_id, target_topic_id, connection_title,
+           digest_window_seconds
+    FROM user_connections
+    WHERE connection_id = ? AND source_group_id IS NOT NULL AND target_group_id IS NOT NULL AND is_active = 1;
+"""
+
+#### ------- [ ROUTING TABLE ] ------- ####
+# (source_group_id, source_topic_id) ->
+#     {connection_id: (target_group_id, target_topic_id, connection_title, digest_window_seconds)}
+# A source_topic_id of None holds the group-wide connections for that group.
+_routes: dict[tuple[int, Optional[int]], dict[int, tuple]] = {}
+# connection_id -> (source_group_id, source_topic_id), so a single connection can be patched or dropped
+_route_keys: dict[int, tuple[int, Optional[int]]] = {}
+_loaded = False
+
+
+def load_routing_table():
+    """
+    Loads every complete, active connection from user_connections into memory.
+    Called once at startup; afterwards the table is patched by refresh_route / drop_route.
+    """
+    _replace_routes(execute_query(SQL_GET_ROUTES) or [])
+    logger.info("[Routing] Loaded %s connection(s) into the routing table.", len(_route_keys))
+
+
+def get_routes_for_source(source_group_id: int, source_topic_id: Optional[int] = None) -> list[tuple]:
+    """
+    Returns the (target_group_id, target_topic_id, connection_title, digest_window_seconds) routes
+    for a source group/topic.
+    Topic-specific connections come first, followed by the group-wide fallback.
+    """
+    if not _loaded:
+        load_routing_table()
+
+    routes = []
+    if source_topic_id is not None:
+        routes.extend(_routes.get((source_group_id, source_topic_id), {}).values())
+    routes.extend(_routes.get((source_group_id, None), {}).values())
+    return routes
+
+
+async def refresh_route(connection_id: int):
+    """
+    Re-reads a single connection after it has been written and patches the routing table.
+    Connections that are incomplete or inactive are removed from the table. The old route stays
+    in place while the row is read, so messages handled meanwhile are still forwarded, and it is
+    kept if the read fails.
+    """
+    if not _loaded:
+        return  # The full load at first lookup will pick the change up
+
+    rows = await execute_query_async(SQL_GET_ROUTE, (connection_id,))
+    if not isinstance(rows, list):
+        logger.error("[Routing] Could not re-read connection_id %s, keeping its current route.", connection_id)
+        return
+
+    # Swapped without an await in between, so no lookup sees the connection missing
+    drop_route(connection_id)
+    if rows:
+        _add_route(rows[0])
+        logger.info("[Routing] Refreshed route for connection_id %s.", connection_id)
+
+
+def reload_routing_table():
+    """
+    Reloads the whole table after a bulk change (e.g. an import), if it has been loaded.
+    Otherwise the full load at first lookup picks the changes up.
+    """
+    if _loaded:
+        load_routing_table()
+
+
+async def reload_routing_table_async():
+    """
+    Reloads the whole table, reading on the DB thread and swapping the routes in on the event
+    loop, so lookups never see a half-built table.
+    """
+    if not _loaded:
+        return
+    rows = await execute_query_async(SQL_GET_ROUTES)
+    if isinstance(rows, list):  # On a failed read keep serving the current table
+        _replace_routes(rows)
+
+
+def drop_route(connection_id: int):
+    """Removes a connection from the routing table, if present."""
+    key = _route_keys.pop(connection_id, None)
+    if key is None:
+        return
+
+    routes = _routes.get(key)
+    if routes is not None:
+        routes.pop(connection_id, None)
+        if not routes:
+            del _routes[key]
+
+
+def _replace_routes(rows: list[tuple]):
+    global _loaded
+    _routes.clear()
+    _route_keys.clear()
+    for row in rows:
+        _add_route(row)
+    _loaded = True
+
+
+def _add_route(row: tuple):
+    connection_id, source_group_id, source_topic_id, target_group_id, target_topic_id, connection_title, \
+        digest_window_seconds = row
+    key = (source_group_id, source_topic_id)
+    _routes.setdefault(key, {})[connection_id] = (target_group_id, target_topic_id, connection_title,
+                                                  digest_window_seconds or 0)
+    _route_keys[connection_id] = key
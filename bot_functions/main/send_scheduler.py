@@ -0,0 +1,256 @@
+import asyncio
+import itertools
+import time
+from collections import Counter
+from typing import Callable, Optional
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from GLOSSARY import (SEND_GLOBAL_RATE_PER_SECOND, SEND_PER_CHAT_RATE_PER_MINUTE, SEND_PER_CHAT_BURST,
+                      SEND_MAX_RETRIES, FORWARD_MAX_CONCURRENT_SENDS)
+from bot_functions.helpers.log_setup import get_logger
+from bot_functions.main.metrics import QUEUE_WAIT_SECONDS, SEND_SECONDS, register_counters, register_gauge
+
+logger = get_logger("send_scheduler")
+
+#### ------- [ PRIORITY LANES ] ------- ####
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+IDLE_BUCKET_SECONDS = 600  # Per-chat buckets untouched for this long are dropped
+RETRY_BACKOFF_SECONDS = 1.0  # Base delay for retrying transient network errors (doubles per attempt)
+
+
+#### ------- [ TOKEN BUCKET ] ------- ####
+class TokenBucket:
+    """
+    A token bucket refilled at `rate` tokens per second, holding at most `burst` tokens.
+
+    Tokens are booked ahead of time (the GCRA form of a token bucket): schedule() always
+    succeeds and returns how long the caller must wait for its token, so callers are served
+    in booking order and each waits exactly once.
+    """
+
+    __slots__ = ("interval", "tolerance", "theoretical_arrival", "blocked_until", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.interval = 1 / rate
+        self.tolerance = (burst - 1) * self.interval
+        self.theoretical_arrival = 0.0
+        self.blocked_until = 0.0
+        self.updated = time.monotonic()
+
+    def schedule(self, now: float) -> float:
+        """Books the next token and returns the seconds until it may be used."""
+        arrival = max(self.theoretical_arrival, now)
+        self.theoretical_arrival = arrival + self.interval
+        self.updated = now
+        return max(0.0, arrival - self.tolerance - now)
+
+    def block(self, until: float):
+        """Hands out no tokens before the given monotonic time, e.g. after a RetryAfter."""
+        self.blocked_until = max(self.blocked_until, until)
+        self.theoretical_arrival = max(self.theoretical_arrival, until + self.tolerance)
+
+    async def acquire(self):
+        wait = self.schedule(time.monotonic())
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+#### ------- [ OUTBOUND MESSAGE ] ------- ####
+class OutboundMessage:
+    """A send_message call waiting in the scheduler."""
+
+    __slots__ = ("bot", "chat_id", "text", "kwargs", "priority", "on_failure", "on_sent", "attempts", "enqueued_at",
+                 "has_chat_token")
+
+    def __init__(self, bot: Bot, chat_id: int, text: str, kwargs: dict, priority: int,
+                 on_failure: Optional[Callable[[Exception], None]], on_sent: Optional[Callable[[], None]] = None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.priority = priority
+        self.on_failure = on_failure
+        self.on_sent = on_sent
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+        self.has_chat_token = False
+
+
+#### ------- [ SEND SCHEDULER ] ------- ####
+class SendScheduler:
+    """
+    Queues outbound messages and sends them from a small worker pool while respecting
+    Telegram's global and per-chat rate limits.
+
+    Handlers call submit() and return immediately. A chat that is out of tokens (or told to
+    back off by a RetryAfter) has its message parked and re-queued once it may send again,
+    so one throttled chat never holds up a worker.
+    """
+
+    def __init__(self, workers: int = FORWARD_MAX_CONCURRENT_SENDS,
+                 global_rate: float = SEND_GLOBAL_RATE_PER_SECOND,
+                 per_chat_rate: float = SEND_PER_CHAT_RATE_PER_MINUTE / 60,
+                 per_chat_burst: float = SEND_PER_CHAT_BURST,
+                 max_retries: int = SEND_MAX_RETRIES):
+        self.workers = workers
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets: dict[int, TokenBucket] = {}
+        self.stats = Counter()
+
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._sequence = itertools.count()
+        self._pending = 0
+        self._idle: Optional[asyncio.Event] = None
+
+    def submit(self, bot: Bot, chat_id: int, text: str, priority: int = PRIORITY_NORMAL,
+               on_failure: Optional[Callable[[Exception], None]] = None,
+               on_sent: Optional[Callable[[], None]] = None, **kwargs):
+        """
+        Queues a send_message call. Extra keyword arguments are passed to send_message.
+        `on_failure` is called with the final error if the message is given up on, `on_sent`
+        once Telegram accepted it.
+        """
+        self._ensure_started()
+        self._pending += 1
+        self._idle.clear()
+        self.stats["submitted"] += 1
+        self._enqueue(OutboundMessage(bot, chat_id, text, kwargs, priority, on_failure, on_sent))
+
+    async def drain(self):
+        """Waits until every submitted message has been sent or given up on."""
+        if self._idle is not None:
+            await self._idle.wait()
+
+    async def stop(self):
+        """Drains the queue and stops the workers."""
+        await self.drain()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._queue = None
+        self._idle = None
+
+    def _ensure_started(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"send-worker-{index}")
+                       for index in range(self.workers)]
+        logger.info("[Send Scheduler] Started %s send worker(s).", self.workers)
+
+    def _enqueue(self, message: OutboundMessage):
+        self._queue.put_nowait((message.priority, next(self._sequence), message))
+
+    def _defer(self, message: OutboundMessage, delay: float):
+        asyncio.get_running_loop().call_later(delay, self._enqueue, message)
+
+    def _finish(self):
+        self._pending -= 1
+        if self._pending == 0:
+            self._idle.set()
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= 1024:
+                self._prune_idle_buckets(now)
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        return bucket
+
+    def _prune_idle_buckets(self, now: float):
+        for chat_id, bucket in list(self.chat_buckets.items()):
+            if now - bucket.updated > IDLE_BUCKET_SECONDS and now >= bucket.theoretical_arrival:
+                del self.chat_buckets[chat_id]
+
+    async def _worker(self):
+        while True:
+            _, _, message = await self._queue.get()
+            try:
+                await self._process(message)
+            except Exception as error:
+                # Never let one message take a worker down
+                self._fail(message, error)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, message: OutboundMessage):
+        now = time.monotonic()
+        chat_bucket = self._chat_bucket(message.chat_id, now)
+
+        # Per-chat limit: book a slot and park the message until then rather than blocking the worker.
+        # A message that already holds a slot is re-booked only if a RetryAfter arrived in the meantime.
+        if not message.has_chat_token or now < chat_bucket.blocked_until:
+            message.has_chat_token = True
+            wait = chat_bucket.schedule(now)
+            if wait > 0:
+                self.stats["deferred"] += 1
+                self._defer(message, wait)
+                return
+
+        # Global limit applies to every send, so the worker itself waits for it
+        await self.global_bucket.acquire()
+
+        message.attempts += 1
+        started = time.monotonic()
+        try:
+            await message.bot.send_message(chat_id=message.chat_id, text=message.text, **message.kwargs)
+        except RetryAfter as flood_error:
+            self.stats["rate_limited"] += 1
+            retry_after = float(flood_error.retry_after)
+            chat_bucket.block(time.monotonic() + retry_after)
+            logger.warning("[Send Scheduler] Chat %s is rate limited, retrying in %ss.", message.chat_id, retry_after)
+            message.attempts -= 1  # Flood control is honored, not counted as a failed attempt
+            message.has_chat_token = False
+            self._defer(message, retry_after)
+            return
+        except (BadRequest, Forbidden) as permanent_error:
+            self._fail(message, permanent_error)
+            return
+        except NetworkError as transient_error:
+            if message.attempts > self.max_retries:
+                self._fail(message, transient_error)
+                return
+            self.stats["retried"] += 1
+            message.has_chat_token = False
+            self._defer(message, RETRY_BACKOFF_SECONDS * 2 ** (message.attempts - 1))
+            return
+        finally:
+            SEND_SECONDS.observe(time.monotonic() - started)
+
+        QUEUE_WAIT_SECONDS.observe(started - message.enqueued_at)
+        self.stats["sent"] += 1
+        if message.on_sent is not None:
+            try:
+                message.on_sent()
+            except Exception as callback_error:
+                logger.error("[Send Scheduler] on_sent callback raised: %s", callback_error, exc_info=True)
+        self._finish()
+
+    def _fail(self, message: OutboundMessage, error: Exception):
+        self.stats["failed"] += 1
+        logger.error("[Send Scheduler] Giving up on message to chat %s after %s attempt(s): %s",
+                     message.chat_id, message.attempts, error)
+        if message.on_failure is not None:
+            try:
+                message.on_failure(error)
+            except Exception as callback_error:
+                logger.error("[Send Scheduler] on_failure callback raised: %s", callback_error, exc_info=True)
+        self._finish()
+
+
+# Shared scheduler used by the forwarding pipeline
+send_scheduler = SendScheduler()
+register_counters("send", send_scheduler.stats)
+register_gauge("send_pending_messages", "Messages queued or parked in the send scheduler",
+               lambda: send_scheduler._pending)
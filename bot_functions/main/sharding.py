@@ -0,0 +1,417 @@
+import asyncio
+import contextlib
+import functools
+import multiprocessing
+import queue
+import signal
+from collections import Counter
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from GLOSSARY import UPDATE_MAX_IN_FLIGHT, WORKER_SUPERVISE_INTERVAL_SECONDS, WORKER_STOP_TIMEOUT_SECONDS
+from bot_functions.helpers.log_setup import get_logger
+from bot_functions.main.handled_updates import update_received, payload_message_key
+from bot_functions.main.metrics import register_counters, register_gauge
+from bot_functions.main.outbox import claim_soon, when_written
+from bot_functions.main.update_processor import KeyedUpdateProcessor
+
+logger = get_logger("sharding")
+
+WORKER_POLL_SECONDS = 1.0  # How often an idle worker checks that the receiving process is still alive
+WORKER_REPORT_INTERVAL_SECONDS = 0.1  # How often a worker reports the updates it has handled
+
+#### ------- [ SHARDING ] ------- ####
+# One process receives the raw update payloads (polling or webhook) and hands every update with
+# a chat to the worker process owning that chat: chat_id % WORKER_PROCESSES. Each worker parses
+# and handles its updates with the regular handler stack behind its own KeyedUpdateProcessor, so
+# a chat's updates are handled by one process, in order. Workers share the database; the change
+# feed keeps their routing tables and user states in step with each other's writes. Workers
+# report the updates they have handled back, so the receiving process knows how far every update
+# has been handled (handled_updates).
+#
+# Workers do not send: they write their forwards to the outbox and the receiving process sends
+# them all, so Telegram's bot-wide and per-chat rate limits are kept in one place (outbox). The
+# de-duplication window (dedup) and the CAs waiting for a digest (digest) are in the database, so
+# a target fed from several shards still gets a CA once per window and one digest.
+
+
+def shard_key(payload: dict) -> Optional[int]:
+    """
+    The chat an update payload belongs to, read without parsing it into an Update: the chat of
+    the message (or of the message a button belongs to), else the user. A private chat has its
+    user's ID, so a user's commands, text and button presses always land on the same worker.
+    """
+    for body in payload.values():
+        if not isinstance(body, dict):
+            continue  # update_id
+        chat = body.get("chat") or (body.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = body.get("from") or body.get("user")
+        return user["id"] if user else None
+    return None
+
+
+#### ------- [ WORKER POOL ] ------- ####
+class WorkerPool:
+    """
+    Starts `worker_count` worker processes and feeds each one its shard of the update payloads
+    over a multiprocessing queue.
+
+    `target(index, worker_count, shard_queue, done_queue)` runs in each (spawned) worker. It
+    receives update payloads from the queue until a None payload asks it to finish and exit, and
+    puts lists of the update IDs it has handled on `done_queue` (WorkerShardProcessor).
+    `on_update_finished(update_id)` is called in the receiving process for every update a worker
+    or the receiving process itself has handled.
+
+    A crashed worker's updates are handled by the receiving process instead until the worker has
+    been respawned and the updates already handled there have finished, so a chat's updates never
+    run in two processes at once. The payloads the worker had not reported as handled when it
+    crashed are handed to `handle_locally` first, in the order they arrived (run_receiver sets it).
+    An update it handled in the last moments before crashing may thus be handled again; the
+    outbox's idempotency keys keep its forwards from being sent twice.
+    """
+
+    def __init__(self, worker_count: int, target: Callable[[int, int, Any, Any], None],
+                 on_update_finished: Optional[Callable[[int], None]] = None):
+        self.worker_count = worker_count
+        self.target = target
+        self.on_update_finished = on_update_finished
+        self.stats = Counter()
+        self._context = multiprocessing.get_context("spawn")
+        self._done_queue = self._context.Queue()
+        self.handle_locally: Optional[Callable[[dict], None]] = None
+        # update_id -> (shard, payload), for updates queued for a worker and not yet reported handled
+        self._worker_updates: dict[int, tuple[int, dict]] = {}
+        self._queues: list = [None] * worker_count
+        self._processes: list[Optional[multiprocessing.Process]] = [None] * worker_count
+        self._local_pending = [0] * worker_count  # Per shard: updates being handled by the receiving process
+        self._local_updates: dict[int, int] = {}  # update_id -> shard, for those updates
+        self._supervisor: Optional[asyncio.Task] = None
+        self._collected: Optional[asyncio.Future] = None  # Done once the None report from stop() is read
+        self._stopping = False
+
+    def start(self):
+        """Spawns the workers. Call it before the event loop starts."""
+        for index in range(self.worker_count):
+            self._spawn(index)
+        register_counters("worker_pool", self.stats)
+        register_gauge("worker_pool_live_workers", "Worker processes currently running", self.live_workers)
+        logger.info("[Worker Pool] Started %s worker process(es).", self.worker_count)
+
+    def live_workers(self) -> int:
+        return sum(1 for process in self._processes if process is not None and process.is_alive())
+
+    def submit(self, index: int, payload: dict) -> bool:
+        """
+        Queues an update payload for worker `index`. Returns False if the update must be handled by
+        the receiving process instead: the worker is down, or earlier updates of its shard still are.
+        """
+        process = self._processes[index]
+        worker_up = process is not None and process.is_alive()
+        if worker_up and not self._local_pending[index]:
+            self._queues[index].put(payload)
+            self._worker_updates[payload["update_id"]] = (index, payload)
+            self.stats["updates_sharded"] += 1
+            return True
+        if not worker_up and self._queues[index] is not None:
+            self._fail_over(index)  # Its unhandled updates go first
+        self._handle_locally_later(index, payload)
+        return False
+
+    def _handle_locally_later(self, index: int, payload: dict):
+        self._local_pending[index] += 1
+        self._local_updates[payload["update_id"]] = index
+        self.stats["updates_handled_locally"] += 1
+
+    def _fail_over(self, index: int):
+        """Hands the updates a dead worker has not reported as handled to the receiving process."""
+        logger.error("[Worker Pool] Worker %s exited with code %s. Its chats are handled by the receiving "
+                     "process until it has been respawned.", index, self._processes[index].exitcode)
+        # The payloads still in its queue are recovered from _worker_updates, not from the queue
+        self._queues[index].cancel_join_thread()
+        self._queues[index].close()
+        self._queues[index] = None
+        self._read_reports()  # What it reported before exiting was handled
+
+        unhandled = [payload for shard, payload in self._worker_updates.values() if shard == index]
+        for payload in unhandled:
+            del self._worker_updates[payload["update_id"]]
+            self._handle_locally_later(index, payload)
+            if self.handle_locally is not None:
+                self.handle_locally(payload)
+            else:
+                logger.error("[Worker Pool] Dropping update %s: nothing can handle it locally.", payload["update_id"])
+                self.local_update_finished(payload["update_id"])
+        self.stats["updates_recovered"] += len(unhandled)
+        if unhandled:
+            logger.warning("[Worker Pool] Handing %s update(s) worker %s had not handled to the receiving process.",
+                           len(unhandled), index)
+
+    def local_update_finished(self, update_id: int):
+        index = self._local_updates.pop(update_id, None)
+        if index is not None:
+            self._local_pending[index] -= 1
+        if self.on_update_finished is not None:
+            when_written(functools.partial(self.on_update_finished, update_id))  # Once its forwards are written
+
+    def _workers_finished(self, update_ids: list[int]):
+        for update_id in update_ids:
+            if self._worker_updates.pop(update_id, None) is not None and self.on_update_finished is not None:
+                self.on_update_finished(update_id)
+
+    def _collect_reports(self):
+        """Reads the reports as they arrive, on the event loop, until the None report from stop()."""
+        if self._collected is None:
+            loop = asyncio.get_running_loop()
+            self._collected = loop.create_future()
+            loop.add_reader(self._done_queue._reader.fileno(), self._read_reports)
+
+    def _read_reports(self):
+        """
+        Takes the reports waiting on the done queue. The event loop's thread is its only reader, so
+        this never waits on another reader's lock and sees every report already sent.
+        """
+        while True:
+            try:
+                update_ids = self._done_queue.get_nowait()
+            except queue.Empty:
+                return
+            if update_ids is None:
+                asyncio.get_running_loop().remove_reader(self._done_queue._reader.fileno())
+                self._collected.set_result(None)
+                return
+            self._workers_finished(update_ids)
+            claim_soon()  # Send what the workers wrote to the outbox for these updates
+
+    def _spawn(self, index: int):
+        shard_queue = self._context.Queue()
+        process = self._context.Process(target=self.target,
+                                        args=(index, self.worker_count, shard_queue, self._done_queue),
+                                        name=f"fwedbot-worker-{index}", daemon=True)
+        process.start()
+        self._queues[index] = shard_queue
+        self._processes[index] = process
+
+    async def start_supervisor(self):
+        """Starts respawning workers that have exited and taking the updates workers have handled."""
+        if self._supervisor is None:
+            self._supervisor = asyncio.create_task(self._supervise(), name="worker-supervisor")
+        self._collect_reports()
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(WORKER_SUPERVISE_INTERVAL_SECONDS)
+            for index, process in enumerate(self._processes):
+                if process.is_alive() or self._stopping:
+                    continue
+                if self._queues[index] is not None:
+                    self._fail_over(index)  # Unless submit() already noticed
+                try:
+                    self._spawn(index)
+                    self.stats["worker_restarts"] += 1
+                    logger.info("[Worker Pool] Respawned worker %s.", index)
+                except OSError as spawn_error:
+                    logger.error("[Worker Pool] Failed to respawn worker %s: %s", index, spawn_error)
+
+    async def stop(self):
+        """Lets every worker finish the updates queued for it, then stops it."""
+        self._stopping = True
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            await asyncio.gather(self._supervisor, return_exceptions=True)
+            self._supervisor = None
+        self._collect_reports()  # Workers cannot exit while their reports wait to be read
+
+        for index, process in enumerate(self._processes):
+            if process is not None and process.is_alive():
+                self._queues[index].put(None)
+        loop = asyncio.get_running_loop()
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            await loop.run_in_executor(None, process.join, WORKER_STOP_TIMEOUT_SECONDS)
+            if process.is_alive():
+                logger.warning("[Worker Pool] Worker %s did not finish in time, terminating it.", index)
+                process.terminate()
+        self._done_queue.put(None)
+        await self._collected
+        self._collected = None
+        logger.info("[Worker Pool] Stopped %s worker process(es).", self.worker_count)
+
+
+#### ------- [ RECEIVING PROCESS ] ------- ####
+class LocalShardProcessor(KeyedUpdateProcessor):
+    """
+    The update processor of the receiving process's own Application, which handles updates without
+    a chat and the shards of workers that are down. Tells the pool when such an update is done.
+    """
+
+    def __init__(self, pool: WorkerPool, max_concurrent_handlers: int, max_in_flight: int = UPDATE_MAX_IN_FLIGHT):
+        super().__init__(max_concurrent_handlers, max_in_flight)
+        self.pool = pool
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        try:
+            await super().do_process_update(update, coroutine)
+        finally:
+            if isinstance(update, Update):
+                self.pool.local_update_finished(update.update_id)
+
+
+def route_payload(pool: WorkerPool, app: Application, payload: dict):
+    """
+    Hands an update payload to the worker owning its chat, or to `app` when no worker can take it.
+    Updates the previous run already handled are dropped.
+    """
+    if not update_received(payload["update_id"], payload_message_key(payload)):
+        return
+    key = shard_key(payload)
+    if key is not None and pool.submit(key % pool.worker_count, payload):
+        return
+    handle_locally(pool, app, payload)
+
+
+def handle_locally(pool: WorkerPool, app: Application, payload: dict):
+    """Parses an update payload and puts it on `app`'s queue, to be handled in the receiving process."""
+    try:
+        update = Update.de_json(payload, app.bot)
+    except Exception as parse_error:
+        logger.error("[Sharding] Dropping update %s that could not be parsed: %s", payload.get("update_id"),
+                     parse_error)
+        pool.local_update_finished(payload.get("update_id"))
+        return
+    app.update_queue.put_nowait(update)
+
+
+async def run_receiver(app: Application, pool: WorkerPool,
+                       receive: Callable[[Any, Callable[[dict], None]], Awaitable[None]]):
+    """
+    Runs the receiving process until SIGINT/SIGTERM: `receive(bot, handle_payload)` fetches the raw
+    payloads (raw_updates.poll_raw_updates or raw_webhook.serve_raw_webhook) and every one is routed.
+    """
+    pool.handle_locally = functools.partial(handle_locally, pool, app)
+    main_task = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, main_task.cancel)
+    async with running(app):
+        try:
+            await receive(app.bot, lambda payload: route_payload(pool, app, payload))
+        except asyncio.CancelledError:
+            logger.info("[Sharding] Stopping...")
+
+
+#### ------- [ WORKER PROCESSES ] ------- ####
+class WorkerShardProcessor(KeyedUpdateProcessor):
+    """
+    The update processor of a worker's Application. Reports the updates it has handled to the
+    receiving process over `done_queue`, batched every WORKER_REPORT_INTERVAL_SECONDS, once the
+    forwards they enqueued are written to the outbox.
+    """
+
+    def __init__(self, done_queue, max_concurrent_handlers: int, max_in_flight: int = UPDATE_MAX_IN_FLIGHT):
+        super().__init__(max_concurrent_handlers, max_in_flight)
+        self.done_queue = done_queue
+        self._handled: list[int] = []
+        self._reporter: Optional[asyncio.Task] = None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        try:
+            await super().do_process_update(update, coroutine)
+        finally:
+            if isinstance(update, Update):
+                self.report_handled(update.update_id)
+
+    def report_handled(self, update_id: int):
+        when_written(lambda: self._handled.append(update_id))
+
+    def _report(self):
+        if self._handled:
+            self.done_queue.put(self._handled)
+            self._handled = []
+
+    async def _report_periodically(self):
+        while True:
+            await asyncio.sleep(WORKER_REPORT_INTERVAL_SECONDS)
+            self._report()
+
+    async def initialize(self) -> None:
+        await super().initialize()
+        self._reporter = asyncio.create_task(self._report_periodically(), name="worker-report")
+
+    async def shutdown(self) -> None:
+        if self._reporter is not None:
+            self._reporter.cancel()
+            await asyncio.gather(self._reporter, return_exceptions=True)
+            self._reporter = None
+        # Every update has been handled by now (Application.stop waits for them) and its forwards are
+        # written (post_shutdown stops the outbox)
+        self._report()
+
+
+@contextlib.asynccontextmanager
+async def running(app: Application):
+    """Runs an Application without run_polling/run_webhook, calling its post_init and post_shutdown the same way."""
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    try:
+        yield app
+    finally:
+        await app.stop()  # Handles every update already put on its queue
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+        await app.shutdown()
+
+
+async def receive_updates(shard_queue) -> AsyncIterator[list[dict]]:
+    """
+    Yields batches of update payloads from a worker's queue, in order, until the None payload or
+    until the receiving process is gone. Waiting happens on a thread so the event loop keeps running.
+    """
+    loop = asyncio.get_running_loop()
+    parent = multiprocessing.parent_process()
+    while True:
+        try:
+            payload = await loop.run_in_executor(None, shard_queue.get, True, WORKER_POLL_SECONDS)
+        except queue.Empty:
+            if parent is not None and not parent.is_alive():
+                logger.warning("[Worker] The receiving process is gone, stopping.")
+                return
+            continue
+
+        batch = []
+        while payload is not None:
+            batch.append(payload)
+            try:
+                payload = shard_queue.get_nowait()  # Take whatever else is queued without another thread hop
+            except queue.Empty:
+                break
+        if batch:
+            yield batch
+        if payload is None:
+            return
+
+
+async def serve_shard(app: Application, shard_queue):
+    """Runs a worker's Application (with a WorkerShardProcessor), feeding it the updates from the worker's queue."""
+    async with running(app):
+        async for batch in receive_updates(shard_queue):
+            for payload in batch:
+                try:
+                    update = Update.de_json(payload, app.bot)
+                except Exception as parse_error:
+                    logger.error("[Worker] Dropping update %s that could not be parsed: %s",
+                                 payload.get("update_id"), parse_error)
+                    app.update_processor.report_handled(payload.get("update_id"))
+                    continue
+                await app.update_queue.put(update)
+
+
+def run_shard_worker(app: Application, shard_queue):
+    """Blocks in a worker process until the receiving process tells it to stop."""
+    # Ctrl+C reaches the whole process group; workers keep going until their queue says stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve_shard(app, shard_queue))
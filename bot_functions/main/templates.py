@@ -0,0 +1,78 @@
+from functools import lru_cache
+from typing import Optional
+
+from GLOSSARY import REFERRAL_LINK_TEMPLATE, LINK_CACHE_SIZE, FORWARD_TEMPLATE_CACHE_SIZE
+
+#### ------- [ MARKDOWN ESCAPING ] ------- ####
+# Characters Telegram's legacy Markdown treats as entity markers outside an entity
+_MARKDOWN_ESCAPES = str.maketrans({"_": "\\_", "*": "\\*", "`": "\\`", "[": "\\["})
+
+
+def escape_markdown(text: str) -> str:
+    """Escapes user-supplied text (e.g. a connection title) so it is sent literally with parse_mode="Markdown"."""
+    return text.translate(_MARKDOWN_ESCAPES)
+
+
+#### ------- [ LINK RENDERING ] ------- ####
+# The referral URL around the address, split once instead of running str.format per link
+_LINK_PARTS = tuple(part.replace("{{", "{").replace("}}", "}") for part in REFERRAL_LINK_TEMPLATE.split("{address}"))
+
+
+@lru_cache(maxsize=LINK_CACHE_SIZE)
+def render_link(address: str) -> str:
+    """
+    Returns the Markdown link for a CA. Popular CAs are called into many groups at once, so the
+    rendered fragments are memoized. CAs are base58 and never need escaping.
+    """
+    return f"[{address}]({address.join(_LINK_PARTS)})"
+
+
+#### ------- [ FORWARD TEMPLATES ] ------- ####
+PUMPFUN_HEADER = "📩 **New PumpFun Alpha Found!**\n\n🚀 Trade Now:\n\n"
+REGULAR_HEADER = "📩 **New Alpha Found!**\n\n🚀 Trade Now:\n\n"
+
+
+class ForwardTemplate:
+    """
+    A connection's forward format with everything that does not depend on the CAs (the headers
+    and the escaped attribution line) built up front, so rendering is one pass over the
+    addresses and a single join.
+    """
+
+    __slots__ = ("attribution",)
+
+    def __init__(self, attribution: str = ""):
+        self.attribution = attribution
+
+    def render(self, addresses_with_types: list) -> str:
+        """
+        Formats detected addresses as clickable links. PumpFun addresses take precedence: when
+        there are any, only they are listed, under the PumpFun header.
+
+        Args:
+            addresses_with_types (list): Dictionaries of addresses and their types, as returned by the extractor.
+
+        Returns:
+            str: The message text.
+        """
+        pumpfun_links = []
+        regular_links = []
+        for address in addresses_with_types:
+            if address["type"] == "PumpFun":
+                pumpfun_links.append(render_link(address["address"]))
+            elif address["type"] == "Regular" and not pumpfun_links:
+                regular_links.append(render_link(address["address"]))
+
+        if pumpfun_links:
+            return "".join((PUMPFUN_HEADER, "\n".join(pumpfun_links), self.attribution))
+        return "".join((REGULAR_HEADER, "\n".join(regular_links), self.attribution))
+
+
+UNATTRIBUTED_TEMPLATE = ForwardTemplate()
+
+
+@lru_cache(maxsize=FORWARD_TEMPLATE_CACHE_SIZE)
+def compile_template(connection_title: Optional[str]) -> ForwardTemplate:
+    """Returns the compiled template for a connection, built the first time the connection forwards."""
+    title = escape_markdown(connection_title or "Unnamed Connection")
+    return ForwardTemplate(f"\n\n🔗 **Source Connection Name**: {title}")
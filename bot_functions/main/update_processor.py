@@ -0,0 +1,84 @@
+import asyncio
+from collections import Counter
+from typing import Any, Awaitable, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from GLOSSARY import UPDATE_MAX_IN_FLIGHT
+from bot_functions.main.metrics import register_counters, register_gauge
+
+
+#### ------- [ KEYED UPDATE PROCESSOR ] ------- ####
+class _KeyState:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0  # Updates holding or waiting for the lock; the state is dropped at 0
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates concurrently while keeping updates for the same chat in order.
+
+    Updates that share a key (the chat, or the user when there is no chat) run one after
+    another in arrival order, which the add_connection wizard relies on. Updates for different
+    keys run in parallel, up to `max_concurrent_handlers` at once.
+
+    An update only takes a handler slot once it is first in line for its key, so a burst in one
+    busy chat waits on that chat's lock instead of filling every slot and stalling the others.
+    PTB's own limit (`max_in_flight`) only bounds how many updates may be waiting in total.
+    """
+
+    def __init__(self, max_concurrent_handlers: int, max_in_flight: int = UPDATE_MAX_IN_FLIGHT):
+        super().__init__(max(max_in_flight, max_concurrent_handlers))
+        self.max_concurrent_handlers = max_concurrent_handlers
+        self._handler_slots = asyncio.Semaphore(max_concurrent_handlers)
+        self._keys: dict[Hashable, _KeyState] = {}
+        self.stats = Counter()
+
+    @staticmethod
+    def key_for(update: object) -> Optional[Hashable]:
+        """The ordering key of an update: its chat, else its user, else None (no ordering)."""
+        if isinstance(update, Update):
+            if update.effective_chat is not None:
+                return "chat", update.effective_chat.id
+            if update.effective_user is not None:
+                return "user", update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self.key_for(update)
+        if key is None:
+            async with self._handler_slots:
+                await coroutine
+            return
+
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = _KeyState()
+        if state.lock.locked():
+            self.stats["updates_queued_behind_chat"] += 1
+        state.users += 1
+        try:
+            async with state.lock:
+                async with self._handler_slots:
+                    await coroutine
+        finally:
+            state.users -= 1
+            if not state.users:
+                del self._keys[key]
+
+    @property
+    def active_keys(self) -> int:
+        """Chats/users with an update running or waiting."""
+        return len(self._keys)
+
+    async def initialize(self) -> None:
+        register_counters("update_processor", self.stats)
+        register_gauge("update_processor_active_chats", "Chats with an update running or waiting",
+                       lambda: self.active_keys)
+
+    async def shutdown(self) -> None:
+        pass
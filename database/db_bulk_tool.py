@@ -0,0 +1,277 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+from typing import Any, Iterable, NamedTuple, Optional
+
+from GLOSSARY import logger, BULK_MAX_REPORTED_ERRORS
+from bot_functions.main.routing import reload_routing_table
+from database.db_manager import get_connection, transaction
+from database.db_migrations import run_migrations
+
+#### ------- [ TABLE SPECS ] ------- ####
+REQUIRED = object()  # Default for columns every imported row must fill
+
+
+class BulkColumn(NamedTuple):
+    name: str
+    kind: type  # int, bool or str
+    default: Any = REQUIRED
+
+
+class BulkTable(NamedTuple):
+    name: str
+    columns: tuple[BulkColumn, ...]
+    key: tuple[str, ...]  # Conflict target: an imported row with an existing key updates that row
+    unique: tuple[str, ...] = ()  # Other columns that must be unique across the table
+
+    @property
+    def column_names(self) -> tuple[str, ...]:
+        return tuple(column.name for column in self.columns)
+
+    def upsert_query(self) -> str:
+        updates = ", ".join(f"{name} = excluded.{name}" for name in self.column_names if name not in self.key)
+        return (f"INSERT INTO {self.name} ({', '.join(self.column_names)}) "
+                f"VALUES ({', '.join('?' for _ in self.columns)}) "
+                f"ON CONFLICT({', '.join(self.key)}) DO UPDATE SET {updates};")
+
+    def export_query(self) -> str:
+        return f"SELECT {', '.join(self.column_names)} FROM {self.name} ORDER BY {', '.join(self.key)};"
+
+
+# In dependency order: groups, then their topics, then the connections between them
+BULK_TABLES = {
+    "user_groups": BulkTable("user_groups", (
+        BulkColumn("user_id", int),
+        BulkColumn("group_id", int),
+        BulkColumn("group_name", str),
+        BulkColumn("is_active", bool, 1),
+    ), key=("group_id",)),
+    "group_topics": BulkTable("group_topics", (
+        BulkColumn("group_id", int),
+        BulkColumn("topic_id", int),
+        BulkColumn("topic_name", str),
+    ), key=("group_id", "topic_id"), unique=("topic_name",)),
+    "user_connections": BulkTable("user_connections", (
+        BulkColumn("connection_id", int, None),  # Blank: a new connection with the next free ID
+        BulkColumn("user_id", int),
+        BulkColumn("connection_title", str, None),
+        BulkColumn("source_group_id", int),
+        BulkColumn("source_topic_id", int, None),
+        BulkColumn("target_group_id", int),
+        BulkColumn("target_topic_id", int, None),
+        BulkColumn("is_active", bool, 1),
+        BulkColumn("digest_window_seconds", int, 0),
+    ), key=("connection_id",)),
+}
+
+
+class BulkImportError(Exception):
+    """Raised when rows fail validation; nothing has been written."""
+
+    def __init__(self, errors: list[str]):
+        self.errors = errors
+        shown = "\n".join(errors[:BULK_MAX_REPORTED_ERRORS])
+        hidden = len(errors) - BULK_MAX_REPORTED_ERRORS
+        super().__init__(f"{len(errors)} invalid row(s):\n{shown}" + (f"\n... and {hidden} more" if hidden > 0 else ""))
+
+
+#### ------- [ VALIDATION ] ------- ####
+_TRUE_VALUES = {"1", "true", "yes"}
+_FALSE_VALUES = {"0", "false", "no"}
+
+
+def _parse_value(column: BulkColumn, value: Any) -> Any:
+    """Converts a CSV string or JSON value to the column's type. Raises ValueError if it can't."""
+    if isinstance(value, str):
+        value = value.strip()
+    if value is None or value == "":
+        if column.default is REQUIRED:
+            raise ValueError(f"{column.name} is required")
+        return column.default
+
+    if column.kind is bool:
+        if isinstance(value, bool) or value in (0, 1):
+            return int(value)
+        if isinstance(value, str) and value.lower() in _TRUE_VALUES | _FALSE_VALUES:
+            return int(value.lower() in _TRUE_VALUES)
+    elif column.kind is int:
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.lstrip("-").isdigit():
+            return int(value)
+    elif isinstance(value, str):
+        return value
+    raise ValueError(f"{column.name} must be {column.kind.__name__}, got {value!r}")
+
+
+def validate_rows(table: BulkTable, rows: Iterable[dict]) -> tuple[list[tuple], list[str]]:
+    """
+    Checks every row before anything is written and converts it to statement parameters.
+    Besides per-value checks, keys and unique columns must not repeat within the import.
+
+    Returns:
+        tuple: (parameter tuples in column order, error messages). Rows with errors are left out.
+    """
+    params = []
+    errors = []
+    known_columns = set(table.column_names)
+    key_indexes = [table.column_names.index(name) for name in table.key]
+    unique_indexes = [(name, table.column_names.index(name)) for name in table.unique]
+    seen_keys = {}
+    seen_unique = {name: {} for name in table.unique}
+
+    for row_number, row in enumerate(rows, start=1):
+        label = f"{table.name} row {row_number}"
+        if not isinstance(row, dict):
+            errors.append(f"{label}: expected an object with column names, got {type(row).__name__}")
+            continue
+        unknown = set(row) - known_columns
+        if unknown:
+            errors.append(f"{label}: unknown column(s) {', '.join(sorted(unknown))}")
+            continue
+
+        try:
+            values = tuple(_parse_value(column, row.get(column.name)) for column in table.columns)
+        except ValueError as value_error:
+            errors.append(f"{label}: {value_error}")
+            continue
+
+        key = tuple(values[index] for index in key_indexes)
+        if None not in key:
+            if key in seen_keys:
+                errors.append(f"{label}: duplicate {'/'.join(table.key)} {key} (also row {seen_keys[key]})")
+                continue
+            seen_keys[key] = row_number
+        duplicate = next((name for name, index in unique_indexes if values[index] in seen_unique[name]), None)
+        if duplicate:
+            errors.append(f"{label}: duplicate {duplicate} {values[table.column_names.index(duplicate)]!r}")
+            continue
+        for name, index in unique_indexes:
+            seen_unique[name][values[index]] = row_number
+
+        params.append(values)
+    return params, errors
+
+
+#### ------- [ IMPORT / EXPORT ] ------- ####
+
+def import_tables(tables: dict[str, list[dict]], dry_run: bool = False) -> dict[str, int]:
+    """
+    Validates every row of every table, then writes them all with executemany in a single
+    transaction: either the whole import lands or none of it does. Rows whose key already
+    exists update that row. The routing table is reloaded once at the end.
+    Blocking; run it on the DB thread when called from the bot.
+
+    Args:
+        tables (dict): Table name -> rows (dictionaries of column name -> value).
+        dry_run (bool): Only validate.
+
+    Returns:
+        dict: Table name -> number of rows imported (or that would be).
+
+    Raises:
+        BulkImportError: If any row is invalid.
+    """
+    unknown = set(tables) - set(BULK_TABLES)
+    if unknown:
+        raise BulkImportError([f"unknown table(s) {', '.join(sorted(unknown))}"])
+
+    batches = {}
+    errors = []
+    for name, table in BULK_TABLES.items():
+        if name in tables:
+            batches[name], table_errors = validate_rows(table, tables[name])
+            errors.extend(table_errors)
+    if errors:
+        raise BulkImportError(errors)
+    if dry_run:
+        return {name: len(params) for name, params in batches.items()}
+
+    with transaction() as cursor:
+        for name, params in batches.items():
+            cursor.executemany(BULK_TABLES[name].upsert_query(), params)
+
+    if batches.get("user_connections"):
+        reload_routing_table()
+    counts = {name: len(params) for name, params in batches.items()}
+    logger.info("[Bulk Import] Imported %s", ", ".join(f"{count} {name}" for name, count in counts.items()))
+    return counts
+
+
+def export_tables(names: Iterable[str] = BULK_TABLES) -> dict[str, list[dict]]:
+    """Returns every row of the given tables as dictionaries, in key order."""
+    conn = get_connection()
+    exported = {}
+    for name in names:
+        table = BULK_TABLES[name]
+        cursor = conn.execute(table.export_query())
+        exported[name] = [dict(zip(table.column_names, row)) for row in cursor]
+    return exported
+
+
+#### ------- [ FILES ] ------- ####
+# JSON files hold {"table": [rows]} (several tables) or a bare list of rows for --table.
+# CSV files hold one table, with the column names as the header row.
+
+def read_import_file(path: str, table: Optional[str] = None) -> dict[str, list[dict]]:
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as import_file:
+            data = json.load(import_file)
+        if isinstance(data, list):
+            if not table:
+                raise ValueError("A JSON list of rows needs --table")
+            return {table: data}
+        return {table: data.get(table, [])} if table else data
+
+    if not table:
+        raise ValueError("CSV imports need --table")
+    with open(path, newline="", encoding="utf-8") as import_file:
+        return {table: list(csv.DictReader(import_file))}
+
+
+def write_export_file(path: str, tables: dict[str, list[dict]]):
+    if path.endswith(".json"):
+        with open(path, "w", encoding="utf-8") as export_file:
+            json.dump(tables, export_file, ensure_ascii=False, indent=1)
+        return
+
+    if len(tables) != 1:
+        raise ValueError("CSV exports hold one table; pass --table")
+    (name, rows), = tables.items()
+    with open(path, "w", newline="", encoding="utf-8") as export_file:
+        writer = csv.DictWriter(export_file, fieldnames=BULK_TABLES[name].column_names)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import/export of connections, groups and topics.")
+    parser.add_argument("action", choices=("import", "export"))
+    parser.add_argument("path", help=".json or .csv file")
+    parser.add_argument("--table", choices=tuple(BULK_TABLES), help="the table a CSV file or JSON list holds")
+    parser.add_argument("--dry-run", action="store_true", help="validate an import without writing it")
+    args = parser.parse_args()
+
+    run_migrations()
+    if args.action == "export":
+        tables = export_tables([args.table] if args.table else BULK_TABLES)
+        write_export_file(args.path, tables)
+        print(f"Exported {', '.join(f'{len(rows)} {name}' for name, rows in tables.items())} to {args.path}")
+        return
+
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path} does not exist")
+    try:
+        counts = import_tables(read_import_file(args.path, args.table), dry_run=args.dry_run)
+    except (BulkImportError, ValueError, sqlite3.Error) as import_error:
+        raise SystemExit(f"Import failed, nothing was written. {import_error}")
+    verb = "Validated" if args.dry_run else "Imported"
+    print(f"{verb} {', '.join(f'{count} {name}' for name, count in counts.items())} from {args.path}")
+
+
+if __name__ == "__main__":
+    # python -m database.db_bulk_tool export connections.json
+    # python -m database.db_bulk_tool import connections.csv --table user_connections --dry-run
+    main()
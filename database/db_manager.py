@@ -1,44 +1,143 @@
+import asyncio
+import functools
 import sqlite3
-from typing import Sequence, Any
-from GLOSSARY import logger, DB_FILE
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Sequence, Any, Callable
+from GLOSSARY import (DB_FILE, DB_CACHE_SIZE_KB, DB_MMAP_SIZE_BYTES, DB_BUSY_TIMEOUT_MS,
+                      DB_STATEMENT_CACHE_SIZE)
+from bot_functions.helpers.log_setup import get_logger
+
+logger = get_logger("database")
+
+#### ------- [ CONNECTION POOL ] ------- ####
+# Each thread keeps one long-lived connection per database file instead of reconnecting per
+# statement. In practice that is the DB thread below plus the main thread during startup.
+_local = threading.local()
+_open_connections: list[sqlite3.Connection] = []
+_open_connections_lock = threading.Lock()
+
+DB_PRAGMAS = (
+    "PRAGMA journal_mode = WAL;",  # Readers no longer block on the writer
+    "PRAGMA synchronous = NORMAL;",  # Durable across crashes in WAL mode, without an fsync per commit
+    f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB};",
+    f"PRAGMA mmap_size = {DB_MMAP_SIZE_BYTES};",
+    "PRAGMA temp_store = MEMORY;",
+    f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS};",
+)
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Returns this thread's long-lived connection to DB_FILE, opening and tuning it on first use.
+    Connections run in autocommit mode; use transaction() to group statements.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(DB_FILE)
+    if conn is None:
+        # cached_statements keeps prepared statements around, so repeat queries skip parsing
+        # check_same_thread is off only so close_connections() can run from any thread
+        conn = sqlite3.connect(DB_FILE, isolation_level=None, cached_statements=DB_STATEMENT_CACHE_SIZE,
+                               check_same_thread=False)
+        for pragma in DB_PRAGMAS:
+            conn.execute(pragma)
+        connections[DB_FILE] = conn
+        with _open_connections_lock:
+            _open_connections.append(conn)
+    return conn
+
+def close_connections():
+    """Closes every pooled connection, e.g. on shutdown."""
+    with _open_connections_lock:
+        for conn in _open_connections:
+            conn.close()
+        _open_connections.clear()
+    _local.__dict__.pop("connections", None)
+
+@contextmanager
+def transaction():
+    """
+    Groups statements into a single transaction on this thread's connection, committed once
+    on success and rolled back on error. Nested use joins the outer transaction.
+
+    Usage:
+        with transaction() as cursor:
+            cursor.execute(...)
+            cursor.execute(...)
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn.cursor()
+        return
+
+    conn.execute("BEGIN IMMEDIATE;")
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
 
 #### ------- [ QUERY EXECUTION HELPERS ] ------- ####
 
 def log_and_handle_query_error(query: str, error: Exception):
-    logger.error(f"Query execution failed: '{query}' | Error: {error}")
+    logger.error("[DATABASE] Query execution failed: '%s' | Error: %s", query, error)
     return 0  # Always return 0 in case of errors for consistency.
 
 def execute_non_query(query: str = '', params: Sequence = ()):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
     try:
-        logger.info(f"[DATABASE] Executing non-query: {query} | Params: {params}")
-        cursor.execute(query, params)  # Run the provided query with params
-        conn.commit()
-        logger.info(f"[DATABASE] Data inserted / updated successfully.: {params}")
+        logger.debug("[DATABASE] Executing non-query: %s | Params: %s", query, params)
+        cursor = get_connection().execute(query, params)  # Autocommits unless inside transaction()
+        return cursor.rowcount  # Number of rows written
     except Exception as error:
         return log_and_handle_query_error(query, error)
-    finally:
-        conn.close()
 
 def execute_query(query: str, params: Sequence = (), fetch: bool = True):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
     try:
-        logger.info(f"[DATABASE] Executing query:\n"
-                    f"{query}\n"
-                    f"Params: {params}")
-
-        cursor.execute(query, params)
-
-        logger.info(f"[DATABASE] Query Executed Successfully")
+        logger.debug("[DATABASE] Executing query:\n%s\nParams: %s", query, params)
+        cursor = get_connection().execute(query, params)
 
         if fetch:
             return cursor.fetchall()  # Fetch results if requested
     except Exception as err:
         return log_and_handle_query_error(query, err)
-    finally:
-        conn.close()
     return []  # Return an empty list by default
+
+def execute_transaction(statements: Sequence[tuple[str, Sequence]]) -> bool:
+    """
+    Runs several (query, params) statements in one transaction. Returns False, with nothing
+    written, if any of them fails.
+    """
+    try:
+        with transaction() as cursor:
+            for query, params in statements:
+                cursor.execute(query, params)
+        return True
+    except Exception as error:
+        log_and_handle_query_error("; ".join(query for query, _ in statements), error)
+        return False
+
+#### ------- [ ASYNC QUERY HELPERS ] ------- ####
+# Handlers must never block the event loop on sqlite, so every query they issue runs on this
+# dedicated thread. A single thread also serializes writers, which sqlite wants anyway.
+_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fwedbot-db")
+
+async def run_in_db_thread(function: Callable, *args, **kwargs) -> Any:
+    """Runs a blocking database function on the database thread and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(function, *args, **kwargs))
+
+async def execute_non_query_async(query: str = '', params: Sequence = ()):
+    """Awaitable execute_non_query, run off the event loop."""
+    return await run_in_db_thread(execute_non_query, query, params)
+
+async def execute_query_async(query: str, params: Sequence = (), fetch: bool = True):
+    """Awaitable execute_query, run off the event loop."""
+    return await run_in_db_thread(execute_query, query, params, fetch)
+
+async def execute_transaction_async(statements: Sequence[tuple[str, Sequence]]) -> bool:
+    """Awaitable execute_transaction, run off the event loop."""
+    return await run_in_db_thread(execute_transaction, statements)
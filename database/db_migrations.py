@@ -0,0 +1,314 @@
+import sqlite3
+from typing import Callable
+
+from GLOSSARY import logger
+from database.db_manager import transaction, get_connection
+
+#### ------- [ SCHEMA MIGRATIONS ] ------- ####
+# Each migration runs once, in order, inside its own transaction, and records its version in
+# schema_version. Every statement is also safe to re-run, so databases created before
+# versioning existed (which already have some of these tables) migrate cleanly.
+
+def _create_base_tables(cursor: sqlite3.Cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_states (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            current_step TEXT
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_connections (
+            connection_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            connection_title TEXT,
+            source_group_id INTEGER,
+            source_topic_id INTEGER,   -- Source topic ID
+            target_group_id INTEGER,
+            target_topic_id INTEGER,   -- Target topic ID
+            is_active BOOLEAN DEFAULT 1,
+            FOREIGN KEY(user_id) REFERENCES user_states(user_id)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_groups (
+            user_id INTEGER NOT NULL,          -- The user who added the group
+            group_id INTEGER NOT NULL UNIQUE,  -- The Telegram Group ID
+            group_name TEXT NOT NULL,          -- The name of the group for display
+            is_active BOOLEAN DEFAULT 1,
+            FOREIGN KEY(user_id) REFERENCES user_states(user_id)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS group_topics (
+            group_id INTEGER NOT NULL,       -- Related group ID
+            topic_id INTEGER NOT NULL,       -- Unique topic ID in the group
+            topic_name TEXT NOT NULL UNIQUE, -- The name of the topic
+            CONSTRAINT unique_group_topic UNIQUE (group_id, topic_id) -- Each topic must be unique per group
+        );
+    """)
+
+
+def _add_digest_window(cursor: sqlite3.Cursor):
+    if "digest_window_seconds" not in _columns(cursor, "user_connections"):
+        # 0 = forward every message, otherwise batch per window
+        cursor.execute("ALTER TABLE user_connections ADD COLUMN digest_window_seconds INTEGER DEFAULT 0;")
+
+
+def _unique_user_states(cursor: sqlite3.Cursor):
+    # save_user used to insert blindly; keep the most recent row per user before enforcing uniqueness
+    cursor.execute("""
+        DELETE FROM user_states
+        WHERE rowid NOT IN (SELECT MAX(rowid) FROM user_states GROUP BY user_id);
+    """)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_user_states_user_id ON user_states (user_id);")
+
+
+def _hot_path_indexes(cursor: sqlite3.Cursor):
+    # Routing by source, covering the target columns so lookups never touch the table
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_connections_source
+        ON user_connections (source_group_id, source_topic_id, target_group_id, target_topic_id);
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_connections_user ON user_connections (user_id);")
+    # Wizard group and topic pickers, covering the displayed columns
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_groups_user ON user_groups (user_id, group_id, group_name);")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_group_topics_group
+        ON group_topics (group_id, topic_id, topic_name);
+    """)
+    # /set_topic_name updates by topic_id alone
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_group_topics_topic ON group_topics (topic_id);")
+
+
+def _drop_abandoned_drafts(cursor: sqlite3.Cursor):
+    # The add connection wizard used to insert a placeholder row at the title step; rows from
+    # wizards that were never finished can't route and only clutter the connection lists
+    cursor.execute("DELETE FROM user_connections WHERE source_group_id IS NULL OR target_group_id IS NULL;")
+
+
+# Tables whose writes are recorded in change_log, with the column that identifies a row
+CHANGE_LOGGED_TABLES = {"user_connections": "connection_id", "user_states": "user_id"}
+
+
+def _create_change_log(cursor: sqlite3.Cursor):
+    # Every write to a cached table appends a row here from a trigger, whichever process or
+    # connection made it, so other bot processes can apply just the changed rows
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER,
+            operation TEXT NOT NULL,
+            changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    for table, key in CHANGE_LOGGED_TABLES.items():
+        for operation, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS log_{table}_{operation.lower()} AFTER {operation} ON {table}
+                BEGIN
+                    INSERT INTO change_log (table_name, row_id, operation)
+                    VALUES ('{table}', {row}.{key}, '{operation.lower()}');
+                END;
+            """)
+
+
+def _create_outbox(cursor: sqlite3.Cursor):
+    # Every forward is written here before it is sent and marked once Telegram accepted it, so a
+    # restart or a failed burst resends what never arrived. due_at is when a pending row may be
+    # sent, or when the lease of the process sending it runs out (unix seconds).
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            outbox_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            chat_id INTEGER NOT NULL,
+            topic_id INTEGER,
+            text TEXT NOT NULL,
+            parse_mode TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            due_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL
+        );
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (due_at)
+        WHERE status IN ('pending', 'sending');
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_created ON outbox (created_at);")  # Pruning
+
+
+
+def _create_handled_updates(cursor: sqlite3.Cursor):
+    # The update every earlier update has been handled up to, and the messages handled (including
+    # those past it, handled while an earlier update was still running), so a restart neither
+    # handles an update twice nor refetches the ones already handled.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS update_offset (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_update_id INTEGER NOT NULL,
+            saved_at REAL NOT NULL
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS handled_messages (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            update_id INTEGER NOT NULL,
+            handled_at REAL NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        ) WITHOUT ROWID;
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_handled_messages_update ON handled_messages (update_id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_handled_messages_handled ON handled_messages (handled_at);")
+
+
+def _add_outbox_owner(cursor: sqlite3.Cursor):
+    # The process sending a row. It renews the leases of all its rows in one statement, so a row
+    # is only picked up by another process once its owner has stopped renewing, i.e. is gone.
+    if "owner" not in _columns(cursor, "outbox"):
+        cursor.execute("ALTER TABLE outbox ADD COLUMN owner TEXT;")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_owner ON outbox (owner) WHERE status = 'sending';")
+
+
+def _add_outbox_digest_entries(cursor: sqlite3.Cursor):
+    # A 'digest' row is a CA waiting for its target's digest rather than a message: addresses (JSON)
+    # and the connection's title, due when its connection's window ends. The sending process merges
+    # a target's entries into digest messages once one is due, and marks them 'merged'.
+    columns = _columns(cursor, "outbox")
+    if "kind" not in columns:
+        cursor.execute("ALTER TABLE outbox ADD COLUMN kind TEXT NOT NULL DEFAULT 'message';")
+    if "addresses" not in columns:
+        cursor.execute("ALTER TABLE outbox ADD COLUMN addresses TEXT;")
+    if "title" not in columns:
+        cursor.execute("ALTER TABLE outbox ADD COLUMN title TEXT;")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_digest ON outbox (chat_id, topic_id, due_at)
+        WHERE kind = 'digest' AND status = 'pending';
+    """)
+
+
+def _create_recent_forwards(cursor: sqlite3.Cursor):
+    # The de-duplication window, shared by every process writing to the outbox: when each CA was
+    # last forwarded to each target (target_topic_id 0 for none). Rows past the window are pruned.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS recent_forwards (
+            target_group_id INTEGER NOT NULL,
+            target_topic_id INTEGER NOT NULL,
+            address TEXT NOT NULL,
+            forwarded_at REAL NOT NULL,
+            PRIMARY KEY (target_group_id, target_topic_id, address)
+        ) WITHOUT ROWID;
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_recent_forwards_at ON recent_forwards (forwarded_at);")
+
+
+# (version, description, migration) - append only, never reorder or edit a released migration
+MIGRATIONS: list[tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "Create base tables", _create_base_tables),
+    (2, "Add user_connections.digest_window_seconds", _add_digest_window),
+    (3, "Make user_states unique per user", _unique_user_states),
+    (4, "Add indexes for the forwarding and wizard queries", _hot_path_indexes),
+    (5, "Drop connections left half-built by abandoned wizards", _drop_abandoned_drafts),
+    (6, "Record connection and user state writes in change_log", _create_change_log),
+    (7, "Create the outbox of forwards waiting to be sent", _create_outbox),
+    (8, "Record the handled update offset and messages", _create_handled_updates),
+    (9, "Record which process is sending each outbox row", _add_outbox_owner),
+    (10, "Keep CAs waiting for a digest in the outbox", _add_outbox_digest_entries),
+    (11, "Share the forward de-duplication window between processes", _create_recent_forwards),
+]
+
+
+def get_schema_version() -> int:
+    """Returns the version of the last migration applied to DB_FILE (0 for a new database)."""
+    conn = get_connection()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version;").fetchone()[0]
+
+
+def run_migrations() -> int:
+    """
+    Applies every pending migration in order and returns the resulting schema version.
+    A failing migration is rolled back and raised; later migrations are not attempted.
+    """
+    current_version = get_schema_version()
+    for version, description, migration in MIGRATIONS:
+        if version <= current_version:
+            continue
+
+        with transaction() as cursor:
+            migration(cursor)
+            cursor.execute("INSERT INTO schema_version (version, description) VALUES (?, ?);",
+                           (version, description))
+        current_version = version
+        logger.info("[Migrations] Applied migration %s: %s", version, description)
+
+    return current_version
+
+
+def _columns(cursor: sqlite3.Cursor, table: str) -> set:
+    return {row[1] for row in cursor.execute(f"PRAGMA table_info({table});")}
+
+
+#### ------- [ QUERY PLAN REPORT ] ------- ####
+# Queries on the forwarding and wizard paths, with representative parameters
+HOT_QUERIES = {
+    "route by connection": ("""
+        SELECT connection_id, source_group_id, source_topic_id, target_group_id, target_topic_id, connection_title,
+               digest_window_seconds
+        FROM user_connections
+        WHERE connection_id = ? AND source_group_id IS NOT NULL AND target_group_id IS NOT NULL AND is_active = 1;
+    """, (1,)),
+    "routes by source": ("""
+        SELECT target_group_id, target_topic_id
+        FROM user_connections
+        WHERE source_group_id = ? AND (source_topic_id = ? OR source_topic_id IS NULL);
+    """, (1, 1)),
+    "user exists": ("SELECT 1 FROM user_states WHERE user_id = ? LIMIT 1;", (1,)),
+    "advance step": ("UPDATE user_states SET current_step = ? WHERE user_id = ?;", ("start", 1)),
+    "user groups": ("SELECT group_id, group_name FROM user_groups WHERE user_id = ?;", (1,)),
+    "group topics": ("SELECT topic_id, topic_name FROM group_topics WHERE group_id = ?;", (1,)),
+    "rename topic": ("UPDATE group_topics SET topic_name = ? WHERE topic_id = ?;", ("name", 1)),
+    "update connection": ("UPDATE user_connections SET target_group_id = ? WHERE connection_id = ?;", (1, 1)),
+    "change feed": ("SELECT change_id, table_name, row_id FROM change_log WHERE change_id > ? ORDER BY change_id;",
+                    (1,)),
+    "outbox claim": ("SELECT outbox_id FROM outbox WHERE status IN ('pending', 'sending') AND due_at <= ? "
+                     "AND kind = 'message' ORDER BY due_at LIMIT ?;", (1.0, 100)),
+    "digest entries": ("SELECT outbox_id, addresses, title FROM outbox WHERE kind = 'digest' AND status = 'pending' "
+                       "AND chat_id = ? AND topic_id IS ? ORDER BY outbox_id;", (1, None)),
+    "outbox renewal": ("UPDATE outbox SET due_at = ? WHERE owner = ? AND status = 'sending';", (1.0, "owner")),
+}
+
+
+def report_query_plans() -> dict[str, list[str]]:
+    """
+    Runs EXPLAIN QUERY PLAN for every hot query and logs the plans, warning about any that
+    scan a whole table. Returns query name -> plan detail lines.
+    """
+    conn = get_connection()
+    plans = {}
+    for name, (query, params) in HOT_QUERIES.items():
+        details = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+        plans[name] = details
+
+        if any(detail.startswith("SCAN") for detail in details):
+            logger.warning("[Query Plan] %s does a full scan: %s", name, " | ".join(details))
+        else:
+            logger.info("[Query Plan] %s: %s", name, " | ".join(details))
+    return plans
+
+
+if __name__ == "__main__":
+    # python -m database.db_migrations: migrate DB_FILE and print the hot query plans
+    print(f"Schema version: {run_migrations()}\n")
+    for query_name, plan in report_query_plans().items():
+        status = "FULL SCAN" if any(detail.startswith("SCAN") for detail in plan) else "ok"
+        print(f"{query_name:<20}{status:<11}{' | '.join(plan)}")
@@ -1,7 +1,9 @@
 import sqlite3
-from GLOSSARY import DB_FILE, logger
+from GLOSSARY import logger
 from telegram import Update
 from telegram.ext import CallbackContext
+from bot_functions.main.routing import drop_route
+from database.db_manager import run_in_db_thread, transaction
 
 async def handle_remove_connection_command(update: Update, context: CallbackContext):
     """
@@ -18,7 +20,7 @@ async def handle_remove_connection_command(update: Update, context: CallbackCont
         connection_id = int(context.args[0])
 
         # Call the function to remove the connection
-        result = remove_connection_by_id(connection_id)  # Synchronous function
+        result = await remove_connection_by_id(connection_id)  # Runs the DELETE off the event loop
         await update.message.reply_text(result)  # Await here because it's async
 
     except ValueError:
@@ -27,19 +29,14 @@ async def handle_remove_connection_command(update: Update, context: CallbackCont
         await update.message.reply_text(f"An error occurred: {ex}")
 
 
-def remove_connection_by_id(connection_id: int) -> str:
+async def remove_connection_by_id(connection_id: int) -> str:
     try:
-        logger.info(f"Attempting to delete connection with ID {connection_id}")
-        sql_query = "DELETE FROM user_connections WHERE connection_id = ?"
-        conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-        cursor = conn.cursor()
-        cursor.execute(sql_query, (connection_id,))
-        affected_rows = cursor.rowcount
-        conn.commit()
-        conn.close()
+        logger.info("Attempting to delete connection with ID %s", connection_id)
+        affected_rows = await run_in_db_thread(delete_connection, connection_id)
 
-        logger.info(f"Affected rows: {affected_rows}")
+        logger.info("Affected rows: %s", affected_rows)
         if affected_rows > 0:
+            drop_route(connection_id)
             return f"Successfully deleted connection with connection_id {connection_id}."
         else:
             return f"No connection found with connection_id {connection_id}."
@@ -49,3 +46,11 @@ def remove_connection_by_id(connection_id: int) -> str:
     except Exception as ex:
         logger.error("Unexpected error during deletion: %s", ex, exc_info=True)
         return f"An unexpected error occurred: {ex}"
+
+
+def delete_connection(connection_id: int) -> int:
+    """Deletes a connection row and returns the number of rows removed. Blocking; run it on the DB thread."""
+    sql_query = "DELETE FROM user_connections WHERE connection_id = ?"
+    with transaction() as cursor:
+        cursor.execute(sql_query, (connection_id,))
+        return cursor.rowcount
@@ -0,0 +1,75 @@
+from collections import Counter, OrderedDict
+
+from GLOSSARY import USER_STATE_CACHE_SIZE
+from bot_functions.helpers.log_setup import get_logger
+from bot_functions.main.metrics import register_counters, register_gauge
+from database.db_manager import execute_query, execute_query_async
+from database.db_setup import SQL_CHECK_USER_EXISTS
+
+logger = get_logger("database")
+
+SQL_GET_USER_STATES = """
+    SELECT user_id
+    FROM user_states
+    ORDER BY rowid DESC
+    LIMIT ?;
+"""
+
+#### ------- [ USER STATE STORE ] ------- ####
+# user_id -> whether the user has a user_states row, least recently used first. A user is only
+# recorded after their row is committed, so the database stays the source of truth across
+# restarts. The add connection wizard keeps its step in its draft (connection_wizard), not here.
+_users: OrderedDict[int, bool] = OrderedDict()
+
+user_state_stats = Counter()
+register_counters("user_state", user_state_stats)
+register_gauge("user_state_cached_users", "Users held in memory", lambda: len(_users))
+
+
+def load_user_states():
+    """
+    Warms the cache with the most recently added user_states rows, up to USER_STATE_CACHE_SIZE.
+    Called once at startup, after the migrations have run.
+    """
+    rows = execute_query(SQL_GET_USER_STATES, (USER_STATE_CACHE_SIZE,)) or []
+    _users.clear()
+    for user_id, in reversed(rows):
+        _users[user_id] = True
+
+    logger.info("[User State] Loaded %s user(s) into memory.", len(_users))
+
+
+async def user_exists(user_id: int) -> bool:
+    """Whether the user has a row in user_states; reads user_states only on a cache miss."""
+    if user_id in _users:
+        _users.move_to_end(user_id)
+        user_state_stats["hits"] += 1
+        return _users[user_id]
+
+    user_state_stats["misses"] += 1
+    result = await execute_query_async(SQL_CHECK_USER_EXISTS, (user_id,))
+    if not isinstance(result, list):
+        return False  # The query failed; nothing is cached so the next call retries
+
+    # A write for this user may have landed while the read was in flight; it is newer
+    if user_id not in _users:
+        _remember(user_id, bool(result))
+    return _users[user_id]
+
+
+def remember_user(user_id: int):
+    """Records a user whose user_states row is already committed."""
+    _remember(user_id, True)
+
+
+def _remember(user_id: int, exists: bool):
+    _users[user_id] = exists
+    _users.move_to_end(user_id)
+    while len(_users) > USER_STATE_CACHE_SIZE:
+        _users.popitem(last=False)
+        user_state_stats["evictions"] += 1
+
+
+def forget_user(user_id: int):
+    """Drops a user from the cache so the next read goes back to user_states."""
+    _users.pop(user_id, None)